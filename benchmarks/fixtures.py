@@ -0,0 +1,335 @@
+"""
+Problem page corpus for the benchmarks, and a local stand-in for Codeforces that replays it.
+
+A corpus is a directory with a manifest.json and one saved page per problem.
+``build`` writes the synthetic corpus below, which covers the shapes that stress
+different stages: a short statement, a formula-heavy one, an image-heavy one,
+huge samples, an interactive problem and a gym problem (only reachable through
+the gym URL). ``record`` saves real pages from Codeforces in the same format,
+images included, so a benchmark can be replayed offline against them later.
+
+Usage:
+    python benchmarks/fixtures.py build DIR
+    python benchmarks/fixtures.py record DIR 1850 A-D [more targets...]
+    python benchmarks/fixtures.py serve DIR [--port PORT] [--latency-ms MS]
+"""
+import argparse
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import random
+import re
+import struct
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+import zlib
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+IMAGE_HOST = "https://espresso.codeforces.com/"
+PROBLEM_PATH = re.compile(r"^/(?:contest/(\d+)/problem|gym/(\d+)/problem|problemset/problem/(\d+))/([A-Za-z0-9]+)/?$")
+CONTEST_PATH = re.compile(r"^/(contest|gym)/(\d+)/?$")
+GENERATED_IMAGE = re.compile(r"^(\d+)x(\d+)-(\d+)\.png$")
+
+SYNTHETIC_CORPUS = [
+    # (kind, contest_id, problem, gym, rating)
+    ("short", 4, "A", False, 800),
+    ("formulas", 1850, "A", False, 1400),
+    ("images", 1850, "B", False, 1700),
+    ("huge-samples", 1850, "C", False, 2100),
+    ("interactive", 1850, "D", False, 2400),
+    ("gym", 100001, "A", True, 0),
+]
+
+
+@functools.lru_cache(maxsize=64)
+def png(width: int, height: int, seed: int) -> bytes:
+    """A deterministic RGB gradient of the given size, encoded as PNG with the standard library."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    row = bytearray(width * 3)
+    row[0::3] = bytes(x * 255 // max(width - 1, 1) for x in range(width))
+    row[2::3] = bytes([seed * 37 % 256]) * width
+    rows = bytearray()
+    for y in range(height):
+        row[1::3] = bytes([y * 255 // max(height - 1, 1)]) * width
+        rows += b"\0" + row
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(bytes(rows), 6)) + chunk(b"IEND", b"")
+
+
+def _formula(rng: random.Random) -> str:
+    return rng.choice([
+        r"1 \le n \le 2 \cdot 10^5",
+        r"a_i",
+        r"\sum_{i=1}^{n} a_i \le 10^{18}",
+        r"\frac{p}{q} \bmod 998\,244\,353",
+        r"\left\lfloor \frac{n}{2} \right\rfloor",
+        r"\sqrt{x_1^2 + y_1^2}",
+        r"\max\limits_{1 \le l \le r \le n} (a_l \oplus a_{l+1} \oplus \ldots \oplus a_r)",
+        r"\binom{n}{k} \cdot k!",
+        r"dp_{i,j} = \min(dp_{i-1,j}, dp_{i,j-1}) + c_{i,j}",
+    ])
+
+
+def _paragraph(rng: random.Random, formulas: int) -> str:
+    words = ("array", "integers", "query", "operation", "minimum", "segment", "tree", "value", "index",
+             "permutation", "graph", "vertex", "edge", "string", "answer", "print", "given", "each")
+    parts = []
+    for _ in range(formulas):
+        parts.append(" ".join(rng.choice(words) for _ in range(rng.randint(6, 14))))
+        parts.append(f"$$${_formula(rng)}$$$")
+    return "<p>" + " ".join(parts) + ".</p>"
+
+
+def _sample_pre(lines) -> str:
+    return "<pre>" + "".join(
+        f'<div class="test-example-line test-example-line-{"even" if i % 2 == 0 else "odd"}">{line}</div>'
+        for i, line in enumerate(lines)
+    ) + "</pre>"
+
+
+def synthetic_page(kind: str, contest_id: int, problem: str, rating: int) -> str:
+    """A problem page in the markup Codeforces serves, shaped to stress one part of the pipeline."""
+    rng = random.Random(f"{kind}{contest_id}{problem}")
+    legend = [_paragraph(rng, 3) for _ in range(3)]
+    input_spec = [_paragraph(rng, 2)]
+    output_spec = [_paragraph(rng, 1)]
+    samples = [(["3", "1 2 3"], ["6"]), (["1", "100"], ["100"])]
+    extra = ""
+    if kind == "formulas":
+        legend = [_paragraph(rng, 12) for _ in range(8)]
+        legend.append("<p>$$$$$$" + r"\sum_{i=1}^{n} \sum_{j=i}^{n} \frac{\gcd(a_i, a_j)}{\operatorname{lcm}(a_i, a_j)}" + "$$$$$$</p>")
+    elif kind == "images":
+        for n in range(12):
+            width, height = rng.choice([(320, 240), (640, 480), (800, 300), (1200, 900)])
+            legend.append(f'<center><img class="tex-graphics" src="{IMAGE_HOST}{width}x{height}-{n}.png" '
+                          f'style="max-width: 100.0%;max-height: 100.0%;" /></center>')
+            legend.append(_paragraph(rng, 1))
+    elif kind == "huge-samples":
+        n = 5000
+        samples = [([str(n), " ".join(str(rng.randint(1, 10 ** 9)) for _ in range(n))]
+                    + [f"{rng.randint(1, n)} {rng.randint(1, n)}" for _ in range(n)],
+                    [str(rng.randint(0, 10 ** 18)) for _ in range(n)])]
+    elif kind == "interactive":
+        extra = ('<div class="interaction-specification"><div class="section-title">Interaction</div>'
+                 + "".join(_paragraph(rng, 2) for _ in range(4))
+                 + "<p>After printing a query do not forget to output end of line and flush the output.</p></div>")
+        samples = [(["5", "", "2", "", "4"], ["", "? 1 3", "", "? 2 5", "", "! 3"])]
+
+    title = {"short": "Watermelon"}.get(kind, f"{kind.replace('-', ' ').title()} Problem")
+    sample_html = "".join(
+        f'<div class="sample-test"><div class="input"><div class="title">Input</div>{_sample_pre(sample_in)}</div>'
+        f'<div class="output"><div class="title">Output</div>{_sample_pre(sample_out)}</div></div>'
+        for sample_in, sample_out in samples
+    )
+    tags = "".join(f'<span class="tag-box">{tag}</span>' for tag in ("math", "greedy"))
+    difficulty = f'<span class="tag-box" title="Difficulty">*{rating}</span>' if rating else ""
+    return f"""<!DOCTYPE html>
+<html><head><title>Problem - {problem} - Codeforces</title></head><body>
+<div id="sidebar"><div class="roundbox sidebox">{difficulty}{tags}</div></div>
+<div id="pageContent"><div class="problemindexholder" problemindex="{problem}"><div class="ttypography"><div class="problem-statement">
+<div class="header"><div class="title">{problem}. {title}</div>
+<div class="time-limit"><div class="property-title">time limit per test</div>2 seconds</div>
+<div class="memory-limit"><div class="property-title">memory limit per test</div>256 megabytes</div>
+<div class="input-file"><div class="property-title">input</div>standard input</div>
+<div class="output-file"><div class="property-title">output</div>standard output</div></div>
+<div>{"".join(legend)}</div>
+<div class="input-specification"><div class="section-title">Input</div>{"".join(input_spec)}</div>
+<div class="output-specification"><div class="section-title">Output</div>{"".join(output_spec)}</div>
+{extra}
+<div class="sample-tests"><div class="section-title">Examples</div>{sample_html}</div>
+<div class="note"><div class="section-title">Note</div>{_paragraph(rng, 2)}</div>
+</div></div></div></div>
+<div class="alert alert-info">Problem statement has been updated.</div>
+</body></html>
+"""
+
+
+def build(directory: Path) -> Path:
+    """Write the synthetic corpus to directory; returns the manifest path."""
+    entries = []
+    for kind, contest_id, problem, gym, rating in SYNTHETIC_CORPUS:
+        page = directory / str(contest_id) / f"{problem}.html"
+        page.parent.mkdir(parents=True, exist_ok=True)
+        page.write_text(synthetic_page(kind, contest_id, problem, rating), encoding="utf-8")
+        entries.append({"name": f"{kind}:{contest_id}{problem}", "kind": kind, "contest_id": contest_id,
+                        "problem": problem, "gym": gym, "rating": rating, "tags": ["math", "greedy"],
+                        "file": str(page.relative_to(directory))})
+    manifest = directory / "manifest.json"
+    manifest.write_text(json.dumps(entries, indent=2), encoding="utf-8")
+    return manifest
+
+
+def record(directory: Path, tokens):
+    """Save real Codeforces pages (and their images) for the given targets into directory."""
+    import codeforces_to_pdf as cf
+
+    manifest = directory / "manifest.json"
+    entries = json.loads(manifest.read_text(encoding="utf-8")) if manifest.exists() else []
+    fetcher = cf.get_fetcher()
+    for contest_id, spec in cf.parse_targets(tokens):
+        for problem in cf.expand_problems(contest_id, spec):
+            for gym, url in ((False, f"https://codeforces.com/contest/{contest_id}/problem/{problem}"),
+                             (True, f"https://codeforces.com/gym/{contest_id}/problem/{problem}")):
+                resp = fetcher.get(url, headers=cf.BROWSER_HEADERS[0])
+                if resp.status_code == 200 and "problem-statement" in resp.text:
+                    break
+            else:
+                print(f"skipped {contest_id}{problem}: status {resp.status_code}")
+                continue
+            page = directory / str(contest_id) / f"{problem}.html"
+            page.parent.mkdir(parents=True, exist_ok=True)
+            page.write_text(resp.text, encoding="utf-8")
+            for image in sorted(set(re.findall(re.escape(IMAGE_HOST) + r"([\w./-]+)", resp.text))):
+                target = directory / "images" / image
+                if not target.exists():
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    target.write_bytes(fetcher.get(IMAGE_HOST + image).content)
+            parsed = cf.parse_problem_page(resp.text, contest_id, problem)
+            entries = [e for e in entries if (e["contest_id"], e["problem"]) != (contest_id, problem)]
+            entries.append({"name": f"recorded:{contest_id}{problem}", "kind": "recorded", "contest_id": contest_id,
+                            "problem": problem, "gym": gym, "rating": parsed.rating if parsed else 0,
+                            "tags": parsed.tags if parsed else [], "file": str(page.relative_to(directory))})
+            print(f"recorded {contest_id}{problem} from {url}")
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest.write_text(json.dumps(entries, indent=2), encoding="utf-8")
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Serves a corpus the way Codeforces would: problem pages under the contest,
+    problemset and gym URLs, contest pages, the API methods the tool uses and
+    the statement images. latency is added to every response, to model the
+    round trip to the real site.
+    """
+    daemon_threads = True
+
+    def __init__(self, directory: Path, port: int = 0, latency: float = 0.0):
+        super().__init__(("127.0.0.1", port), ReplayHandler)
+        self.directory = directory
+        self.latency = latency
+        self.entries = json.loads((directory / "manifest.json").read_text(encoding="utf-8"))
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "ReplayServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def find(self, contest_id: int, problem: str, gym: bool):
+        for entry in self.entries:
+            if entry["contest_id"] == contest_id and entry["problem"] == problem.upper() and entry["gym"] == gym:
+                return entry
+        return None
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real site
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "text/html; charset=utf-8"):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        match = PROBLEM_PATH.match(path)
+        if match:
+            contest, gym_contest, problemset_contest, problem = match.groups()
+            entry = self.server.find(int(contest or gym_contest or problemset_contest), problem, gym_contest is not None)
+            if entry is None:
+                return self._send(404, b"<html><body>No such problem</body></html>")
+            page = (self.server.directory / entry["file"]).read_text(encoding="utf-8")
+            page = page.replace(IMAGE_HOST, f"{self.server.base_url}/espresso/")
+            return self._send(200, page.encode("utf-8"))
+        match = CONTEST_PATH.match(path)
+        if match:
+            gym = match.group(1) == "gym"
+            problems = [e for e in self.server.entries if e["contest_id"] == int(match.group(2)) and e["gym"] == gym]
+            if not problems:
+                return self._send(404, b"<html><body>No such contest</body></html>")
+            links = "".join(f'<td class="id"><a href="/{match.group(1)}/{e["contest_id"]}/problem/{e["problem"]}">'
+                            f'{e["problem"]}</a></td>' for e in problems)
+            return self._send(200, f'<html><body><table class="problems"><tr>{links}</tr></table></body></html>'.encode())
+        if path.startswith("/espresso/"):
+            name = path[len("/espresso/"):]
+            saved = self.server.directory / "images" / name
+            if saved.is_file():
+                return self._send(200, saved.read_bytes(), "image/png")
+            generated = GENERATED_IMAGE.match(name)
+            if generated:
+                width, height, seed = map(int, generated.groups())
+                return self._send(200, png(width, height, seed), "image/png")
+            return self._send(404, b"")
+        if path == "/api/problemset.problems":
+            problems = [{"contestId": e["contest_id"], "index": e["problem"], "name": e["name"],
+                         "rating": e["rating"] or None, "tags": e["tags"]}
+                        for e in self.server.entries if not e["gym"]]
+            body = {"status": "OK", "result": {"problems": [{k: v for k, v in p.items() if v is not None}
+                                                            for p in problems], "problemStatistics": []}}
+            return self._send(200, json.dumps(body).encode(), "application/json")
+        if path == "/api/contest.standings":
+            contest_id = int(parse_qs(parts.query).get("contestId", ["0"])[0])
+            problems = [{"contestId": e["contest_id"], "index": e["problem"], "name": e["name"], "tags": e["tags"]}
+                        for e in self.server.entries if e["contest_id"] == contest_id]
+            if not problems:
+                body = {"status": "FAILED", "comment": f"contestId: Contest with id {contest_id} not found"}
+                return self._send(400, json.dumps(body).encode(), "application/json")
+            body = {"status": "OK", "result": {"contest": {"id": contest_id}, "problems": problems, "rows": []}}
+            return self._send(200, json.dumps(body).encode(), "application/json")
+        self._send(404, b"")
+
+
+def replay_client(base_url: str, timeout: float = 30.0):
+    """An httpx client that sends every codeforces.com request to the replay server instead."""
+    import httpx
+
+    local = httpx.URL(base_url)
+
+    class ReplayTransport(httpx.HTTPTransport):
+        def handle_request(self, request):
+            if request.url.host.endswith("codeforces.com"):
+                request.url = request.url.copy_with(scheme=local.scheme, host=local.host, port=local.port)
+            return super().handle_request(request)
+
+    return httpx.Client(transport=ReplayTransport(), follow_redirects=True, timeout=timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_command = commands.add_parser("build", help="Write the synthetic corpus")
+    build_command.add_argument("directory", type=Path)
+    record_command = commands.add_parser("record", help="Save real pages from Codeforces")
+    record_command.add_argument("directory", type=Path)
+    record_command.add_argument("targets", nargs="+", help="Targets in the codeforces_to_pdf syntax, e.g. 1850 A-D")
+    serve_command = commands.add_parser("serve", help="Replay a corpus on a local port")
+    serve_command.add_argument("directory", type=Path)
+    serve_command.add_argument("--port", type=int, default=8765)
+    serve_command.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"corpus written to {build(args.directory).parent}")
+    elif args.command == "record":
+        record(args.directory, args.targets)
+    else:
+        server = ReplayServer(args.directory, args.port, args.latency_ms / 1000)
+        print(f"replaying {len(server.entries)} problems at {server.base_url}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
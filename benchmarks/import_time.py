@@ -0,0 +1,90 @@
+"""
+Startup benchmark: how long importing codeforces_to_pdf takes, with a regression threshold.
+
+Each run is a fresh interpreter, timed with ``python -X importtime``. Importing the
+module must not load the heavy dependencies (WeasyPrint, BeautifulSoup, httpx, Jinja2, Pillow,
+the process pool); they are imported by the stage that uses them.
+
+The threshold is relative to the startup time of a bare interpreter
+(``python -c pass``), measured alternately with the import so both see the same
+machine load: a slow or busy CI runner slows both down alike. The script exits
+with status 1 when the median import time exceeds --max-ratio times the median
+startup time or a heavy module is imported eagerly, so it can gate CI.
+
+Usage:
+    python benchmarks/import_time.py [--repeat N] [--max-ratio R]
+"""
+import argparse
+import json
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPT = ROOT / "codeforces_to_pdf.py"
+# Modules that only the fetch, parse and render stages may import
+HEAVY_MODULES = ["weasyprint", "bs4", "httpx", "lxml", "jinja2", "PIL", "concurrent.futures.process"]
+
+
+def import_time_us() -> int:
+    """Cumulative import time of codeforces_to_pdf in microseconds, from a fresh interpreter."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import codeforces_to_pdf"],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    for line in proc.stderr.splitlines():
+        fields = [part.strip() for part in line.split("|")]
+        if len(fields) == 3 and fields[2] == "codeforces_to_pdf":
+            return int(fields[1])
+    raise RuntimeError("codeforces_to_pdf missing from the -X importtime output")
+
+
+def eager_heavy_modules() -> list:
+    code = ("import json, sys, codeforces_to_pdf; "
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout)
+
+
+def wall_time(argv: list) -> float:
+    started = time.perf_counter()
+    subprocess.run(argv, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=15, help="Fresh interpreters per measurement")
+    parser.add_argument("--max-ratio", type=float, default=2.0,
+                        help="Fail when the median import time exceeds this multiple of the median "
+                             "interpreter startup time (python -c pass)")
+    args = parser.parse_args()
+
+    imports, baseline, help_run = [], [], []
+    for _ in range(args.repeat):
+        baseline.append(wall_time([sys.executable, "-c", "pass"]) * 1000)
+        imports.append(import_time_us() / 1000)
+        help_run.append(wall_time([sys.executable, str(SCRIPT), "--help"]) * 1000)
+    median = statistics.median(imports)
+    startup = statistics.median(baseline)
+    print(f"import codeforces_to_pdf: median {median:7.2f} ms, min {min(imports):7.2f} ms, "
+          f"{median / startup:.2f}x interpreter startup")
+    print(f"codeforces_to_pdf.py --help: {statistics.median(help_run):7.2f} ms wall, "
+          f"{startup:.2f} ms of it interpreter startup")
+
+    failures = []
+    eager = eager_heavy_modules()
+    if eager:
+        failures.append(f"imported at module load: {', '.join(eager)}")
+    if median > args.max_ratio * startup:
+        failures.append(f"median import time {median:.2f} ms is over {args.max_ratio:g}x the "
+                        f"{startup:.2f} ms interpreter startup")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Microbenchmark: handle_simple_math_notation against the regex chain it replaced.
+
+The old implementation ran four re.sub passes over the whole statement HTML
+(touching tags and attributes too); the new one makes a single pass and only
+tokenizes the text between $$$ delimiters.
+
+Usage:
+    python benchmarks/math_notation.py [--paragraphs N] [--repeat N]
+"""
+import argparse
+from pathlib import Path
+import re
+import sys
+import timeit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from codeforces_to_pdf import handle_simple_math_notation, tex_to_html  # noqa: E402
+
+
+def legacy_handle_simple_math_notation(html: str) -> str:
+    """The previous implementation, kept here for comparison."""
+    html = re.sub(r'([a-zA-Z])_([a-zA-Z0-9])', r'\1<sub>\2</sub>', html)
+    html = re.sub(r'([a-zA-Z0-9])\^([a-zA-Z0-9])', r'\1<sup>\2</sup>', html)
+    html = re.sub(r'\\sqrt\{([^}]+)\}', r'<span class="math-notation">√\1</span>', html)
+    html = re.sub(
+        r'\\frac\{([^}]+)\}\{([^}]+)\}',
+        r'<div class="fraction"><span class="numerator">\1</span><span class="denominator">\2</span></div>',
+        html
+    )
+    return html
+
+
+PARAGRAPH = (
+    '<p>You are given an array $$$a_1, a_2, \\ldots, a_n$$$ of $$$n$$$ integers '
+    '($$$1 \\le n \\le 2 \\cdot 10^5$$$, $$$0 \\le a_i &lt; 2^{30}$$$). In one operation you may choose '
+    'an index $$$i$$$ and replace $$$a_i$$$ with $$$\\left\\lfloor \\frac{a_i}{2} \\right\\rfloor$$$. '
+    'Print the minimum value of $$$$$$\\sum_{i=1}^{n} \\frac{\\sqrt{a_i + 1}}{2^{k_i}}$$$$$$ '
+    'over all <a href="/contest/1850/problem/A" class="notice_link">sequences</a> of operations.</p>\n'
+)
+
+
+def long_statement(paragraphs: int) -> str:
+    """A statement about the size of a long interactive/constructive problem with notes."""
+    # Vary the indices so most formulas differ between paragraphs, as in a real statement
+    body = "".join(PARAGRAPH.replace("a_i", f"a_{{{i}}}") for i in range(paragraphs))
+    return '<div class="problem-statement">' + body + '</div>'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=200, help="Paragraphs in the synthetic statement")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per implementation")
+    args = parser.parse_args()
+
+    html = long_statement(args.paragraphs)
+    print(f"statement: {len(html) / 1024:.1f} KiB, {html.count('$$$') // 2} formula delimiters")
+
+    def cold():
+        # Every formula tokenized from scratch, as for a statement seen for the first time
+        tex_to_html.cache_clear()
+        handle_simple_math_notation(html)
+
+    results = {}
+    for name, func in (("regex chain", lambda: legacy_handle_simple_math_notation(html)),
+                       ("single pass, cold", cold),
+                       ("single pass", lambda: handle_simple_math_notation(html))):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        results[name] = best
+        print(f"{name:>17}: {best * 1000:8.2f} ms")
+    for name in ("single pass, cold", "single pass"):
+        print(f"regex chain / {name}: {results['regex chain'] / results[name]:.2f}x")
+    print("(the single pass also typesets symbols, nesting and roots that the regex chain leaves as raw TeX)")
+
+
+if __name__ == "__main__":
+    main()
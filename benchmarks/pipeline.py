@@ -0,0 +1,297 @@
+"""
+End-to-end benchmark of the conversion pipeline against a replayed problem corpus.
+
+Codeforces is replaced by a local server replaying saved pages (see
+fixtures.py), so runs are reproducible and need no network. Each scenario runs
+in a fresh interpreter with empty caches, which also makes its peak RSS
+meaningful:
+
+    extract_problem      fetch and parse each problem (latency, per-stage time)
+    build_pdf_from_html  lay out each statement fragment
+    end_to_end           convert_problem for each problem
+    throughput           convert_batch over the corpus at each --workers count
+    contest_zip          the web app's streaming whole-contest ZIP
+
+Results are written as JSON; --compare prints the change against an earlier run.
+
+Usage:
+    python benchmarks/pipeline.py [--fixtures DIR] [--repeat N] [--workers 1,2,4]
+                                  [--mode default|fast|graphics] [--theme NAME] [--max-pages N]
+                                  [--latency-ms MS]
+                                  [--output FILE] [--compare OLD.json]
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import fixtures  # noqa: E402
+
+SCENARIOS = ["extract_problem", "build_pdf_from_html", "end_to_end", "throughput", "contest_zip"]
+ZIP_CONTEST = 1850
+
+
+def summarize(samples) -> dict:
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))],
+        "min": ordered[0],
+        "max": ordered[-1],
+    }
+
+
+def peak_rss_mib() -> dict:
+    """Peak resident set size of this process and of its largest child (the render pool workers)."""
+    import resource
+
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB elsewhere
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor,
+    }
+
+
+# Scenario side: runs in a child process with its working directory in a fresh temporary directory
+
+def setup_child(base_url: str):
+    import codeforces_to_pdf as cf
+
+    # The replay server answers instantly, so the request pacing meant for the real site would dominate
+    fetcher = cf.Fetcher(limiter=cf.RateLimiter(cf.CACHE_PATH, rate=1e9, burst=10 ** 9))
+    fetcher.client.close()
+    fetcher.client = fixtures.replay_client(base_url)
+    cf._fetcher = fetcher
+    return cf
+
+
+def stage_summary(cf) -> dict:
+    return {name: {"count": stats["count"], "total": stats["total"]}
+            for name, stats in cf.get_metrics().export()["stages"].items()}
+
+
+def run_extract_problem(cf, entries, args) -> dict:
+    results = {}
+    for entry in entries:
+        samples = []
+        for _ in range(args.repeat):
+            cf.get_problem_store().clear()
+            started = time.perf_counter()
+            cf.extract_problem(entry["contest_id"], entry["problem"])
+            samples.append(time.perf_counter() - started)
+        results[entry["name"]] = summarize(samples)
+    return {"latency": results}
+
+
+def run_build_pdf_from_html(cf, entries, args, mode) -> dict:
+    import bs4
+
+    results = {}
+    for entry in entries:
+        page = (args.fixtures / entry["file"]).read_text(encoding="utf-8")
+        statement = str(bs4.BeautifulSoup(page, cf.HTML_PARSER).select_one(".problem-statement"))
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            layout = cf.build_pdf_from_html(statement, "out", f"{entry['contest_id']}{entry['problem']}.pdf", mode,
+                                            problem_rating=entry["rating"], theme=args.theme,
+                                            max_pages=args.max_pages)
+            samples.append(time.perf_counter() - started)
+        results[entry["name"]] = dict(summarize(samples), pages=layout.pages, bytes=layout.size)
+    return {"latency": results}
+
+
+def run_end_to_end(cf, entries, args, mode) -> dict:
+    results = {}
+    for entry in entries:
+        samples = []
+        for _ in range(args.repeat):
+            cf.get_problem_store().clear()
+            started = time.perf_counter()
+            result = cf.convert_problem(entry["contest_id"], entry["problem"], mode, "out", theme=args.theme,
+                                        max_pages=args.max_pages)
+            samples.append(time.perf_counter() - started)
+            if not result.ok:
+                raise RuntimeError(f"{entry['name']} was not converted")
+        results[entry["name"]] = summarize(samples)
+    return {"latency": results}
+
+
+def run_throughput(cf, entries, args, mode) -> dict:
+    problems = [(entry["contest_id"], entry["problem"]) for entry in entries] * args.repeat
+    cf.get_problem_store().clear()
+    started = time.perf_counter()
+    results = cf.convert_batch(problems, mode, "out", workers=args.workers, theme=args.theme,
+                               max_pages=args.max_pages)
+    elapsed = time.perf_counter() - started
+    cf.shutdown_render_pool()
+    converted = sum(result.ok for result in results)
+    return {"workers": args.workers, "problems": len(problems), "converted": converted,
+            "elapsed": elapsed, "problems_per_second": converted / elapsed,
+            "pages": sum(result.pages for result in results), "pdf_bytes": sum(result.size for result in results)}
+
+
+def run_contest_zip(cf, entries, args, mode) -> dict:
+    import main
+
+    main.RENDER_WORKERS = args.workers
+    job = main.Job(id="benchmark", contest_id=ZIP_CONTEST, problem="", mode=mode, all_problems=True,
+                   booklet=False, lane="contest", theme=args.theme, max_pages=args.max_pages)
+    started = time.perf_counter()
+    worker = threading.Thread(target=main.run_job, args=(job,))
+    worker.start()
+    first_byte = None
+    size = 0
+    for chunk in main.stream_contest_zip(job):
+        if chunk and first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+    worker.join()
+    cf.shutdown_render_pool()
+    if job.status != "done":
+        raise RuntimeError(f"contest ZIP job ended {job.status}: {job.message}")
+    return {"workers": args.workers, "problems": len(job.results), "zip_bytes": size,
+            "time_to_first_byte": first_byte, "elapsed": time.perf_counter() - started}
+
+
+def run_child(args):
+    cf = setup_child(args.base_url)
+    mode = cf.Mode[args.mode.upper()]
+    entries = json.loads((args.fixtures / "manifest.json").read_text(encoding="utf-8"))
+    cf.get_metrics().reset()
+    if args.child == "extract_problem":
+        result = run_extract_problem(cf, entries, args)
+    elif args.child == "build_pdf_from_html":
+        result = run_build_pdf_from_html(cf, entries, args, mode)
+    elif args.child == "end_to_end":
+        result = run_end_to_end(cf, entries, args, mode)
+    elif args.child == "throughput":
+        result = run_throughput(cf, entries, args, mode)
+    else:
+        result = run_contest_zip(cf, entries, args, mode)
+    result["stages"] = stage_summary(cf)
+    result["http"] = cf._fetcher.stats.as_dict()
+    result["peak_rss_mib"] = peak_rss_mib()
+    print(json.dumps(result))
+
+
+# Driver side
+
+def run_scenario(name: str, args, base_url: str, workers: int) -> dict:
+    command = [sys.executable, str(Path(__file__).resolve()), "--child", name, "--base-url", base_url,
+               "--fixtures", str(args.fixtures), "--repeat", str(args.repeat), "--mode", args.mode,
+               "--theme", args.theme, "--max-pages", str(args.max_pages), "--workers", str(workers)]
+    with tempfile.TemporaryDirectory(prefix="cf2pdf-bench-") as work:
+        proc = subprocess.run(command, cwd=work, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def headline(name: str, result: dict) -> dict:
+    """The numbers compared across runs: lower is better except for throughput."""
+    if not result or "error" in result:
+        return {}
+    numbers = {"peak_rss_mib": max(result["peak_rss_mib"].values())}
+    if "latency" in result:
+        numbers["median_s"] = sum(r["median"] for r in result["latency"].values())
+        if all("pages" in r for r in result["latency"].values()):
+            numbers["pages"] = sum(r["pages"] for r in result["latency"].values())
+            numbers["pdf_kib"] = sum(r["bytes"] for r in result["latency"].values()) / 1024
+    elif name.startswith("throughput"):
+        numbers["problems_per_second"] = result["problems_per_second"]
+    else:
+        numbers["elapsed_s"] = result["elapsed"]
+        numbers["time_to_first_byte_s"] = result["time_to_first_byte"]
+    return numbers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixtures", type=Path, help="Corpus directory (default: the synthetic corpus, built on the fly)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per problem; corpus copies for throughput")
+    parser.add_argument("--workers", default="1,2,4", help="Render worker counts for throughput and contest_zip")
+    parser.add_argument("--mode", choices=["default", "fast", "graphics"], default="default")
+    parser.add_argument("--theme", default="classic", help="PDF theme to lay out with")
+    parser.add_argument("--max-pages", type=int, default=0, help="Page-count target per problem")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay the replay server adds to every response")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of the scenarios")
+    parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    parser.add_argument("--compare", type=Path, metavar="OLD.json", help="Print the change against an earlier result file")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.workers = int(args.workers)
+        return run_child(args)
+
+    with tempfile.TemporaryDirectory(prefix="cf2pdf-corpus-") as corpus:
+        if args.fixtures is None:
+            args.fixtures = Path(corpus)
+            fixtures.build(args.fixtures)
+        args.fixtures = args.fixtures.resolve()
+        server = fixtures.ReplayServer(args.fixtures, latency=args.latency_ms / 1000).start()
+        worker_counts = [int(w) for w in args.workers.split(",")]
+        scenarios = {}
+        for name in args.scenarios.split(","):
+            for workers in (worker_counts if name in ("throughput", "contest_zip") else [1]):
+                key = f"{name}@{workers}" if name in ("throughput", "contest_zip") else name
+                print(f"running {key}...", file=sys.stderr)
+                scenarios[key] = run_scenario(name, args, server.base_url, workers)
+        server.shutdown()
+        # Read while a synthetic corpus still exists
+        manifest = json.loads((args.fixtures / "manifest.json").read_text(encoding="utf-8"))
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {"repeat": args.repeat, "mode": args.mode, "theme": args.theme, "max_pages": args.max_pages,
+                   "latency_ms": args.latency_ms, "corpus": manifest},
+        "scenarios": scenarios,
+    }
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    previous = json.loads(args.compare.read_text(encoding="utf-8"))["scenarios"] if args.compare else {}
+    for key, result in scenarios.items():
+        if "error" in result:
+            print(f"{key:<24} FAILED: {result['error']}")
+            continue
+        for metric, value in headline(key, result).items():
+            line = f"{key:<24} {metric:<22} {value:10.4f}"
+            old = headline(key, previous.get(key, {})).get(metric)
+            if old:
+                line += f"   was {old:10.4f} ({(value - old) / old:+.1%})"
+            print(line)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,125 @@
 import argparse
-from dataclasses import dataclass
+import base64
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import contextvars
+from dataclasses import asdict, dataclass, field, replace
+import copy
+import functools
 from enum import Enum
-from html import unescape
+import hashlib
+from html import escape, unescape
+import importlib.util
+import io
+import json
 import logging
 import os
 from pathlib import Path
+import random
 import re
+import shutil
+import signal
+import socket
+import socketserver
 import subprocess
 import sys
 import tempfile
-from typing import Optional, Tuple, List, Dict
-
-import bs4
-import httpx
-from weasyprint import HTML, CSS
-
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Deque, Iterator, Optional, Tuple, List, Dict
+from urllib.parse import urljoin, urlsplit
+
+if TYPE_CHECKING:
+    # The heavy dependencies are imported by the stage that needs them: --help,
+    # --prune-cache and runs handed to the render daemon load none of them,
+    # --load never loads httpx and a cached PDF never loads WeasyPrint
+    from concurrent.futures import Future, ProcessPoolExecutor
+
+    import bs4
+    import httpx
+    import jinja2
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+try:
+    import fcntl
+except ImportError:  # Windows: the rate limiter only coordinates threads of one process
+    fcntl = None
+
+BASE_DIR = Path(__file__).resolve().parent
+STYLES_DIR = BASE_DIR / "styles"
+# Jinja2 templates of the PDF documents; a theme may override any of them in a subdirectory named after it
+PDF_TEMPLATES_DIR = BASE_DIR / "templates" / "pdf"
+# Stylesheets applied to every problem PDF, in cascade order
+PDF_STYLESHEETS = ["font_cuprum.css", "problem-pdf.css"]
+# Extra stylesheets for the single-document contest booklet
+BOOKLET_STYLESHEETS = ["booklet.css"]
+DEFAULT_THEME = "classic"
+# Applied one after another, on top of the theme, while a PDF is over its page-count target (--max-pages)
+PAGE_FIT_STEPS = (
+    "body { font-size: 11px; line-height: 1.3 } pre, .sample-test pre { font-size: 10px; line-height: 1.2 }",
+    "@page { margin: 9mm 10mm 11mm } body { font-size: 10.5px; line-height: 1.25 }"
+    " pre, .sample-test pre { font-size: 9.5px; line-height: 1.15 } .section-title { margin-top: 6px }",
+    "@page { margin: 7mm 8mm 9mm } body { font-size: 10px; line-height: 1.2 }"
+    " pre, .sample-test pre { font-size: 9px; line-height: 1.1 } .section-title { font-size: 12px; margin-top: 4px }",
+)
 CACHE_PATH = ".cache"
+CACHE_TTL = 7 * 24 * 60 * 60  # seconds before a cached page is revalidated
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+PDF_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+FORMULA_CACHE_MAX_BYTES = 128 * 1024 * 1024
+CACHE_PRUNE_INTERVAL = 0.05  # fraction of a cache's max_bytes written between two prunes
+FORMULA_MEMO_ENTRIES = 4096  # rendered formulas kept in memory in front of the disk cache
+FORMULA_RENDERER_VERSION = 2  # bump when the LaTeX template changes to invalidate cached formulas
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+IMAGE_FORMAT_VERSION = 1  # bump when shrink_image changes to invalidate cached images
+IMAGE_DPI = 200  # print resolution statement images are downscaled to
+IMAGE_MAX_WIDTH_INCHES = 7.0  # widest an image can be printed: the text width of an A4 page
+IMAGE_JPEG_QUALITY = 85
+IMAGE_FETCH_WORKERS = 6  # statement images downloaded concurrently, within HTTP_MAX_CONNECTIONS_PER_HOST
+IMAGE_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif", "image/webp": ".webp",
+                    "image/svg+xml": ".svg", "image/bmp": ".bmp"}
+LATEX_TIMEOUT = 120  # seconds for the latex run of all formulas of a problem
+LATEX_FORMULA_TIMEOUT = 10  # seconds for a formula typeset on its own after the batch run failed
+PROBLEM_STORE_TTL = 5 * 60  # seconds a parsed problem is reused within one process
+PROBLEM_STORE_MAX_ENTRIES = 256
+API_URL = "https://codeforces.com/api"
+API_TIMEOUT = 60  # the problemset listing is several megabytes
+METADATA_API = True  # use the official API for problem lists, ratings and tags
+METADATA_TTL = 24 * 60 * 60  # seconds before the problemset snapshot is downloaded again
+METADATA_FORMAT_VERSION = 1
+# BeautifulSoup tree builder; lxml is several times faster on full Codeforces pages
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") is not None else "html.parser"
+HTTP_TIMEOUT = 10
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_CONNECTIONS_PER_HOST = 6
+RATE_LIMIT_PER_SECOND = 2.0  # sustained requests per host, shared by all processes
+RATE_LIMIT_BURST = 4
+HTTP_RETRIES = 3
+RETRY_STATUSES = (403, 429, 503)  # how Codeforces says "slow down"
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0  # longer Retry-After values open the circuit instead of sleeping
+CIRCUIT_THRESHOLD = 5  # consecutive throttled responses before failing fast
+CIRCUIT_COOLDOWN = 120.0
+PROBLEM_FORMAT_VERSION = 1
+DAEMON_SOCKET = "render.sock"  # inside the cache directory unless --socket is given
+DAEMON_PROTOCOL_VERSION = 1
+DAEMON_CONNECT_TIMEOUT = 1.0
+# Upper bounds in seconds of the stage duration histogram buckets
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_PREFIX = "cf2pdf"
+METRIC_HELP = {
+    "stage_seconds": "Time spent in each stage of the conversion pipeline",
+    "cache": "Cache lookups by cache and result",
+    "http_responses": "Responses received from Codeforces by status code",
+    "http_bytes": "Bytes of response bodies received from Codeforces",
+    "http_retries": "Requests retried after a throttled response",
+    "http_circuit_opened": "Times requests to a host were paused after repeated throttling",
+    "pdf_pages": "Pages of the PDFs laid out, by theme",
+    "pdf_bytes": "Bytes of the PDFs laid out, by theme",
+    "page_fit_retries": "Extra layouts made to bring a PDF within its page-count target",
+    "image_bytes_saved": "Bytes removed from statement images by downscaling and recompression",
+}
 TEMP_FILES = []
 
 
@@ -32,11 +136,31 @@ class Formatter(logging.Formatter):
         return super().format(record)
 
 
+# The daemon job a log record belongs to, or None outside the daemon. Pool threads
+# started on behalf of a job run in a copy of its context (see _in_context).
+_log_job: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("log_job", default=None)
+
+
+class _JobFilter(logging.Filter):
+    """Tags every record with the job that logged it, in the thread that logged it."""
+
+    def filter(self, record):
+        record.job = _log_job.get()
+        return True
+
+
 logger = logging.getLogger(__name__)
 handler = logging.StreamHandler()
 handler.setFormatter(Formatter())
 logger.setLevel(logging.INFO)
 logger.addHandler(handler)
+logger.addFilter(_JobFilter())
+
+
+def _in_context(fn: Callable) -> Callable:
+    """Wrap fn to run in a copy of the caller's context, so pool threads log as part of the caller's job."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
 
 
 def error(message):
@@ -61,19 +185,1038 @@ def debug(message):
     logger.debug(message)
 
 
+@dataclass
+class StageStats:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    buckets: List[int] = field(default_factory=lambda: [0] * len(STAGE_BUCKETS))  # cumulative, as in Prometheus
+
+
+class Metrics:
+    """
+    Process-wide instrumentation of the conversion pipeline.
+
+    Stages (fetch, parse, math, html, write_pdf and the time spent waiting on
+    the rate limiter) record their durations in histograms; events such as
+    cache lookups, HTTP status codes and bytes received are labelled counters.
+    export() returns a JSON-serializable snapshot, used for --profile and to
+    collect timings from render worker processes; prometheus() renders the
+    text exposition format served at /metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, StageStats] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            stats = self._stages.setdefault(stage, StageStats())
+            stats.count += 1
+            stats.total += seconds
+            stats.max = max(stats.max, seconds)
+            for i, bound in enumerate(STAGE_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the body of a with block as one run of the named stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def count(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def export(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {name: asdict(stats) for name, stats in self._stages.items()},
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(self._counters.items())],
+            }
+
+    def merge(self, exported: dict):
+        """Add a snapshot taken with export(), e.g. in a render worker process."""
+        with self._lock:
+            for name, other in exported["stages"].items():
+                stats = self._stages.setdefault(name, StageStats())
+                stats.count += other["count"]
+                stats.total += other["total"]
+                stats.max = max(stats.max, other["max"])
+                stats.buckets = [a + b for a, b in zip(stats.buckets, other["buckets"])]
+            for counter in exported["counters"]:
+                key = (counter["name"], tuple(sorted(counter["labels"].items())))
+                self._counters[key] = self._counters.get(key, 0) + counter["value"]
+
+    def prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        def labels(pairs) -> str:
+            return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}" if pairs else ""
+
+        snapshot = self.export()
+        name = f"{METRICS_PREFIX}_stage_seconds"
+        lines = [f"# HELP {name} {METRIC_HELP['stage_seconds']}", f"# TYPE {name} histogram"]
+        for stage, stats in sorted(snapshot["stages"].items()):
+            for bound, count in zip(STAGE_BUCKETS, stats["buckets"]):
+                lines.append(f"{name}_bucket{labels([('stage', stage), ('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{labels([('stage', stage), ('le', '+Inf')])} {stats['count']}")
+            lines.append(f"{name}_sum{labels([('stage', stage)])} {stats['total']:.6f}")
+            lines.append(f"{name}_count{labels([('stage', stage)])} {stats['count']}")
+        described = set()
+        for counter in snapshot["counters"]:
+            name = f"{METRICS_PREFIX}_{counter['name']}_total"
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {METRIC_HELP.get(counter['name'], counter['name'])}")
+                lines.append(f"# TYPE {name} counter")
+            value = counter["value"]
+            lines.append(f"{name}{labels(sorted(counter['labels'].items()))} {int(value) if value == int(value) else value}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics: Optional[Metrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide Metrics, creating it on first use."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+def timed(stage: str):
+    """Decorator recording the duration of every call as one run of a pipeline stage."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_metrics().stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
 class Mode(Enum):
     DEFAULT = 1
     FAST = 2
     GRAPHICS = 3
 
 
+@dataclass(frozen=True)
+class Theme:
+    """
+    A PDF layout: stylesheets applied on top of PDF_STYLESHEETS, plus any
+    templates placed in PDF_TEMPLATES_DIR/<name>/ to replace the default ones.
+    """
+    name: str
+    description: str
+    stylesheets: Tuple[str, ...] = ()
+
+
+THEMES: Dict[str, Theme] = {}
+
+
+def register_theme(theme: Theme):
+    """Make a theme available to build_pdf, the --theme option and the web app."""
+    THEMES[theme.name] = theme
+
+
+register_theme(Theme("classic", "Codeforces look"))
+register_theme(Theme("compact", "Compact print: small type, tight spacing, no decoration",
+                     ("theme-compact.css",)))
+register_theme(Theme("two-column", "Compact print in two columns",
+                     ("theme-compact.css", "theme-two-column.css")))
+register_theme(Theme("large-print", "Large print", ("theme-large-print.css",)))
+
+
+def get_theme(name: str) -> Theme:
+    """
+    Look up a registered theme.
+
+    Raises:
+        ValueError: If no theme of that name is registered
+    """
+    try:
+        return THEMES[name]
+    except KeyError:
+        raise ValueError(f"unknown theme {name!r}; available: {', '.join(THEMES)}") from None
+
+
 @dataclass(frozen=True)
 class LatexFormula:
     content: str
     is_inline: bool
 
 
-def remove_alert(block: bs4.Tag):
+@dataclass(slots=True)
+class Sample:
+    input: str
+    output: str
+
+
+@dataclass(slots=True)
+class StatementSection:
+    kind: str  # CSS class of the section on Codeforces, e.g. "legend", "input-specification"
+    title: str
+    html: str
+
+
+@dataclass(slots=True)
+class Problem:
+    """
+    A parsed problem statement.
+
+    Produced by a single parse of the problem page and consumed by every
+    later stage (formula rendering, HTML assembly, PDF layout). Statement
+    HTML is stored with formulas still in TeX, so a saved problem can be
+    re-rendered in any mode without fetching it again.
+    """
+    contest_id: int
+    problem: str
+    title: str
+    time_limit: str = "1 second"
+    memory_limit: str = "256 megabytes"
+    input_file: str = "standard input"
+    output_file: str = "standard output"
+    rating: int = 0
+    tags: List[str] = field(default_factory=list)
+    url: str = ""
+    sections: List[StatementSection] = field(default_factory=list)
+    samples: List[Sample] = field(default_factory=list)
+    notes: List[StatementSection] = field(default_factory=list)
+    placeholder: bool = False
+
+    @property
+    def file_name(self) -> str:
+        return f"{self.contest_id}{self.problem}.pdf"
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["format"] = PROBLEM_FORMAT_VERSION
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Problem":
+        data = dict(data)
+        version = data.pop("format", PROBLEM_FORMAT_VERSION)
+        if version > PROBLEM_FORMAT_VERSION:
+            raise ValueError(f"unsupported problem format version {version}")
+        data["sections"] = [StatementSection(**section) for section in data.get("sections", [])]
+        data["samples"] = [Sample(**sample) for sample in data.get("samples", [])]
+        data["notes"] = [StatementSection(**note) for note in data.get("notes", [])]
+        return cls(**data)
+
+
+def save_problem(problem: Problem, path) -> Path:
+    """
+    Write a problem to ``path`` as JSON, or as msgpack if the suffix is ``.msgpack``.
+
+    msgpack output requires the optional ``msgpack`` package.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".msgpack":
+        import msgpack
+        path.write_bytes(msgpack.packb(problem.to_dict(), use_bin_type=True))
+    else:
+        path.write_text(json.dumps(problem.to_dict(), ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    return path
+
+
+def load_problem(path) -> Problem:
+    """Read a problem written by save_problem."""
+    path = Path(path)
+    if path.suffix == ".msgpack":
+        import msgpack
+        return Problem.from_dict(msgpack.unpackb(path.read_bytes(), raw=False))
+    return Problem.from_dict(json.loads(path.read_text(encoding="utf-8")))
+
+
+@dataclass
+class CachedPage:
+    url: str
+    html: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.fetched_at < ttl
+
+
+_written_since_prune: Dict[str, int] = {}
+_written_since_prune_lock = threading.Lock()
+
+
+def _prune_due(path: Path, written: int, max_bytes: int) -> bool:
+    """
+    Count bytes written to a size-capped cache directory and tell whether to prune it now.
+
+    Pruning stats every entry, so it runs on the first write to a directory in
+    this process and then each time another CACHE_PRUNE_INTERVAL of max_bytes
+    has been written, instead of after every write.
+    """
+    key = str(path)
+    with _written_since_prune_lock:
+        total = _written_since_prune.get(key)
+        if total is not None and total + written < max_bytes * CACHE_PRUNE_INTERVAL:
+            _written_since_prune[key] = total + written
+            return False
+        _written_since_prune[key] = 0
+        return True
+
+
+class PageCache:
+    """
+    Content-addressed on-disk cache of raw Codeforces problem pages.
+
+    Each entry is keyed by (contest_id, problem, url) and stored as a pair of
+    files: ``<key>.html`` with the page body and ``<key>.json`` with the
+    validators (ETag / Last-Modified) needed for conditional revalidation.
+    The modification time of the ``.html`` file doubles as the LRU clock, and
+    that of the ``.json`` file records when the page was last validated.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl: float = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(path)
+        self.path = self.root / "pages"
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(contest_id, problem, url: str) -> str:
+        return hashlib.sha256(f"{contest_id}\0{problem}\0{url}".encode()).hexdigest()
+
+    def _files(self, key: str) -> Tuple[Path, Path]:
+        return self.path / f"{key}.html", self.path / f"{key}.json"
+
+    def get(self, contest_id, problem, url: str) -> Optional[CachedPage]:
+        """Return the cached page (fresh or stale), or None if absent/corrupt."""
+        html_file, meta_file = self._files(self.key(contest_id, problem, url))
+        try:
+            meta = json.loads(meta_file.read_text(encoding="utf-8"))
+            validated_at = meta_file.stat().st_mtime
+            html = html_file.read_text(encoding="utf-8")
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(html_file)  # mark as recently used
+        except OSError:
+            pass
+        return CachedPage(
+            url=url,
+            html=html,
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+            fetched_at=max(meta.get("fetched_at", 0), validated_at),
+        )
+
+    def put(self, contest_id, problem, url: str, html: str,
+            etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.path.mkdir(parents=True, exist_ok=True)
+        html_file, meta_file = self._files(self.key(contest_id, problem, url))
+        meta = {
+            "contest_id": str(contest_id),
+            "problem": problem,
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time(),
+        }
+        # Write to temporary files first so concurrent readers never see a torn entry;
+        # each writer has its own temporary name, so concurrent writers cannot interleave
+        written = 0
+        for target, content in ((html_file, html), (meta_file, json.dumps(meta))):
+            tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(content, encoding="utf-8")
+            os.replace(tmp, target)
+            written += len(content)
+        if _prune_due(self.path, written, self.max_bytes):
+            self.prune(expired=False)
+
+    def touch(self, contest_id, problem, url: str):
+        """Mark an entry as freshly validated (e.g. after a 304 Not Modified)."""
+        _, meta_file = self._files(self.key(contest_id, problem, url))
+        try:
+            os.utime(meta_file)  # atomic, unlike rewriting the file a concurrent put may be replacing
+        except OSError:
+            pass
+
+    def url_pattern(self, contest_id) -> Optional[str]:
+        """Return the URL pattern that last served a problem of this contest."""
+        try:
+            patterns = json.loads((self.root / "url_patterns.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return patterns.get(str(contest_id))
+
+    def remember_url_pattern(self, contest_id, pattern: str):
+        patterns_file = self.root / "url_patterns.json"
+        try:
+            patterns = json.loads(patterns_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            patterns = {}
+        patterns[str(contest_id)] = pattern
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = patterns_file.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(patterns), encoding="utf-8")
+            os.replace(tmp, patterns_file)
+        except OSError as e:
+            warning(f"Could not save URL pattern for contest {contest_id}: {e}")
+
+    def prune(self, expired: bool = True) -> int:
+        """
+        Evict entries until the cache fits in max_bytes, least recently used first.
+
+        Args:
+            expired: Also drop every entry older than the TTL
+
+        Returns:
+            The number of evicted entries
+        """
+        if not self.path.is_dir():
+            return 0
+
+        entries = []
+        for html_file in self.path.glob("*.html"):
+            meta_file = html_file.with_suffix(".json")
+            try:
+                size = html_file.stat().st_size + meta_file.stat().st_size
+                last_used = html_file.stat().st_mtime
+            except OSError:
+                size, last_used = 0, 0
+            entries.append((last_used, size, html_file, meta_file))
+
+        entries.sort(key=lambda entry: entry[0])
+        total = sum(entry[1] for entry in entries)
+        now = time.time()
+        evicted = 0
+        for last_used, size, html_file, meta_file in entries:
+            stale = False
+            if expired:
+                try:
+                    stale = now - meta_file.stat().st_mtime >= self.ttl
+                except OSError:
+                    stale = True
+            if total <= self.max_bytes and not stale:
+                continue
+            for f in (html_file, meta_file):
+                try:
+                    f.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= size
+            evicted += 1
+        return evicted
+
+
+class PdfCache:
+    """
+    On-disk cache of rendered PDFs keyed by render_cache_key.
+
+    The key covers the problem content, the rendering mode and a fingerprint
+    of the templates and stylesheets, so a hit is byte-for-byte what a fresh
+    render would produce and any template change simply stops matching old
+    entries, which then age out through LRU eviction.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = PDF_CACHE_MAX_BYTES):
+        self.path = Path(path) / "pdf"
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> Optional[Path]:
+        pdf_file = self.path / f"{key}.pdf"
+        try:
+            os.utime(pdf_file)  # mark as recently used
+        except OSError:
+            get_metrics().count("cache", cache="pdf", result="miss")
+            return None
+        get_metrics().count("cache", cache="pdf", result="hit")
+        return pdf_file
+
+    def put(self, key: str, pdf_path) -> Path:
+        self.path.mkdir(parents=True, exist_ok=True)
+        pdf_file = self.path / f"{key}.pdf"
+        tmp = pdf_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(pdf_path, tmp)
+        os.replace(tmp, pdf_file)
+        self.prune()
+        return pdf_file
+
+    def prune(self) -> int:
+        """Evict least recently used PDFs until the cache fits in max_bytes."""
+        if not self.path.is_dir():
+            return 0
+        entries = []
+        for pdf_file in self.path.glob("*.pdf"):
+            try:
+                stat = pdf_file.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, pdf_file))
+        entries.sort(key=lambda entry: entry[0])
+        total = sum(entry[1] for entry in entries)
+        evicted = 0
+        for _, size, pdf_file in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                pdf_file.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        return evicted
+
+
+@dataclass(slots=True)
+class RenderedFormula:
+    """A formula typeset as SVG, with its box in TeX points"""
+    svg: str
+    width: float
+    height: float  # above the baseline
+    depth: float  # below the baseline
+
+
+class FormulaCache:
+    """
+    Persistent cache of rendered formulas keyed by their TeX source.
+
+    Statements repeat the same formulas (``n``, ``1 \\le n \\le 10^5``) across
+    problems, so most formulas are typeset once and then served from
+    <path>/formulas, with the most recent ones also kept in memory.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = FORMULA_CACHE_MAX_BYTES,
+                 memo_entries: int = FORMULA_MEMO_ENTRIES):
+        self.path = Path(path) / "formulas"
+        self.max_bytes = max_bytes
+        self.memo_entries = memo_entries
+        self._memo: "OrderedDict[str, RenderedFormula]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(formula: LatexFormula) -> str:
+        source = f"{FORMULA_RENDERER_VERSION}\0{int(formula.is_inline)}\0{formula.content}"
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, rendered: RenderedFormula):
+        with self._lock:
+            self._memo[key] = rendered
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_entries:
+                self._memo.popitem(last=False)
+
+    def get(self, formula: LatexFormula) -> Optional[RenderedFormula]:
+        key = self.key(formula)
+        with self._lock:
+            rendered = self._memo.get(key)
+            if rendered is not None:
+                self._memo.move_to_end(key)
+        if rendered is not None:
+            get_metrics().count("cache", cache="formula", result="hit")
+            return rendered
+        entry = self.path / f"{key}.json"
+        try:
+            rendered = RenderedFormula(**json.loads(entry.read_text(encoding="utf-8")))
+            os.utime(entry)  # mark as recently used
+        except (OSError, ValueError, TypeError):
+            get_metrics().count("cache", cache="formula", result="miss")
+            return None
+        get_metrics().count("cache", cache="formula", result="hit")
+        self._remember(key, rendered)
+        return rendered
+
+    def put(self, formula: LatexFormula, rendered: RenderedFormula):
+        key = self.key(formula)
+        self._remember(key, rendered)
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            entry = self.path / f"{key}.json"
+            tmp = entry.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            content = json.dumps(asdict(rendered))
+            tmp.write_text(content, encoding="utf-8")
+            os.replace(tmp, entry)
+        except OSError as e:
+            warning(f"Could not cache rendered formula: {e}")
+            return
+        if _prune_due(self.path, len(content), self.max_bytes):
+            self.prune()
+
+    def prune(self) -> int:
+        """Evict least recently used formulas until the cache fits in max_bytes."""
+        if not self.path.is_dir():
+            return 0
+        entries = []
+        for entry in self.path.glob("*.json"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort(key=lambda item: item[0])
+        total = sum(item[1] for item in entries)
+        evicted = 0
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        return evicted
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    file: str  # content-addressed file name under <cache>/images
+    mime_type: str
+    original_size: int  # bytes as downloaded, before shrink_image
+
+
+class ImageCache:
+    """
+    On-disk cache of statement images, stored ready for layout.
+
+    Images are kept downscaled and recompressed (see shrink_image) in
+    <path>/images, named by the hash of their content, so an image linked from
+    several statements or URLs is stored once. A small index file per URL in
+    <path>/images/urls records which content the URL resolves to.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.path = Path(path) / "images"
+        self.max_bytes = max_bytes
+
+    def _index(self, url: str) -> Path:
+        key = hashlib.sha256(f"{IMAGE_FORMAT_VERSION}\0{url}".encode("utf-8")).hexdigest()
+        return self.path / "urls" / f"{key}.json"
+
+    def lookup(self, url: str) -> Optional[CachedImage]:
+        """Like get(), but without counting the lookup; for the layout stage re-reading prefetched images."""
+        try:
+            image = CachedImage(**json.loads(self._index(url).read_text(encoding="utf-8")))
+            os.utime(self.path / image.file)  # mark as recently used; fails if the content was evicted
+        except (OSError, ValueError, TypeError):
+            return None
+        return image
+
+    def get(self, url: str) -> Optional[CachedImage]:
+        image = self.lookup(url)
+        get_metrics().count("cache", cache="image", result="miss" if image is None else "hit")
+        return image
+
+    def read(self, image: CachedImage) -> bytes:
+        return (self.path / image.file).read_bytes()
+
+    def put(self, url: str, data: bytes, mime_type: str) -> Optional[CachedImage]:
+        """Shrink a downloaded image and store it for url; returns None if it could not be written."""
+        shrunk, mime_type = shrink_image(data, mime_type)
+        image = CachedImage(hashlib.sha256(shrunk).hexdigest() + IMAGE_EXTENSIONS.get(mime_type, ""),
+                            mime_type, len(data))
+        if len(shrunk) < len(data):
+            get_metrics().count("image_bytes_saved", len(data) - len(shrunk))
+        try:
+            index = self._index(url)
+            index.parent.mkdir(parents=True, exist_ok=True)
+            suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+            content = self.path / image.file
+            written = 0
+            if not content.exists():
+                tmp = content.with_name(content.name + suffix)
+                tmp.write_bytes(shrunk)
+                os.replace(tmp, content)
+                written = len(shrunk)
+            tmp = index.with_suffix(suffix)
+            tmp.write_text(json.dumps(asdict(image)), encoding="utf-8")
+            os.replace(tmp, index)
+        except OSError as e:
+            warning(f"Could not cache image {url}: {e}")
+            return None
+        if written and _prune_due(self.path, written, self.max_bytes):
+            self.prune()
+        return image
+
+    def prune(self) -> int:
+        """Evict least recently used images until the cache fits in max_bytes; URL index entries go with them."""
+        if not self.path.is_dir():
+            return 0
+        entries = []
+        for content in self.path.iterdir():
+            try:
+                stat = content.stat()
+            except OSError:
+                continue
+            if content.is_file():
+                entries.append((stat.st_mtime, stat.st_size, content))
+        entries.sort(key=lambda item: item[0])
+        total = sum(item[1] for item in entries)
+        evicted = set()
+        for _, size, content in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                content.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted.add(content.name)
+        if evicted:
+            for index in (self.path / "urls").glob("*.json"):
+                try:
+                    if json.loads(index.read_text(encoding="utf-8")).get("file") in evicted:
+                        index.unlink()
+                except (OSError, ValueError):
+                    continue
+        return len(evicted)
+
+
+class ProblemStore:
+    """
+    Short-lived in-process store of parsed problems.
+
+    A problem fetched for one purpose (e.g. the web availability check) is
+    reused by the next request for the same problem (e.g. the conversion)
+    instead of being downloaded and parsed again. Only successfully fetched
+    problems are stored; entries expire after ttl seconds and the least
+    recently used entries are dropped beyond max_entries.
+    """
+
+    def __init__(self, ttl: float = PROBLEM_STORE_TTL, max_entries: int = PROBLEM_STORE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Problem, Optional[int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(contest_id, problem: str) -> Tuple[str, str]:
+        return str(contest_id).strip(), problem.strip().upper()
+
+    def get(self, contest_id, problem: str) -> Optional[Tuple[Problem, Optional[int]]]:
+        """Return a copy of the stored problem and the status code it was fetched with."""
+        key = self.key(contest_id, problem)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                get_metrics().count("cache", cache="problem", result="miss")
+                return None
+            stored_at, parsed, status = entry
+            self._entries.move_to_end(key)
+        get_metrics().count("cache", cache="problem", result="hit")
+        # Callers may render formulas into the problem; keep the stored one pristine
+        return copy.deepcopy(parsed), status
+
+    def put(self, parsed: Problem, status: Optional[int] = None):
+        if parsed.placeholder:
+            return
+        key = self.key(parsed.contest_id, parsed.problem)
+        with self._lock:
+            self._entries[key] = (time.time(), copy.deepcopy(parsed), status)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+@dataclass
+class FetchStats:
+    requests: int = 0
+    connections_opened: int = 0
+    tls_handshakes: int = 0
+    http2_responses: int = 0
+    retries: int = 0
+    throttled: int = 0
+
+    @property
+    def connections_reused(self) -> int:
+        return max(self.requests - self.connections_opened, 0)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": self.connections_reused,
+            "tls_handshakes": self.tls_handshakes,
+            "http2_responses": self.http2_responses,
+            "retries": self.retries,
+            "throttled": self.throttled,
+        }
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while a host is known to be blocking us."""
+
+
+class RateLimiter:
+    """
+    Token bucket per host, plus backoff and circuit breaker state.
+
+    The state of each host lives in a small JSON file under <path>/ratelimit
+    guarded by flock, so every process sharing the cache directory (gunicorn
+    workers, CLI runs, the web app's job threads) draws from the same bucket
+    and sees the same backoff. A throttled response holds back every caller
+    until its Retry-After has passed. After CIRCUIT_THRESHOLD throttled
+    responses in a row, or when asked to wait longer than BACKOFF_MAX, the
+    circuit opens and requests fail fast with CircuitOpenError.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, rate: float = RATE_LIMIT_PER_SECOND, burst: int = RATE_LIMIT_BURST):
+        self.path = Path(path) / "ratelimit"
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+
+    def _update(self, host: str, change: Callable[[dict, float], object]):
+        """Apply change(state, now) to the host's state under an exclusive lock and return its result."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            fd = os.open(self.path / f"{host}.json", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                with os.fdopen(os.dup(fd), "r+", encoding="utf-8") as f:
+                    try:
+                        state = json.loads(f.read() or "{}")
+                    except ValueError:
+                        state = {}
+                    now = time.time()
+                    result = change(state, now)
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                return result
+            finally:
+                os.close(fd)  # also releases the flock
+
+    def acquire(self, host: str):
+        """Block until a request to host may be sent."""
+        def take(state: dict, now: float) -> float:
+            if state.get("open_until", 0) > now:
+                raise CircuitOpenError(f"{host} is throttling us; not retrying for "
+                                       f"{state['open_until'] - now:.0f}s")
+            if state.get("not_before", 0) > now:
+                return state["not_before"] - now
+            tokens = min(self.burst, state.get("tokens", self.burst)
+                         + (now - state.get("updated", now)) * self.rate)
+            state["updated"] = now
+            if tokens >= 1:
+                state["tokens"] = tokens - 1
+                return 0.0
+            state["tokens"] = tokens
+            return (1 - tokens) / self.rate
+
+        while True:
+            wait = self._update(host, take)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def throttled(self, host: str, delay: float) -> bool:
+        """Record a throttled response; returns True if the circuit is now open."""
+        def record(state: dict, now: float) -> bool:
+            state["failures"] = state.get("failures", 0) + 1
+            if delay > BACKOFF_MAX or state["failures"] >= CIRCUIT_THRESHOLD:
+                state["open_until"] = max(state.get("open_until", 0), now + max(delay, CIRCUIT_COOLDOWN))
+                state["failures"] = 0
+                return True
+            state["not_before"] = max(state.get("not_before", 0), now + delay)
+            return False
+
+        return self._update(host, record)
+
+    def succeeded(self, host: str):
+        def reset(state: dict, now: float):
+            state["failures"] = 0
+
+        self._update(host, reset)
+
+
+def _retry_delay(resp: "httpx.Response", attempt: int) -> float:
+    """Seconds to wait before retrying: the server's Retry-After, else exponential backoff with full jitter."""
+    retry_after = resp.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            from email.utils import parsedate_to_datetime
+
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, BACKOFF_BASE * 2 ** attempt)
+
+
+class Fetcher:
+    """
+    Shared HTTP client for all Codeforces traffic.
+
+    Keeps a keep-alive connection pool (HTTP/2 when the ``h2`` package is
+    installed) so repeated requests skip the TCP and TLS handshakes, caps
+    the number of in-flight requests per host, paces requests through the
+    shared RateLimiter and retries throttled responses with backoff.
+    """
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT, max_connections: int = HTTP_MAX_CONNECTIONS,
+                 max_connections_per_host: int = HTTP_MAX_CONNECTIONS_PER_HOST,
+                 limiter: Optional[RateLimiter] = None):
+        import httpx
+
+        self.http2 = importlib.util.find_spec("h2") is not None
+        self.client = httpx.Client(
+            follow_redirects=True,
+            timeout=timeout,
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60,
+            ),
+        )
+        self.max_connections_per_host = max_connections_per_host
+        self.limiter = limiter if limiter is not None else RateLimiter(CACHE_PATH)
+        self.stats = FetchStats()
+        self._lock = threading.Lock()
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+
+    def _slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_connections_per_host)
+            return self._host_slots[host]
+
+    def _trace(self, event_name: str, info):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.stats.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self.stats.tls_handshakes += 1
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None,
+            timeout: Optional[float] = None) -> "httpx.Response":
+        """
+        GET url, retrying up to HTTP_RETRIES times when the host throttles us.
+
+        Raises:
+            CircuitOpenError: The host has been throttling us and its circuit is open
+        """
+        kwargs = {"headers": headers, "extensions": {"trace": self._trace}}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        host = urlsplit(url).hostname or ""
+        attempt = 0
+        metrics = get_metrics()
+        while True:
+            with metrics.stage("throttle_wait"):
+                self.limiter.acquire(host)
+            with self._slot(host), metrics.stage("fetch"):
+                resp = self.client.get(url, **kwargs)
+            metrics.count("http_responses", status=resp.status_code)
+            metrics.count("http_bytes", len(resp.content))
+            with self._lock:
+                self.stats.requests += 1
+                if resp.http_version == "HTTP/2":
+                    self.stats.http2_responses += 1
+            if resp.status_code not in RETRY_STATUSES:
+                self.limiter.succeeded(host)
+                return resp
+
+            with self._lock:
+                self.stats.throttled += 1
+            delay = _retry_delay(resp, attempt)
+            if self.limiter.throttled(host, delay):
+                metrics.count("http_circuit_opened")
+                warning(f"{host} keeps answering {resp.status_code}; pausing requests to it")
+                return resp
+            if attempt >= HTTP_RETRIES:
+                return resp
+            attempt += 1
+            metrics.count("http_retries")
+            with self._lock:
+                self.stats.retries += 1
+            info(f"{url} returned {resp.status_code}, retrying in {delay:.1f}s")
+
+    def close(self):
+        self.client.close()
+
+
+_fetcher: Optional[Fetcher] = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> Fetcher:
+    """Return the process-wide Fetcher, creating it on first use."""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = Fetcher()
+        return _fetcher
+
+
+_formula_cache: Optional[FormulaCache] = None
+_formula_cache_lock = threading.Lock()
+
+
+def get_formula_cache() -> FormulaCache:
+    """Return the process-wide FormulaCache, creating it on first use."""
+    global _formula_cache
+    with _formula_cache_lock:
+        if _formula_cache is None:
+            _formula_cache = FormulaCache(CACHE_PATH)
+        return _formula_cache
+
+
+_image_cache: Optional[ImageCache] = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """Return the process-wide ImageCache, creating it on first use."""
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache(CACHE_PATH)
+        return _image_cache
+
+
+_problem_store: Optional[ProblemStore] = None
+_problem_store_lock = threading.Lock()
+
+
+def get_problem_store() -> ProblemStore:
+    """Return the process-wide ProblemStore, creating it on first use."""
+    global _problem_store
+    with _problem_store_lock:
+        if _problem_store is None:
+            _problem_store = ProblemStore()
+        return _problem_store
+
+
+def remove_alert(block: "bs4.Tag"):
     """Remove alert, info, and notification divs from the problem block."""
     if block is None:
         return
@@ -82,20 +1225,16 @@ def remove_alert(block: bs4.Tag):
         div.extract()
 
 
-def get_problem_rating(problem_page_html: str) -> int:
-    """
-    Extract the difficulty rating from a Codeforces problem page.
-    
-    Args:
-        problem_page_html: The HTML content of the problem page
-        
-    Returns:
-        The problem rating as an integer, or 0 if not found
-    """
+def _rating_from_soup(bs: "bs4.BeautifulSoup") -> int:
+    """Extract the difficulty rating from an already parsed problem page."""
     try:
-        # Create a BeautifulSoup object from the HTML
-        bs = bs4.BeautifulSoup(problem_page_html, "html.parser")
-        
+        # Method 0: The "*1500" difficulty tag in the sidebar tag box
+        difficulty_tag = bs.select_one('span.tag-box[title="Difficulty"]')
+        if difficulty_tag is not None:
+            value = difficulty_tag.get_text(strip=True).lstrip("*")
+            if value.isdigit():
+                return int(value)
+
         # Method 1: Look for the span with "Difficulty:" text
         difficulty_spans = bs.find_all("span", string=lambda text: text and "Difficulty:" in text)
         if difficulty_spans:
@@ -165,106 +1304,221 @@ def get_difficulty_color(rating: int) -> str:
     else:
         return "#aa0000"  # Dark red
 
-def difficulty_badge_html(rating: int, include_label: bool = True) -> str:
-    """
-    Generate HTML for a difficulty badge.
-    
-    Args:
-        rating: The problem rating
-        include_label: Whether to include the "Difficulty: " label
-        
-    Returns:
-        HTML string for the badge
-    """
-    color = get_difficulty_color(rating)
-    label = "Difficulty: " if include_label and rating > 0 else ""
-    rating_text = str(rating) if rating > 0 else "Unknown"
-    
-    return f"""
-    <div class="difficulty-badge" style="display: inline-block; padding: 3px 8px; 
-                                        background-color: {color}; color: white; 
-                                        border-radius: 5px; font-weight: bold; 
-                                        font-size: 0.9em; margin: 5px 0;">
-        {label}{rating_text}
-    </div>
-    """
+def _property_value(div: Optional["bs4.Tag"]) -> Optional[str]:
+    """Text of a header property such as ``.time-limit`` without its ``.property-title`` label."""
+    if div is None:
+        return None
+    label = div.find(class_="property-title")
+    if label is not None:
+        label.extract()
+    value = div.get_text(" ", strip=True).lstrip(":").strip()
+    return value or None
+
+
+def _pre_text(pre: Optional["bs4.Tag"]) -> str:
+    """Sample text of a ``<pre>``, keeping line breaks from ``<br>`` and per-line divs."""
+    if pre is None:
+        return ""
+    lines = pre.find_all("div", class_="test-example-line")
+    if lines:
+        return "\n".join(line.get_text() for line in lines).strip()
+    for br in pre.find_all("br"):
+        br.replace_with("\n")
+    return pre.get_text().strip()
+
+
+def _parse_statement(statement: "bs4.Tag", contest_id, problem: str) -> Problem:
+    """Build a Problem from a ``.problem-statement`` element (or a bare statement fragment)."""
+    result = Problem(contest_id=contest_id, problem=problem, title="Codeforces Problem")
+
+    header = statement.find("div", class_="header")
+    title_div = (header or statement).find("div", class_="title")
+    if title_div is not None:
+        result.title = title_div.get_text(strip=True)
+    scope = header or statement
+    result.time_limit = _property_value(scope.find("div", class_="time-limit")) or result.time_limit
+    result.memory_limit = _property_value(scope.find("div", class_="memory-limit")) or result.memory_limit
+    result.input_file = _property_value(scope.find("div", class_="input-file")) or result.input_file
+    result.output_file = _property_value(scope.find("div", class_="output-file")) or result.output_file
+    if header is None:
+        # Loose fragments sometimes carry the limits as plain text
+        text = statement.get_text(" ")
+        time_match = re.search(r'time limit[^:]*:\s*(\d+(?:\.\d+)?)\s*second', text, re.IGNORECASE)
+        memory_match = re.search(r'memory limit[^:]*:\s*(\d+)\s*megabytes', text, re.IGNORECASE)
+        if time_match:
+            result.time_limit = f"{time_match.group(1)} second{'' if time_match.group(1) == '1' else 's'}"
+        if memory_match:
+            result.memory_limit = f"{memory_match.group(1)} megabytes"
+        if title_div is not None:
+            title_div.extract()
+
+    for child in statement.find_all(True, recursive=False):
+        classes = child.get("class") or []
+        if "header" in classes:
+            continue
+        if "sample-tests" in classes or "sample-test" in classes:
+            inputs = child.find_all("div", class_="input")
+            outputs = child.find_all("div", class_="output")
+            for input_div, output_div in zip(inputs, outputs):
+                result.samples.append(Sample(_pre_text(input_div.find("pre")), _pre_text(output_div.find("pre"))))
+            continue
+
+        section_title = child.find("div", class_="section-title", recursive=False)
+        title = ""
+        if section_title is not None:
+            title = section_title.get_text(strip=True)
+            section_title.extract()
+        kind = classes[0] if classes else "legend"
+        section = StatementSection(kind=kind, title=title, html=child.decode_contents())
+        if kind == "note":
+            result.notes.append(section)
+        else:
+            result.sections.append(section)
+    return result
 
-def extract_problem(contest_id, problem) -> Tuple[str, str, int]:
+
+@timed("parse")
+def parse_problem_page(page_html: str, contest_id, problem: str, parser: Optional[str] = None) -> Optional[Problem]:
     """
-    Extract problem content from Codeforces.
-    Tries multiple URL formats and handles various error cases.
-    
+    Parse a full Codeforces problem page into a Problem in a single pass.
+
     Args:
-        contest_id: The ID of the contest
-        problem: The letter/ID of the problem within the contest
-        
+        page_html: The HTML content of the problem page
+        parser: BeautifulSoup tree builder (default: HTML_PARSER)
+
     Returns:
-        Tuple of (output_filename, html_content, problem_rating)
+        The parsed problem, or None if the page has no problem block
     """
-    # Standardize problem ID (uppercase)
-    problem = problem.strip().upper()
-    problem_rating = 0
-    
-    # Try these URL formats in order with different cases for the problem ID
-    urls = [
-        # Standard contest format
-        f"https://codeforces.com/contest/{contest_id}/problem/{problem}",
-        # Problemset format
-        f"https://codeforces.com/problemset/problem/{contest_id}/{problem}",
-        # Gym format
-        f"https://codeforces.com/gym/{contest_id}/problem/{problem}",
-        # Try lowercase problem ID
-        f"https://codeforces.com/contest/{contest_id}/problem/{problem.lower()}",
-        f"https://codeforces.com/problemset/problem/{contest_id}/{problem.lower()}"
-    ]
-    
-    # Try different browser user agents with advanced anti-bot detection bypass
-    headers_list = [
-        {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Referer': 'https://codeforces.com/',
-            'sec-ch-ua': '"Chromium";v="122", "Not(A:Brand";v="24", "Google Chrome";v="122"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Windows"',
-            'sec-fetch-dest': 'document',
-            'sec-fetch-mode': 'navigate',
-            'sec-fetch-site': 'same-origin',
-            'sec-fetch-user': '?1',
-            'Cache-Control': 'max-age=0',
-            'dnt': '1',
-            'Upgrade-Insecure-Requests': '1',
-        },
-        {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.3 Safari/605.1.15',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Referer': 'https://codeforces.com/',
-            'Connection': 'keep-alive',
-            'sec-fetch-dest': 'document',
-            'sec-fetch-mode': 'navigate',
-            'sec-fetch-site': 'same-origin',
-        },
-        {
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:122.0) Gecko/20100101 Firefox/122.0',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Referer': 'https://codeforces.com/problemset',
-            'DNT': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'same-origin',
-            'Upgrade-Insecure-Requests': '1',
-        }
+    import bs4
+
+    bs = bs4.BeautifulSoup(page_html, parser or HTML_PARSER)
+    problem_block = bs.select_one(".problemindexholder")
+    if problem_block is None:
+        return None
+
+    remove_alert(problem_block)
+    rating = _rating_from_soup(bs)
+    tags = [
+        tag.get_text(strip=True)
+        for tag in bs.select("span.tag-box")
+        if tag.get("title") != "Difficulty" and tag.get_text(strip=True)
     ]
-    
-    # For sample output if all attempts fail
-    sample_html = f"""
+    statement = problem_block.find("div", class_="problem-statement") or problem_block
+    result = _parse_statement(statement, contest_id, problem)
+    result.rating = rating
+    result.tags = tags
+    return result
+
+
+@timed("parse")
+def parse_problem_statement(html: str, contest_id=0, problem: str = "", problem_rating: int = 0,
+                            parser: Optional[str] = None) -> Problem:
+    """Parse a bare problem statement fragment, e.g. the inner HTML of ``.problemindexholder``."""
+    if 'Unable to fetch problem' in html:
+        return _placeholder_problem(contest_id, problem, html)
+    import bs4
+
+    bs = bs4.BeautifulSoup(html, parser or HTML_PARSER)
+    statement = bs.find("div", class_="problem-statement") or bs.body or bs
+    result = _parse_statement(statement, contest_id, problem)
+    result.rating = problem_rating
+    return result
+
+
+def _placeholder_problem(contest_id, problem: str, html: str) -> Problem:
+    return Problem(
+        contest_id=contest_id,
+        problem=problem,
+        title=f"Unable to fetch problem {contest_id}{problem}",
+        sections=[StatementSection(kind="legend", title="", html=html)],
+        placeholder=True,
+    )
+
+
+# Problem page URL formats, tried in this order unless a contest has a known winner
+PROBLEM_URL_PATTERNS = [
+    # Standard contest format
+    "https://codeforces.com/contest/{contest_id}/problem/{problem}",
+    # Problemset format
+    "https://codeforces.com/problemset/problem/{contest_id}/{problem}",
+    # Gym format
+    "https://codeforces.com/gym/{contest_id}/problem/{problem}",
+    # Try lowercase problem ID
+    "https://codeforces.com/contest/{contest_id}/problem/{problem_lower}",
+    "https://codeforces.com/problemset/problem/{contest_id}/{problem_lower}",
+]
+
+# Try different browser user agents with advanced anti-bot detection bypass
+BROWSER_HEADERS = [
+    {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Referer': 'https://codeforces.com/',
+        'sec-ch-ua': '"Chromium";v="122", "Not(A:Brand";v="24", "Google Chrome";v="122"',
+        'sec-ch-ua-mobile': '?0',
+        'sec-ch-ua-platform': '"Windows"',
+        'sec-fetch-dest': 'document',
+        'sec-fetch-mode': 'navigate',
+        'sec-fetch-site': 'same-origin',
+        'sec-fetch-user': '?1',
+        'Cache-Control': 'max-age=0',
+        'dnt': '1',
+        'Upgrade-Insecure-Requests': '1',
+    },
+    {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.3 Safari/605.1.15',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Referer': 'https://codeforces.com/',
+        'Connection': 'keep-alive',
+        'sec-fetch-dest': 'document',
+        'sec-fetch-mode': 'navigate',
+        'sec-fetch-site': 'same-origin',
+    },
+    {
+        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:122.0) Gecko/20100101 Firefox/122.0',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Referer': 'https://codeforces.com/problemset',
+        'DNT': '1',
+        'Sec-Fetch-Dest': 'document',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-Site': 'same-origin',
+        'Upgrade-Insecure-Requests': '1',
+    }
+]
+
+PROBE_FAN_OUT = 3
+
+# URL pattern that last served each contest, so later problems go straight to it
+_contest_url_patterns: Dict[str, str] = {}
+_contest_url_patterns_lock = threading.Lock()
+
+
+def _preferred_url_pattern(contest_id, cache: Optional[PageCache]) -> Optional[str]:
+    with _contest_url_patterns_lock:
+        pattern = _contest_url_patterns.get(str(contest_id))
+    if pattern is None and cache is not None:
+        pattern = cache.url_pattern(contest_id)
+    return pattern if pattern in PROBLEM_URL_PATTERNS else None
+
+
+def _remember_url_pattern(contest_id, pattern: str, cache: Optional[PageCache]):
+    with _contest_url_patterns_lock:
+        if _contest_url_patterns.get(str(contest_id)) == pattern:
+            return
+        _contest_url_patterns[str(contest_id)] = pattern
+    if cache is not None:
+        cache.remember_url_pattern(contest_id, pattern)
+
+
+def _problem_page_not_found_html(contest_id, problem) -> str:
+    return f"""
     <div class="title">Unable to fetch problem {contest_id}{problem}</div>
     <div>
         <p>Could not connect to Codeforces to retrieve problem content.</p>
@@ -277,456 +1531,2238 @@ def extract_problem(contest_id, problem) -> Tuple[str, str, int]:
         </ul>
     </div>
     """
+
+
+def _try_problem_url(contest_id, problem, url: str, cache: Optional[PageCache], refresh_cache: bool,
+                     cancelled: Optional[threading.Event] = None) -> Tuple[Optional[Problem], Optional[int]]:
+    """
+    Fetch a single candidate problem URL, cycling through the browser header sets.
+
+    Throttling is handled by the Fetcher's backoff; a different user agent does
+    not get around it, so a throttled or blocked response ends the attempt.
+
+    Args:
+        cancelled: Set by a concurrent probe that already succeeded; stops further attempts
+
+    Returns:
+        Tuple of (parsed problem or None, last HTTP status code or None)
+    """
+    cached = None
+    if cache is not None and not refresh_cache:
+        cached = cache.get(contest_id, problem, url)
+    if cached is not None and cached.is_fresh(cache.ttl):
+        extracted = parse_problem_page(cached.html, contest_id, problem)
+        if extracted is not None:
+            extracted.url = url
+            get_metrics().count("cache", cache="page", result="hit")
+            info(f"Using cached page for: {url}")
+            return extracted, None
+    if cache is not None:
+        get_metrics().count("cache", cache="page", result="stale" if cached is not None else "miss")
+
+    status = None
+    for headers in BROWSER_HEADERS:
+        if cancelled is not None and cancelled.is_set():
+            break
+        try:
+            info(f"Trying URL: {url}")
+            request_headers = dict(headers)
+            if cached is not None:
+                # Revalidate the stale copy instead of downloading the page again
+                if cached.etag:
+                    request_headers['If-None-Match'] = cached.etag
+                if cached.last_modified:
+                    request_headers['If-Modified-Since'] = cached.last_modified
+            # Reuse pooled keep-alive connections across attempts
+            resp = get_fetcher().get(url, headers=request_headers)
+            status = resp.status_code
+
+            if resp.status_code == 304 and cached is not None:
+                get_metrics().count("cache", cache="page", result="revalidated")
+                info(f"Cached page for {url} is still valid")
+                cache.touch(contest_id, problem, url)
+                page = cached.html
+            elif resp.status_code == 200:
+                page = resp.text
+            elif resp.status_code in RETRY_STATUSES:
+                info(f"URL {url} returned status code {resp.status_code}")
+                break
+            else:
+                info(f"URL {url} returned status code {resp.status_code}")
+                continue
+
+            # Check if the response actually contains problem content
+            if '<div class="problem-statement">' in page or '.problemindexholder' in page:
+                info(f"Successfully fetched problem from: {url}")
+                extracted = parse_problem_page(page, contest_id, problem)
+                if extracted is not None:
+                    extracted.url = url
+                    if cache is not None and resp.status_code == 200:
+                        cache.put(contest_id, problem, url, page,
+                                  etag=resp.headers.get('ETag'),
+                                  last_modified=resp.headers.get('Last-Modified'))
+                    return extracted, status
+            else:
+                info(f"URL {url} returned OK status but didn't contain problem content")
+        except CircuitOpenError as e:
+            warning(str(e))
+            break
+        except Exception as e:
+            info(f"Error connecting to {url}: {str(e)}")
+            # Continue to the next headers set
+    return None, status
+
+
+def _probe_problem_urls(contest_id, problem, candidates: List[Tuple[str, str]], cache: Optional[PageCache],
+                        refresh_cache: bool, fan_out: int) -> Tuple[Optional[Tuple[str, Problem]], str, Optional[int]]:
+    """
+    Race the candidate URLs concurrently and keep the first one that yields a problem block.
+
+    Probes still queued when a winner is found are cancelled; probes already in
+    flight stop before their next attempt and their results are discarded.
+
+    Returns:
+        Tuple of (winning (pattern, problem) or None, last url, last status)
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    cancelled = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=max(1, fan_out), thread_name_prefix="cf-probe")
+    futures = {
+        pool.submit(_in_context(_try_problem_url), contest_id, problem, url, cache, refresh_cache, cancelled):
+            (pattern, url)
+        for pattern, url in candidates
+    }
+    winner = None
+    last_url, last_status = "", None
+    try:
+        for future in as_completed(futures):
+            pattern, url = futures[future]
+            extracted, status = future.result()
+            last_url, last_status = url, status if status is not None else last_status
+            if extracted is not None:
+                winner = (pattern, extracted)
+                last_status = status
+                break
+    finally:
+        cancelled.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    return winner, last_url, last_status
+
+
+@dataclass(slots=True)
+class ProblemInfo:
+    """Metadata of one problem as reported by the Codeforces API"""
+    contest_id: int
+    index: str
+    name: str
+    rating: int = 0
+    tags: List[str] = field(default_factory=list)
+
+
+def _problem_sort_key(index: str):
+    """Order problem indices the way contests list them: A, B, B1, B2, ..., Z, AA"""
+    match = re.fullmatch(r"([A-Z]*)(\d*)", index)
+    if match is None:
+        return (1, 0, index, 0)
+    letters, digits = match.groups()
+    return (0, len(letters), letters, int(digits or 0))
+
+
+class ProblemIndex:
+    """
+    Local indexed snapshot of Codeforces problem metadata from the official API.
+
+    The whole problemset (problemset.problems) is downloaded at most once per
+    ttl and saved to <path>/problemset.json; after that, problem lists,
+    ratings and tags are dictionary lookups. Contests missing from the
+    problemset (gyms, contests still running) are filled in from
+    contest.standings on first use, once per contest. If the API cannot be
+    reached, a stale snapshot is used rather than nothing.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl: float = METADATA_TTL):
+        self.snapshot = Path(path) / "problemset.json"
+        self.ttl = ttl
+        self._problems: Dict[Tuple[str, str], ProblemInfo] = {}
+        self._contests: Dict[str, List[str]] = {}
+        self._fetched_at = 0.0
+        self._missing = set()  # contests contest.standings did not know either
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def lookup(self, contest_id, problem: str) -> Optional[ProblemInfo]:
+        contest = str(contest_id).strip()
+        self._ensure_contest(contest)
+        return self._problems.get((contest, problem.strip().upper()))
+
+    def contest_problems(self, contest_id) -> List[str]:
+        """Problem indices of a contest in contest order; empty if the API does not know it."""
+        contest = str(contest_id).strip()
+        self._ensure_contest(contest)
+        return list(self._contests.get(contest, []))
+
+    def _ensure_contest(self, contest: str):
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+            if contest in self._contests or contest in self._missing:
+                return
+            problems = self._fetch_contest(contest)
+            if not problems:
+                self._missing.add(contest)
+                return
+            self._add(problems)
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.snapshot, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != METADATA_FORMAT_VERSION:
+                raise ValueError(f"unsupported snapshot format {data.get('format')}")
+            self._add(ProblemInfo(*entry) for entry in data["problems"])
+            self._fetched_at = data["fetched_at"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            debug(f"no usable problemset snapshot: {e}")
+        if time.time() - self._fetched_at <= self.ttl:
+            return
+        problems = self._fetch_problemset()
+        if problems:
+            self._problems.clear()
+            self._contests.clear()
+            self._add(problems)
+            self._fetched_at = time.time()
+            self._save()
+        elif self._problems:
+            warning("Codeforces API unavailable, using stale problemset snapshot")
+
+    def _add(self, problems):
+        touched = set()
+        for entry in problems:
+            contest = str(entry.contest_id)
+            if (contest, entry.index) not in self._problems:
+                self._contests.setdefault(contest, []).append(entry.index)
+            self._problems[(contest, entry.index)] = entry
+            touched.add(contest)
+        for contest in touched:
+            self._contests[contest].sort(key=_problem_sort_key)
+
+    def _save(self):
+        data = {
+            "format": METADATA_FORMAT_VERSION,
+            "fetched_at": self._fetched_at,
+            "problems": [[p.contest_id, p.index, p.name, p.rating, p.tags] for p in self._problems.values()],
+        }
+        try:
+            self.snapshot.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.snapshot.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+            os.replace(tmp, self.snapshot)
+        except OSError as e:
+            warning(f"Could not save problemset snapshot: {e}")
+
+    @staticmethod
+    def _api(method: str, **params):
+        import httpx
+
+        query = "&".join(f"{key}={value}" for key, value in params.items())
+        url = f"{API_URL}/{method}" + (f"?{query}" if query else "")
+        try:
+            resp = get_fetcher().get(url, timeout=API_TIMEOUT)
+            data = resp.json()
+        except (httpx.HTTPError, CircuitOpenError, ValueError) as e:
+            info(f"Codeforces API {method} failed: {e}")
+            return None
+        if resp.status_code != 200 or data.get("status") != "OK":
+            info(f"Codeforces API {method} failed: {data.get('comment', resp.status_code)}")
+            return None
+        return data["result"]
+
+    @staticmethod
+    def _from_api(problem: dict) -> Optional[ProblemInfo]:
+        if "contestId" not in problem or "index" not in problem:
+            return None
+        return ProblemInfo(problem["contestId"], problem["index"].upper(), problem.get("name", ""),
+                           problem.get("rating", 0), list(problem.get("tags", [])))
+
+    def _fetch_problemset(self) -> List[ProblemInfo]:
+        info("Downloading problemset metadata from the Codeforces API")
+        result = self._api("problemset.problems")
+        if result is None:
+            return []
+        return [p for p in map(self._from_api, result.get("problems", [])) if p is not None]
+
+    def _fetch_contest(self, contest: str) -> List[ProblemInfo]:
+        if not contest.isdigit():
+            return []
+        result = self._api("contest.standings", contestId=contest, **{"from": 1, "count": 1})
+        if result is None:
+            return []
+        return [p for p in map(self._from_api, result.get("problems", [])) if p is not None]
+
+
+_problem_index: Optional[ProblemIndex] = None
+_problem_index_lock = threading.Lock()
+
+
+def get_problem_index() -> Optional[ProblemIndex]:
+    """Return the process-wide ProblemIndex, or None when METADATA_API is off."""
+    global _problem_index
+    if not METADATA_API:
+        return None
+    with _problem_index_lock:
+        if _problem_index is None:
+            _problem_index = ProblemIndex(CACHE_PATH)
+        return _problem_index
+
+
+def _apply_problem_metadata(parsed: Problem):
+    """Replace the rating and tags scraped from the page with the API's exact values."""
+    index = get_problem_index()
+    if index is None:
+        return
+    meta = index.lookup(parsed.contest_id, parsed.problem)
+    if meta is None:
+        return
+    if meta.rating > 0:
+        parsed.rating = meta.rating
+    if meta.tags:
+        parsed.tags = list(meta.tags)
+
+
+def get_contest_problems(contest_id, fallback: bool = True) -> List[str]:
+    """
+    Fetches all problem IDs available in a Codeforces contest
     
-    url_used = ""
-    resp = None
+    Args:
+        contest_id: The ID of the contest
+        fallback: Guess A-F if the list cannot be found, instead of returning an empty list
+        
+    Returns:
+        A list of problem IDs (A, B, C, etc.)
+    """
+    index = get_problem_index()
+    if index is not None:
+        problem_ids = index.contest_problems(contest_id)
+        if problem_ids:
+            info(f"Found problems: {problem_ids}")
+            return problem_ids
+
+    # Fall back to scraping the contest and gym pages
+    urls = [
+        f"https://codeforces.com/contest/{contest_id}",
+        f"https://codeforces.com/gym/{contest_id}"
+    ]
     
-    # Try each URL with each set of headers
     for url in urls:
-        for headers in headers_list:
-            try:
-                info(f"Trying URL: {url}")
-                # Use httpx instead of requests for better performance and modern features
-                with httpx.Client(follow_redirects=True, timeout=10) as client:
-                    resp = client.get(url, headers=headers)
-                url_used = url
+        try:
+            info(f"Fetching contest problems from {url}")
+            resp = get_fetcher().get(url, headers=BROWSER_HEADERS[0])
+            
+            if resp.status_code != 200:
+                info(f"Got status code {resp.status_code} for {url}")
+                continue
                 
-                if resp.status_code == 200:
-                    # Check if the response actually contains problem content
-                    if '<div class="problem-statement">' in resp.text or '.problemindexholder' in resp.text:
-                        info(f"Successfully fetched problem from: {url}")
-                        # Parse the response
-                        bs = bs4.BeautifulSoup(resp.text, "html.parser")
-                        problem_block = bs.select_one(".problemindexholder")
-                        
-                        if problem_block is not None:
-                            remove_alert(problem_block)
-                            html = problem_block.decode_contents()
-                            # Try to extract the problem rating
-                            problem_rating = get_problem_rating(resp.text)
-                            info(f"Successfully extracted problem content from: {url_used}")
-                            if problem_rating > 0:
-                                info(f"Extracted problem rating: {problem_rating}")
-                            return f"{contest_id}{problem}.pdf", html, problem_rating
-                    else:
-                        info(f"URL {url} returned OK status but didn't contain problem content")
-                else:
-                    info(f"URL {url} returned status code {resp.status_code}")
-            except (httpx.RequestError, Exception) as e:
-                info(f"Error connecting to {url}: {str(e)}")
-                # Continue to the next URL/headers combination
+            # Parse the HTML to find problem links
+            import bs4
+
+            soup = bs4.BeautifulSoup(resp.text, HTML_PARSER)
+            
+            # Different ways to find problem links
+            problem_ids = []
+            
+            # Look for problem table rows
+            problem_rows = soup.select('table.problems tr')
+            if problem_rows and len(problem_rows) > 1:  # Skip header row
+                for row in problem_rows[1:]:  # Skip header row
+                    # Find problem ID (typically first column)
+                    problem_id_cell = row.select_one('td:first-child')
+                    if problem_id_cell:
+                        problem_id = problem_id_cell.text.strip()
+                        # Usually just the letter (A, B, C, etc.)
+                        if problem_id and len(problem_id) <= 2:
+                            problem_ids.append(problem_id)
+            
+            # Alternative: look for problem links in the sidebar
+            if not problem_ids:
+                sidebar_links = soup.select('.problems a')
+                for link in sidebar_links:
+                    href = link.get('href', '')
+                    if '/problem/' in href:
+                        # Extract problem ID from URL
+                        problem_id = href.split('/')[-1].strip()
+                        if problem_id and len(problem_id) <= 2:
+                            problem_ids.append(problem_id.upper())
+            
+            # Another alternative: look for specific problem links
+            if not problem_ids:
+                all_links = soup.find_all('a')
+                for link in all_links:
+                    href = link.get('href', '')
+                    if '/problem/' in href:
+                        # Extract problem ID from URL
+                        problem_id = href.split('/')[-1].strip()
+                        if problem_id and len(problem_id) <= 2 and problem_id.upper() not in problem_ids:
+                            problem_ids.append(problem_id.upper())
+            
+            # If we found problems, return them
+            if problem_ids:
+                # Remove duplicates and sort
+                unique_problems = sorted(set(problem_ids))
+                info(f"Found problems: {unique_problems}")
+                return unique_problems
+                
+        except Exception as e:
+            info(f"Error fetching contest {contest_id}: {str(e)}")
+            continue
+    
+    if not fallback:
+        return []
+    # Fallback to common problem IDs if we couldn't extract them
+    warning("Using fallback problem IDs (A-F)")
+    return ['A', 'B', 'C', 'D', 'E', 'F']
+
+
+def extract_problem(contest_id, problem, cache: Optional[PageCache] = None, refresh_cache: bool = False,
+                    parallel: bool = False, fan_out: int = PROBE_FAN_OUT) -> Problem:
+    """
+    Extract problem content from Codeforces.
+    Tries multiple URL formats and handles various error cases. A problem
+    fetched within the last PROBLEM_STORE_TTL seconds by this process is
+    reused from the ProblemStore unless refresh_cache is set.
+    
+    Args:
+        contest_id: The ID of the contest
+        problem: The letter/ID of the problem within the contest
+        cache: Optional on-disk page cache consulted before going to the network
+        refresh_cache: Ignore cached pages and overwrite them with fresh downloads
+        parallel: Probe the URL formats concurrently instead of one after another
+        fan_out: Maximum number of concurrent probes in parallel mode
+        
+    Returns:
+        The parsed problem; a placeholder problem describing the failure if it could not be fetched
+    """
+    result, _, _ = _extract_problem(contest_id, problem, cache, refresh_cache, parallel, fan_out)
+    return result
+
+
+def _extract_problem(contest_id, problem, cache: Optional[PageCache], refresh_cache: bool,
+                     parallel: bool, fan_out: int) -> Tuple[Problem, bool, Optional[int]]:
+    """
+    Implementation of extract_problem that also reports how the fetch went.
+
+    Returns:
+        Tuple of (problem, fetched, last_status_code), where fetched is False
+        when problem is the placeholder error page
+    """
+    # Standardize problem ID (uppercase)
+    problem = problem.strip().upper()
+
+    store = get_problem_store()
+    if not refresh_cache:
+        stored = store.get(contest_id, problem)
+        if stored is not None:
+            info(f"Using recently fetched problem {contest_id}{problem}")
+            result, status = stored
+            return result, True, status
+
+    candidates = [
+        (pattern, pattern.format(contest_id=contest_id, problem=problem, problem_lower=problem.lower()))
+        for pattern in PROBLEM_URL_PATTERNS
+    ]
+    preferred = _preferred_url_pattern(contest_id, cache)
+    if preferred is not None:
+        candidates.sort(key=lambda candidate: candidate[0] != preferred)
+
+    url_used = ""
+    status = None
+    winner = None
+
+    if parallel:
+        if preferred is not None:
+            # A contest that resolved before almost always resolves the same way again
+            pattern, url = candidates.pop(0)
+            extracted, status = _try_problem_url(contest_id, problem, url, cache, refresh_cache)
+            url_used = url
+            if extracted is not None:
+                winner = (pattern, extracted)
+        if winner is None and candidates:
+            winner, url_used, last_status = _probe_problem_urls(
+                contest_id, problem, candidates, cache, refresh_cache, fan_out)
+            status = last_status if last_status is not None else status
+    else:
+        for pattern, url in candidates:
+            extracted, attempt_status = _try_problem_url(contest_id, problem, url, cache, refresh_cache)
+            url_used = url
+            status = attempt_status if attempt_status is not None else status
+            if extracted is not None:
+                winner = (pattern, extracted)
+                break
+
+    if winner is not None:
+        pattern, result = winner
+        _remember_url_pattern(contest_id, pattern, cache)
+        info(f"Successfully extracted problem content from: {pattern.format(contest_id=contest_id, problem=problem, problem_lower=problem.lower())}")
+        _apply_problem_metadata(result)
+        if result.rating > 0:
+            info(f"Extracted problem rating: {result.rating}")
+        store.put(result, status)
+        return result, True, status
     
     # If all attempts failed
-    warning(f"All URLs failed. Last attempt: '{url_used}' status_code={resp.status_code if resp else 'No response'}")
+    warning(f"All URLs failed. Last attempt: '{url_used}' status_code={status if status is not None else 'No response'}")
     info("Generating placeholder PDF with error message")
-    return f"{contest_id}{problem}.pdf", sample_html, 0
+    return _placeholder_problem(contest_id, problem, _problem_page_not_found_html(contest_id, problem)), False, status
+
+
+# $$$$$$display$$$$$$ and $$$inline$$$ formulas as they appear in Codeforces statement HTML
+FORMULA_PATTERN = re.compile(r"\$\$\$\$\$\$(.+?)\$\$\$\$\$\$|\$\$\$(.+?)\$\$\$", re.DOTALL)
+# Tags and comments; splitting on this leaves the text nodes at the even positions
+HTML_MARKUP = re.compile(r"(<!--.*?-->|<[^>]*>)", re.DOTALL)
+# Formulas that look the same as text: symbols, numbers and single-character sub/superscripts
+SIMPLE_FORMULA = re.compile(r"(?:[A-Za-z0-9\s.,;:+\-=<>()\[\]|'!*/]|[_^][A-Za-z0-9])*")
+# Commands a formula may use for latex to typeset it. Anything else (\input, \def,
+# \loop, \csname, ...) could read or write files, redefine macros for the
+# formulas after it or never terminate, so such formulas are typeset as text.
+LATEX_COMMANDS = frozenset("""
+    alpha beta gamma delta epsilon varepsilon zeta eta theta vartheta iota kappa lambda mu nu xi pi varpi rho
+    varrho sigma varsigma tau upsilon phi varphi chi psi omega Gamma Delta Theta Lambda Xi Pi Sigma Upsilon Phi
+    Psi Omega
+    le leq ge geq ne neq lt gt approx equiv sim simeq cong propto ll gg prec preceq succ succeq leqslant geqslant
+    cdot times div pm mp ast star circ bullet oplus ominus otimes odot land wedge lor vee neg lnot
+    sum prod coprod int iint oint bigcup bigcap bigoplus bigotimes bigvee bigwedge infty partial nabla prime
+    ldots dots cdots vdots ddots dotsc dotsb
+    to rightarrow leftarrow leftrightarrow Rightarrow Leftarrow Leftrightarrow longrightarrow longleftarrow
+    implies iff mapsto uparrow downarrow updownarrow Uparrow Downarrow
+    in notin ni subset subseteq subsetneq supset supseteq supsetneq cup cap setminus emptyset varnothing forall
+    exists nexists mid nmid parallel perp angle triangle backslash not
+    lfloor rfloor lceil rceil langle rangle lvert rvert vert lVert rVert Vert
+    left right middle big Big bigg Bigg bigl bigr Bigl Bigr biggl biggr
+    max min log ln lg exp gcd lcm sin cos tan cot sec csc arcsin arccos arctan sinh cosh tanh deg det dim ker
+    hom lim liminf limsup sup inf arg Pr bmod pmod mod operatorname
+    frac dfrac tfrac cfrac binom dbinom tbinom choose over atop sqrt
+    text textrm mathrm mbox texttt mathtt textbf mathbf textit mathit textsf mathsf boldsymbol mathbb mathcal
+    mathfrak mathscr
+    overline underline bar hat widehat tilde widetilde vec dot ddot overbrace underbrace overrightarrow
+    overleftarrow overset underset stackrel substack
+    displaystyle textstyle scriptstyle limits nolimits nonumber
+    quad qquad hline begin end
+""".split())
+# Environments \begin may open in a formula
+LATEX_ENVIRONMENTS = frozenset("""
+    cases array matrix pmatrix bmatrix Bmatrix vmatrix Vmatrix smallmatrix aligned gathered split subarray
+""".split())
+# Control symbols: spacing, line breaks and escaped special characters
+LATEX_CONTROL_SYMBOLS = frozenset(",;:!> \\{}%$&#_|")
+# Commands and control symbols, and the characters that must not appear unescaped in a formula
+LATEX_TOKEN = re.compile(r"\\(?:([A-Za-z]+)|(.?))|[%$#]", re.DOTALL)
+LATEX_ENVIRONMENT = re.compile(r"\s*\{([A-Za-z]+\*?)\}")
+FORMULA_PADDING = 0.5  # pt of space around each formula so overhanging glyphs are not clipped
+
+LATEX_PREAMBLE = r"""\documentclass[10pt]{article}
+\usepackage{amsmath,amssymb}
+\pagestyle{empty}
+\hoffset=-1in
+\voffset=-1in
+\begin{document}
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def have_command(name: str) -> bool:
+    """Whether an external tool is on PATH; looked up once per process, without spawning a shell."""
+    return shutil.which(name) is not None
+
+
+def _latex_page(index: int, formula: LatexFormula) -> str:
+    """One DVI page holding formula, sized to its box; the box dimensions are written to the log."""
+    math = f"${formula.content}$" if formula.is_inline else f"$\\displaystyle {formula.content}$"
+    pad = f"{FORMULA_PADDING}pt"
+    return (
+        f"\\typeout{{CF2PDF-BEGIN {index}}}\n"
+        f"\\setbox0\\hbox{{{math}}}\n"
+        f"\\setbox2\\hbox{{\\kern{pad}\\box0\\kern{pad}}}\n"
+        f"\\ht2=\\dimexpr\\ht2+{pad}\\relax \\dp2=\\dimexpr\\dp2+{pad}\\relax\n"
+        f"\\typeout{{CF2PDF-BOX {index} \\the\\wd2\\space\\the\\ht2\\space\\the\\dp2}}\n"
+        f"\\shipout\\hbox{{\\special{{papersize=\\the\\wd2,\\the\\dimexpr\\ht2+\\dp2\\relax}}\\box2}}\n"
+    )
+
+
+def _text_formulas(html: str) -> Iterator[re.Match]:
+    """Formulas in the text of an HTML fragment; $$$ inside tags and attribute values is not a formula."""
+    if "$$$" not in html:
+        return
+    for text in HTML_MARKUP.split(html)[::2]:
+        yield from FORMULA_PATTERN.finditer(text)
+
+
+def _sub_text_formulas(typeset: Callable[[re.Match], str], html: str) -> str:
+    """FORMULA_PATTERN.sub over the text nodes of an HTML fragment only, in document order."""
+    if "$$$" not in html:
+        return html
+    parts = HTML_MARKUP.split(html)
+    parts[::2] = [FORMULA_PATTERN.sub(typeset, text) for text in parts[::2]]
+    return "".join(parts)
+
+
+def _latex_safe(tex: str) -> bool:
+    """Whether a formula uses only allow-listed commands and environments, and no ^^ character codes."""
+    if "^^" in tex or not _braces_balanced(tex):
+        return False
+    for match in LATEX_TOKEN.finditer(tex):
+        command, symbol = match.groups()
+        if command is not None:
+            if command not in LATEX_COMMANDS:
+                return False
+            if command in ("begin", "end"):
+                environment = LATEX_ENVIRONMENT.match(tex, match.end())
+                if environment is None or environment.group(1) not in LATEX_ENVIRONMENTS:
+                    return False
+        elif symbol is None or symbol not in LATEX_CONTROL_SYMBOLS:
+            return False  # unescaped % $ #, or a backslash at the end
+    return True
+
+
+def _braces_balanced(tex: str) -> bool:
+    depth = 0
+    for match in re.finditer(r"\\.|[{}]", tex):
+        token = match.group()
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+
+def _typeset(formulas: List[LatexFormula], work: Path, timeout: float) -> Tuple[Dict[LatexFormula, RenderedFormula], int]:
+    """
+    One latex run and one dvisvgm run over formulas, in the empty directory work.
+
+    latex runs without shell escape and may only open files below work (or
+    found in the TeX installation); the formulas have passed _latex_safe.
+
+    Returns:
+        Tuple of (rendered formulas, number of leading formulas typeset before the
+        first one that failed); formulas after a failure are left out since
+        latex's state may no longer be clean
+
+    Raises:
+        OSError: latex or dvisvgm could not be run
+        subprocess.TimeoutExpired: A run took longer than timeout
+    """
+    source = LATEX_PREAMBLE + "".join(_latex_page(i, f) for i, f in enumerate(formulas, 1)) + "\\end{document}\n"
+    (work / "formulas.tex").write_text(source, encoding="utf-8")
+    env = dict(os.environ, openin_any="p", openout_any="p", shell_escape="f")
+    subprocess.run(["latex", "-interaction=nonstopmode", "-no-shell-escape", "formulas.tex"],
+                   cwd=work, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+    if not (work / "formulas.dvi").exists():
+        return {}, 0
+    subprocess.run(["dvisvgm", "--no-fonts", "--bbox=papersize", "--page=1-", "--output=formula-%p",
+                    "formulas.dvi"],
+                   cwd=work, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+
+    # Walk the log: box sizes per page, and which formulas raised errors
+    boxes: Dict[int, Tuple[float, float, float]] = {}
+    failed = set()
+    current = 0
+    log = (work / "formulas.log").read_text(encoding="utf-8", errors="replace")
+    for line in log.splitlines():
+        if line.startswith("CF2PDF-BEGIN "):
+            current = int(line.split()[1])
+        elif line.startswith("CF2PDF-BOX "):
+            _, index, width, height, depth = line.split()
+            boxes[int(index)] = tuple(float(v.rstrip("pt")) for v in (width, height, depth))
+        elif line.startswith("! ") and current:
+            failed.add(current)
+
+    pages = {}
+    for svg_file in work.glob("formula-*.svg"):
+        page = re.search(r"(\d+)\.svg$", svg_file.name)
+        if page is not None:
+            pages[int(page.group(1))] = svg_file
+
+    rendered = {}
+    for index, formula in enumerate(formulas, 1):
+        if index in failed or index not in boxes or index not in pages:
+            return rendered, index - 1
+        width, height, depth = boxes[index]
+        rendered[formula] = RenderedFormula(pages[index].read_text(encoding="utf-8"), width, height, depth)
+    return rendered, len(formulas)
+
+
+def _latex_to_svg(formulas: List[LatexFormula]) -> Dict[LatexFormula, RenderedFormula]:
+    """
+    Typeset formulas as SVG, normally with a single latex run and a single dvisvgm run.
+
+    Every formula is shipped out as its own page whose size is the formula's
+    box, so each SVG lines up with the text baseline using the box depth that
+    LaTeX logs. When a formula fails, it is left out and the formulas after it
+    are typeset again in a fresh run; if a run fails as a whole or produces
+    nothing, each remaining formula is typeset on its own. One bad formula thus
+    never costs the others their rendering, nor gets a wrong rendering of
+    theirs into the FormulaCache, and latex runs no more than about once per formula.
+
+    Returns:
+        Mapping of formula to its rendering; empty if latex or dvisvgm is not installed
+    """
+    if not formulas or not have_command("latex") or not have_command("dvisvgm"):
+        return {}
+    remaining = [f for f in formulas if _latex_safe(f.content)]
+    rendered = {}
+    with tempfile.TemporaryDirectory(prefix="cf2pdf-tex-") as tmp:
+        runs = 0
+
+        def run(batch: List[LatexFormula], timeout: float) -> Tuple[Dict[LatexFormula, RenderedFormula], int]:
+            nonlocal runs
+            runs += 1
+            work = Path(tmp) / str(runs)
+            work.mkdir()
+            return _typeset(batch, work, timeout)
+
+        while remaining:
+            try:
+                typeset, done = run(remaining, LATEX_TIMEOUT)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                warning(f"LaTeX formula rendering failed, typesetting {len(remaining)} formulas one by one: {e}")
+                break
+            if done == 0:
+                # No output at all: retrying the rest as a batch could cost one run per formula, each over all of them
+                debug(f"latex typeset none of {len(remaining)} formulas, typesetting them one by one")
+                break
+            rendered.update(typeset)
+            if done < len(remaining):
+                debug(f"latex could not typeset {remaining[done].content!r}")
+            remaining = remaining[done + 1:]
+
+        for formula in remaining:
+            try:
+                typeset, _ = run([formula], LATEX_FORMULA_TIMEOUT)
+            except subprocess.TimeoutExpired as e:
+                debug(f"latex could not typeset {formula.content!r}: {e}")
+                continue
+            except OSError as e:
+                warning(f"LaTeX formula rendering failed: {e}")
+                break
+            rendered.update(typeset)
+    return rendered
+
+
+def render_formula_svgs(formulas: List[LatexFormula]) -> Dict[LatexFormula, RenderedFormula]:
+    """Render formulas as SVG, taking repeats from the FormulaCache and batching the rest into one LaTeX run."""
+    cache = get_formula_cache()
+    unique = dict.fromkeys(formulas)
+    result = {}
+    missing = []
+    for formula in unique:
+        cached = cache.get(formula)
+        if cached is not None:
+            result[formula] = cached
+        else:
+            missing.append(formula)
+    rendered = _latex_to_svg(missing) if missing else {}
+    for formula, svg in rendered.items():
+        cache.put(formula, svg)
+    result.update(rendered)
+    debug(f"formulas: {len(unique)} unique, {len(unique) - len(missing)} from cache, {len(rendered)} typeset")
+    return result
+
+
+def _html_formula_embed(formula: LatexFormula) -> str:
+    body = tex_to_html(formula.content)
+    if formula.is_inline:
+        return f'<span class="math-inline">{body}</span>'
+    # A span styled as a block, since display formulas sit inside paragraphs
+    return f'<span class="math-display">{body}</span>'
+
+
+def _svg_formula_embed(formula: LatexFormula, rendered: RenderedFormula) -> str:
+    # LaTeX sets formulas at 10pt, so 10pt of the SVG becomes 1em of the surrounding text
+    data = base64.b64encode(rendered.svg.encode("utf-8")).decode("ascii")
+    img = (f'<img class="math-svg" alt="{escape(formula.content)}" src="data:image/svg+xml;base64,{data}" '
+           f'style="width: {rendered.width / 10:.3f}em; height: {(rendered.height + rendered.depth) / 10:.3f}em; '
+           f'vertical-align: {-rendered.depth / 10:.3f}em">')
+    if formula.is_inline:
+        return img
+    return f'<span class="math-display">{img}</span>'
 
 
 def generate_latex_formulas_embeds_graphics(
     formulas: list[LatexFormula],
-) -> Optional[list[str]]:
-    # Simplified implementation that just returns placeholders
-    # for LaTeX formulas without attempting actual rendering
-    if not formulas:
-        return []
-    
-    embeds = []
-    for formula in formulas:
-        if formula.is_inline:
-            embeds.append(f'<span class="math-inline">{formula.content}</span>')
-        else:
-            embeds.append(f'<div class="math-display">{formula.content}</div>')
-            
-    return embeds
+) -> list[Optional[str]]:
+    """Graphics mode: every formula as an SVG image; None for formulas that could not be rendered."""
+    rendered = render_formula_svgs(formulas)
+    return [_svg_formula_embed(f, rendered[f]) if f in rendered else None for f in formulas]
 
 
 def generate_latex_formulas_embeds(
     formulas: list[LatexFormula],
-) -> Optional[list[str]]:
-    # Simplified implementation that focuses on speed and reliability
-    if not formulas:
-        return []
-    
+) -> list[Optional[str]]:
+    """Default mode: simple formulas as text matching the statement, everything else as SVG."""
+    rendered = render_formula_svgs([f for f in formulas if not SIMPLE_FORMULA.fullmatch(f.content)])
     embeds = []
     for formula in formulas:
-        if formula.is_inline:
-            embeds.append(f'<span class="math-inline">{formula.content}</span>')
+        if SIMPLE_FORMULA.fullmatch(formula.content):
+            embeds.append(_html_formula_embed(formula))
+        elif formula in rendered:
+            embeds.append(_svg_formula_embed(formula, rendered[formula]))
         else:
-            embeds.append(f'<div class="math-display">{formula.content}</div>')
-            
+            embeds.append(None)
     return embeds
 
 
 def generate_latex_formulas_embeds_fast(
     formulas: list[LatexFormula],
-) -> Optional[list[str]]:
-    # Simplified version that just returns basic HTML for formulas
+) -> list[Optional[str]]:
+    """Fast mode: every formula as styled HTML text, without running any external tool."""
+    return [_html_formula_embed(formula) for formula in formulas]
+
+
+@timed("math")
+def render_formulas(problem: Problem, mode: Mode) -> Tuple[bool, Problem]:
+    """
+    Replace the $$$...$$$ formulas of a problem with rendered HTML for the given mode.
+
+    All formulas of the problem are rendered in one batch. Formulas that cannot be
+    rendered in the requested mode fall back to the fast HTML rendering.
+
+    Returns:
+        Tuple of (all formulas rendered as requested, problem with rendered formulas);
+        the input problem is not modified
+    """
+    fragments = [section.html for section in problem.sections] + [note.html for note in problem.notes]
+    formulas = [
+        LatexFormula(unescape(match.group(2) if match.group(1) is None else match.group(1)).strip(),
+                     is_inline=match.group(1) is None)
+        for html in fragments
+        for match in _text_formulas(html)
+    ]
     if not formulas:
-        return []
-    
-    html_formulas_embeds = []
-    for formula in formulas:
-        if formula.is_inline:
-            html_formulas_embeds.append(f'<span class="math-inline">{formula.content}</span>')
+        return True, problem
+
+    generate = {
+        Mode.FAST: generate_latex_formulas_embeds_fast,
+        Mode.GRAPHICS: generate_latex_formulas_embeds_graphics,
+    }.get(mode, generate_latex_formulas_embeds)
+    embeds = generate(formulas)
+    rendered = all(embed is not None for embed in embeds)
+    replacements = iter([embed if embed is not None else _html_formula_embed(formula)
+                         for formula, embed in zip(formulas, embeds)])
+
+    def substitute(html: str) -> str:
+        return _sub_text_formulas(lambda match: next(replacements), html)
+
+    sections = [replace(section, html=substitute(section.html)) for section in problem.sections]
+    notes = [replace(note, html=substitute(note.html)) for note in problem.notes]
+    return rendered, replace(problem, sections=sections, notes=notes)
+
+
+IMG_SRC = re.compile(r"""(<img\b[^>]*?\bsrc\s*=\s*)(["'])(.*?)\2""", re.IGNORECASE | re.DOTALL)
+
+
+def shrink_image(data: bytes, mime_type: str) -> Tuple[bytes, str]:
+    """
+    Downscale an image wider than IMAGE_MAX_WIDTH_INCHES at IMAGE_DPI and recompress it.
+
+    JPEG stays JPEG; other raster formats are saved as optimized PNG, which
+    suits the line drawings of geometry problems. A drawing of at most 256
+    colours is reduced to a palette again after resampling. Images Pillow
+    cannot read (SVG), animations, and images that would not get smaller are
+    returned unchanged. Pixels beyond the width kept here are never visible:
+    the stylesheets cap images at the text width.
+
+    Returns:
+        Tuple of (image bytes, MIME type)
+    """
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return data, mime_type
+    if getattr(image, "is_animated", False):
+        return data, mime_type
+
+    is_jpeg = image.format == "JPEG"
+    max_width = round(IMAGE_MAX_WIDTH_INCHES * IMAGE_DPI)
+    resized = image.width > max_width
+    few_colors = not is_jpeg and image.getcolors(256) is not None
+    if resized:
+        if image.mode not in ("L", "LA", "RGB", "RGBA", "CMYK"):
+            # Palette and bilevel images would be resampled by nearest neighbour
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        image = image.resize((max_width, max(1, round(image.height * max_width / image.width))), Image.LANCZOS)
+        if few_colors and image.mode in ("RGB", "RGBA"):
+            image = image.quantize(256, method=Image.Quantize.FASTOCTREE)
+    out = io.BytesIO()
+    if is_jpeg:
+        image.save(out, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    else:
+        if image.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+            image = image.convert("RGBA")
+        image.save(out, "PNG", optimize=True)
+    if out.tell() >= len(data):
+        return data, mime_type
+    return out.getvalue(), "image/jpeg" if is_jpeg else "image/png"
+
+
+def _download_image(url: str, cache: ImageCache) -> bool:
+    import httpx
+
+    try:
+        resp = get_fetcher().get(url)
+    except (httpx.HTTPError, CircuitOpenError) as e:
+        warning(f"could not download image {url}: {e}")
+        return False
+    mime_type = resp.headers.get("content-type", "").split(";")[0].strip().lower()
+    if resp.status_code != 200 or not mime_type.startswith("image/"):
+        warning(f"could not download image {url}: HTTP {resp.status_code} {mime_type}")
+        return False
+    return cache.put(url, resp.content, mime_type) is not None
+
+
+@timed("images")
+def prefetch_images(problem: Problem, cache: Optional[ImageCache] = None) -> Tuple[bool, Problem]:
+    """
+    Download the images of a statement into the image cache, concurrently.
+
+    Image URLs are resolved against the problem's URL and written back as
+    absolute URLs. Layout then reads every image from the cache through
+    pdf_url_fetcher, in whichever process it runs, instead of WeasyPrint
+    downloading them one at a time. Downloads go through the shared Fetcher,
+    so they reuse its connections and respect the rate limiter.
+
+    Returns:
+        Tuple of (every image is in the cache, problem with absolute image URLs);
+        the input problem is not modified
+    """
+    if problem.placeholder:
+        return True, problem
+    cache = cache or get_image_cache()
+    base = problem.url or "https://codeforces.com/"
+    urls = []
+
+    def absolute(match: re.Match) -> str:
+        url = urljoin(base, unescape(match.group(3)).strip())
+        if urlsplit(url).scheme not in ("http", "https"):
+            return match.group(0)  # data: URIs of rendered formulas
+        urls.append(url)
+        return f"{match.group(1)}{match.group(2)}{escape(url)}{match.group(2)}"
+
+    sections = [replace(section, html=IMG_SRC.sub(absolute, section.html)) for section in problem.sections]
+    notes = [replace(note, html=IMG_SRC.sub(absolute, note.html)) for note in problem.notes]
+    if not urls:
+        return True, problem
+
+    unique = list(dict.fromkeys(urls))
+    missing = [url for url in unique if cache.get(url) is None]
+    downloaded = 0
+    if missing:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(IMAGE_FETCH_WORKERS, len(missing)),
+                                thread_name_prefix="cf-image") as pool:
+            downloaded = sum(pool.map(_in_context(lambda url: _download_image(url, cache)), missing))
+    debug(f"images: {len(unique)} unique, {len(unique) - len(missing)} from cache, {downloaded} downloaded")
+    return downloaded == len(missing), replace(problem, sections=sections, notes=notes)
+
+
+# One token per match: \command, \symbol, structural character, whitespace or a run of plain text
+MATH_TOKEN = re.compile(r"\\[A-Za-z]+|\\.|[{}^_&~]|\s+|[^\\{}^_&~\s]+", re.DOTALL)
+# Formulas without any of these are plain text and skip the tokenizer
+MATH_SPECIAL = re.compile(r"[\\{}^_&~]")
+# In formulas without braces only these need rewriting, which one substitution handles
+MATH_FLAT_TOKEN = re.compile(r"([_^])\s*(?:\\([A-Za-z]+)|\\(.)|(\S))|\\([A-Za-z]+)|\\(.)|[&<>~]", re.DOTALL)
+
+MATH_SYMBOLS = {
+    "le": "≤", "leq": "≤", "ge": "≥", "geq": "≥", "ne": "≠", "neq": "≠", "lt": "&lt;", "gt": "&gt;",
+    "approx": "≈", "equiv": "≡", "sim": "∼", "ll": "≪", "gg": "≫", "prec": "≺", "succ": "≻",
+    "cdot": "⋅", "times": "×", "div": "÷", "pm": "±", "mp": "∓", "ast": "∗", "circ": "∘", "oplus": "⊕",
+    "otimes": "⊗", "land": "∧", "wedge": "∧", "lor": "∨", "vee": "∨", "neg": "¬", "lnot": "¬",
+    "sum": "∑", "prod": "∏", "int": "∫", "infty": "∞", "partial": "∂", "nabla": "∇",
+    "ldots": "…", "dots": "…", "cdots": "⋯", "vdots": "⋮", "ddots": "⋱",
+    "to": "→", "rightarrow": "→", "leftarrow": "←", "leftrightarrow": "↔", "Rightarrow": "⇒",
+    "Leftarrow": "⇐", "Leftrightarrow": "⇔", "implies": "⇒", "iff": "⇔", "mapsto": "↦",
+    "in": "∈", "notin": "∉", "ni": "∋", "subset": "⊂", "subseteq": "⊆", "supset": "⊃", "supseteq": "⊇",
+    "cup": "∪", "cap": "∩", "setminus": "∖", "emptyset": "∅", "varnothing": "∅", "forall": "∀", "exists": "∃",
+    "mid": "∣", "nmid": "∤", "parallel": "∥", "perp": "⊥", "angle": "∠", "triangle": "△", "deg": "°",
+    "lfloor": "⌊", "rfloor": "⌋", "lceil": "⌈", "rceil": "⌉", "langle": "⟨", "rangle": "⟩",
+    "lvert": "|", "rvert": "|", "vert": "|", "lVert": "‖", "rVert": "‖", "Vert": "‖",
+    "alpha": "α", "beta": "β", "gamma": "γ", "delta": "δ", "epsilon": "ϵ", "varepsilon": "ε", "zeta": "ζ",
+    "eta": "η", "theta": "θ", "iota": "ι", "kappa": "κ", "lambda": "λ", "mu": "μ", "nu": "ν", "xi": "ξ",
+    "pi": "π", "rho": "ρ", "sigma": "σ", "tau": "τ", "phi": "ϕ", "varphi": "φ", "chi": "χ", "psi": "ψ",
+    "omega": "ω", "Gamma": "Γ", "Delta": "Δ", "Theta": "Θ", "Lambda": "Λ", "Xi": "Ξ", "Pi": "Π",
+    "Sigma": "Σ", "Phi": "Φ", "Psi": "Ψ", "Omega": "Ω",
+    "quad": " ", "qquad": "  ", "prime": "′",
+}
+# Commands set upright as words
+MATH_OPERATORS = {"max", "min", "log", "ln", "lg", "exp", "gcd", "lcm", "sin", "cos", "tan", "deg", "det",
+                  "lim", "sup", "inf", "arg", "bmod", "mod", "operatorname"}
+# Operators whose printed word differs from the command name
+MATH_OPERATOR_WORDS = {"bmod": "mod"}
+# Commands whose argument is set as upright text
+MATH_TEXT = {"text", "textrm", "mathrm", "mbox", "texttt", "mathtt", "textbf", "mathbf", "textit", "mathit",
+             "textsf", "mathsf", "boldsymbol"}
+# Sizing and spacing commands with no visible output of their own
+MATH_IGNORED = {"left", "right", "big", "Big", "bigg", "Bigg", "bigl", "bigr", "Bigl", "Bigr", "biggl", "biggr",
+                "displaystyle", "textstyle", "limits", "nolimits", "nonumber", "middle"}
+MATH_ESCAPES = {",": " ", ";": " ", ":": " ", ">": " ", "!": "", " ": " ", "\\": "<br>",
+                "{": "{", "}": "}", "%": "%", "$": "$", "&": "&amp;", "#": "#", "_": "_", "|": "‖"}
+DOUBLE_STRUCK = {"N": "ℕ", "Z": "ℤ", "Q": "ℚ", "R": "ℝ", "C": "ℂ", "P": "ℙ"}
+
+
+# First characters of tokens that are not plain text
+MATH_STRUCTURE = frozenset("\\{}^_&~ \t\n\r\f\v")
+
+
+def _escape_text(text: str) -> str:
+    if "&" in text or "<" in text or ">" in text:
+        return escape(text, quote=False)
+    return text
+
+
+class _MathRenderer:
+    """Recursive renderer over the token list of one formula; each token is visited once."""
+
+    def __init__(self, tex: str):
+        # Tokens stay plain strings: "\\le", "\\,", "{", "^", " ", "abc"
+        self.tokens = MATH_TOKEN.findall(tex)
+        self.pos = 0
+
+    def render(self) -> str:
+        return self._sequence(closing=False)
+
+    def _sequence(self, closing: bool) -> str:
+        out = []
+        tokens = self.tokens
+        count = len(tokens)
+        while self.pos < count:
+            token = tokens[self.pos]
+            first = token[0]
+            if first not in MATH_STRUCTURE:
+                # Plain text, by far the most common token
+                self.pos += 1
+                out.append(_escape_text(token))
+            elif first in " \t\n\r\f\v":
+                self.pos += 1
+                out.append(" ")
+            elif first == "}":
+                self.pos += 1
+                if closing:
+                    break
+                out.append("}")
+            else:
+                out.append(self._item())
+        return "".join(out)
+
+    def _skip_spaces(self):
+        while self.pos < len(self.tokens) and self.tokens[self.pos].isspace():
+            self.pos += 1
+
+    def _argument(self) -> str:
+        """One argument: a braced group, a command with its own arguments, or a single character."""
+        self._skip_spaces()
+        if self.pos >= len(self.tokens):
+            return ""
+        token = self.tokens[self.pos]
+        if token == "{":
+            self.pos += 1
+            return self._sequence(closing=True)
+        if token == "}":
+            return ""
+        if len(token) > 1 and token[0] != "\\":
+            self.tokens[self.pos] = token[1:]
+            return _escape_text(token[0])
+        return self._item()
+
+    def _optional_argument(self) -> str:
+        """The index n of an n-th root, sqrt[n]{x}, when it is plain text."""
+        self._skip_spaces()
+        if self.pos < len(self.tokens):
+            token = self.tokens[self.pos]
+            if token.startswith("[") and "]" in token:
+                end = token.index("]")
+                if token[end + 1:]:
+                    self.tokens[self.pos] = token[end + 1:]
+                else:
+                    self.pos += 1
+                return _escape_text(token[1:end])
+        return ""
+
+    def _item(self) -> str:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        first = token[0]
+        if first == "\\":
+            if len(token) > 2 or token[1:].isalpha():
+                return self._command(token[1:])
+            return MATH_ESCAPES.get(token[1:], _escape_text(token[1:]))
+        if first == "{":
+            return self._sequence(closing=True)
+        if first == "^" or first == "_":
+            tag = "sup" if first == "^" else "sub"
+            return f"<{tag}>{self._argument()}</{tag}>"
+        if first == "&" and len(token) == 1:
+            return " "
+        if first == "~" and len(token) == 1:
+            return "&nbsp;"
+        if first.isspace():
+            return " "
+        return _escape_text(token)
+
+    def _command(self, name: str) -> str:
+        if name in MATH_SYMBOLS:
+            return MATH_SYMBOLS[name]
+        if name in ("frac", "dfrac", "tfrac"):
+            numerator = self._argument()
+            denominator = self._argument()
+            return (f'<span class="fraction"><span class="numerator">{numerator}</span>'
+                    f'<span class="denominator">{denominator}</span></span>')
+        if name == "sqrt":
+            index = self._optional_argument()
+            radicand = self._argument()
+            index_html = f"<sup>{index}</sup>" if index else ""
+            return f'<span class="math-sqrt">{index_html}√<span class="math-radicand">{radicand}</span></span>'
+        if name in ("binom", "dbinom", "tbinom"):
+            top = self._argument()
+            bottom = self._argument()
+            return (f'(<span class="fraction binom"><span class="numerator">{top}</span>'
+                    f'<span class="denominator">{bottom}</span></span>)')
+        if name == "pmod":
+            return f' (<span class="math-op">mod</span> {self._argument()})'
+        if name == "operatorname":
+            return f'<span class="math-op">{self._argument()}</span>'
+        if name in MATH_OPERATORS:
+            return f'<span class="math-op">{MATH_OPERATOR_WORDS.get(name, name)}</span>'
+        if name in MATH_TEXT:
+            body = self._argument()
+            if name in ("textbf", "mathbf", "boldsymbol"):
+                body = f"<b>{body}</b>"
+            return f'<span class="math-text">{body}</span>'
+        if name in ("overline", "bar"):
+            return f'<span class="math-overline">{self._argument()}</span>'
+        if name == "mathbb":
+            body = self._argument()
+            return DOUBLE_STRUCK.get(body, body)
+        if name in ("begin", "end"):
+            self._argument()  # environment name; cases and matrices keep their cells in a row
+            return ""
+        if name in MATH_IGNORED:
+            if name in ("left", "right", "middle") and self.pos < len(self.tokens):
+                token = self.tokens[self.pos]
+                if token.startswith("."):
+                    # \left. and \right. are invisible delimiters
+                    if len(token) > 1:
+                        self.tokens[self.pos] = token[1:]
+                    else:
+                        self.pos += 1
+            return ""
+        # Unknown command: show it as written, keeping its braced arguments apart
+        out = [_escape_text(f"\\{name}")]
+        while self.pos < len(self.tokens) and self.tokens[self.pos] == "{":
+            self.pos += 1
+            out.append(f"{{{self._sequence(closing=True)}}}")
+        return "".join(out)
+
+
+class _NeedsParser(Exception):
+    pass
+
+
+def _flat_command(name: str) -> str:
+    if name in MATH_SYMBOLS:
+        return MATH_SYMBOLS[name]
+    if name in MATH_OPERATORS and name != "operatorname":
+        return f'<span class="math-op">{MATH_OPERATOR_WORDS.get(name, name)}</span>'
+    raise _NeedsParser  # takes arguments or needs context
+
+
+def _flat_token(match: re.Match) -> str:
+    script, script_command, script_symbol, script_char, command, symbol = match.groups()
+    if script is not None:
+        if script_command is not None:
+            body = _flat_command(script_command)
+        elif script_symbol is not None:
+            body = MATH_ESCAPES.get(script_symbol, _escape_text(script_symbol))
         else:
-            html_formulas_embeds.append(f'<div class="math-display">{formula.content}</div>')
-            
-    return html_formulas_embeds
+            body = _escape_text(script_char)
+        tag = "sup" if script == "^" else "sub"
+        return f"<{tag}>{body}</{tag}>"
+    if command is not None:
+        return _flat_command(command)
+    if symbol is not None:
+        return MATH_ESCAPES.get(symbol, _escape_text(symbol))
+    token = match.group()
+    if token == "&":
+        return " "
+    if token == "~":
+        return "&nbsp;"
+    return _escape_text(token)
+
+
+@functools.lru_cache(maxsize=FORMULA_MEMO_ENTRIES)
+def tex_to_html(tex: str) -> str:
+    """
+    Typeset a TeX formula as HTML text: symbols, sub/superscripts, fractions
+    and roots, nested to any depth.
 
+    Args:
+        tex: Formula source without the $$$ delimiters, with HTML entities decoded
 
-def render_formulas(html: str, mode: Mode) -> Tuple[bool, str]:
-    # Simplified implementation as requested - just apply basic handling
-    return True, html
+    Returns:
+        HTML fragment; unsupported commands are shown as written
+    """
+    if not MATH_SPECIAL.search(tex):
+        return escape(tex)
+    if "{" not in tex and "}" not in tex:
+        try:
+            return MATH_FLAT_TOKEN.sub(_flat_token, tex)
+        except _NeedsParser:
+            pass  # a command with arguments, like \frac12
+    return _MathRenderer(tex).render()
 
 
 def handle_simple_math_notation(html: str) -> str:
     """
-    Apply simple CSS-based formatting for math notation when LaTeX rendering fails
+    Apply simple CSS-based formatting for math notation when LaTeX rendering fails.
+
+    Formulas are found in a single pass over the text nodes of the HTML, and
+    only the text between $$$ delimiters is touched; tags and attributes are
+    left alone.
     """
-    # Handle subscripts: replace a_n with a<sub>n</sub>
-    html = re.sub(r'([a-zA-Z])_([a-zA-Z0-9])', r'\1<sub>\2</sub>', html)
-    
-    # Handle superscripts: replace a^n with a<sup>n</sup>
-    html = re.sub(r'([a-zA-Z0-9])\^([a-zA-Z0-9])', r'\1<sup>\2</sup>', html)
-    
-    # Handle square roots: replace \sqrt{...} with a styled span
-    html = re.sub(r'\\sqrt\{([^}]+)\}', r'<span class="math-notation">√\1</span>', html)
-    
-    # Handle simple fractions: replace \frac{a}{b} with styled divs
-    html = re.sub(
-        r'\\frac\{([^}]+)\}\{([^}]+)\}',
-        r'<div class="fraction"><span class="numerator">\1</span><span class="denominator">\2</span></div>',
-        html
-    )
-    
-    # Add more math notation handling as needed
-    
-    return html
+    def typeset(match: re.Match) -> str:
+        display, inline = match.groups()
+        if display is None:
+            return f'<span class="math-inline">{tex_to_html(unescape(inline).strip())}</span>'
+        return f'<span class="math-display">{tex_to_html(unescape(display).strip())}</span>'
+
+    return _sub_text_formulas(typeset, html)
+
+
+PROBLEM_ID = re.compile(r"[A-Za-z]{1,2}\d{0,2}")
+PROBLEM_SPEC = re.compile(r"{id}(?:-{id})?(?:,{id}(?:-{id})?)*".format(id=PROBLEM_ID.pattern))
+TARGET_URL = re.compile(r"codeforces\.com/(?:(?:contest|gym)/(\d+)(?:/problem/([A-Za-z0-9]+))?"
+                        r"|problemset/problem/(\d+)/([A-Za-z0-9]+))/?(?:[?#].*)?$")
+
+
+def parse_targets(tokens: List[str]) -> List[Tuple[int, Optional[str]]]:
+    """
+    Group command line targets into (contest_id, problems) pairs.
+
+    A number starts a new contest and the tokens after it list its problems:
+    single problems, ranges and comma-separated lists ("A", "A-H", "A,C,F1-F2").
+    A contest given without problems stands for all of its problems. Problem
+    and contest URLs are accepted in place of a number.
+
+    Raises:
+        ValueError: A token is neither a contest, a problem list nor a Codeforces URL
+    """
+    targets: List[Tuple[int, Optional[str]]] = []
+    for token in tokens:
+        token = token.strip()
+        if not token:
+            continue
+        if token.isdigit():
+            targets.append((int(token), None))
+            continue
+        url = TARGET_URL.search(token)
+        if url is not None:
+            contest_id, problem, problemset_contest, problemset_problem = url.groups()
+            targets.append((int(contest_id or problemset_contest), (problem or problemset_problem or "").upper() or None))
+            continue
+        if not PROBLEM_SPEC.fullmatch(token):
+            raise ValueError(f"{token!r} is not a contest id, problem list or Codeforces URL")
+        if not targets:
+            raise ValueError(f"problems {token!r} are not preceded by a contest id")
+        contest_id, problems = targets[-1]
+        targets[-1] = (contest_id, f"{problems},{token.upper()}" if problems else token.upper())
+    return targets
+
+
+def _single_problem(targets: List[Tuple[int, Optional[str]]]) -> bool:
+    """Whether the targets name exactly one problem, which is converted without a batch summary."""
+    return len(targets) == 1 and targets[0][1] is not None and PROBLEM_ID.fullmatch(targets[0][1]) is not None
+
+
+def read_targets_file(path: str) -> List[Tuple[int, Optional[str]]]:
+    """
+    Read targets from a file, one or more per line in the command line syntax
+    (typically one problem URL per line). Text after # is ignored.
+    """
+    targets = []
+    for number, line in enumerate(Path(path).read_text(encoding="utf-8").splitlines(), 1):
+        try:
+            targets.extend(parse_targets(line.split("#", 1)[0].split()))
+        except ValueError as e:
+            raise ValueError(f"{path}:{number}: {e}") from None
+    return targets
+
+
+def _letter_range(first: str, last: str) -> List[str]:
+    """Expand A-H or F1-F3 without knowing the contest's problem list."""
+    if first.isalpha() and last.isalpha() and len(first) == len(last) == 1 and first <= last:
+        return [chr(c) for c in range(ord(first), ord(last) + 1)]
+    head, tail = first.rstrip("0123456789"), last.rstrip("0123456789")
+    if head == tail and first != head and last != tail and int(first[len(head):]) <= int(last[len(tail):]):
+        return [f"{head}{n}" for n in range(int(first[len(head):]), int(last[len(tail):]) + 1)]
+    raise ValueError(f"cannot expand the problem range {first}-{last}")
+
+
+def expand_problems(contest_id, spec: Optional[str]) -> List[str]:
+    """
+    Turn a problem list such as "A-H" or "A,C,F1-F2" into problem indices.
+
+    Ranges are resolved against the contest's own problem list, so A-E covers
+    subproblems such as E1 and E2; only if the list cannot be found is a range
+    expanded letter by letter. No spec means every problem of the contest.
+
+    Raises:
+        ValueError: A range is malformed or matches none of the contest's problems
+    """
+    if spec is None:
+        return get_contest_problems(contest_id)
+    known = None
+    problems = []
+    for part in spec.upper().split(","):
+        if "-" not in part:
+            problems.append(part)
+            continue
+        first, last = part.split("-")
+        if known is None:
+            known = get_contest_problems(contest_id, fallback=False)
+        if not known:
+            problems.extend(_letter_range(first, last))
+            continue
+        low, high = _problem_sort_key(first), _problem_sort_key(last)
+        if last.isalpha():
+            high = high[:3] + (float("inf"),)  # A-E ends after E1 and E2
+        in_range = [p for p in known if low <= _problem_sort_key(p) <= high]
+        if not in_range:
+            raise ValueError(f"no problems of contest {contest_id} in the range {first}-{last}")
+        problems.extend(in_range)
+    return list(dict.fromkeys(problems))
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Download and convert Codeforces problems to PDF')
-    parser.add_argument("contest_id", type=int, help="Codeforces contest ID (e.g., 1234)")
-    parser.add_argument("problem", type=str, help="Problem letter (e.g., A, B, C)")
+    parser.add_argument("targets", nargs="*", metavar="CONTEST [PROBLEMS]",
+                        help="Contest ID followed by a problem (A), range (A-H) or list (A,C,F1-F2); "
+                             "several contests and problem URLs may be given, a contest alone means all of its problems")
     group = parser.add_mutually_exclusive_group(required=False)
     group.add_argument("-f", "--fast", action="store_true", help="Use fast rendering mode")
     group.add_argument("-g", "--graphics", action="store_true", help="Use graphics rendering mode")
+    parser.add_argument("-t", "--theme", choices=list(THEMES), default=DEFAULT_THEME,
+                        help="PDF layout: " + "; ".join(f"{t.name} = {t.description}" for t in THEMES.values())
+                             + f" (default: {DEFAULT_THEME})")
+    parser.add_argument("--max-pages", type=int, default=0, metavar="N",
+                        help="Page-count target per problem: tighten the layout step by step until each PDF fits in N pages")
 
     parser.add_argument("-d", "--output-dir", type=str, default=".", help="Output directory for the PDF file (default: current directory)")
-    return parser.parse_args()
+    parser.add_argument("--parser", choices=["html.parser", "lxml"], default=HTML_PARSER, help=f"HTML parser backend (default: {HTML_PARSER})")
+    parser.add_argument("-p", "--parallel-probe", action="store_true", help="Try all problem URL formats concurrently and keep the first that works")
+    parser.add_argument("-b", "--booklet", action="store_true", help="Lay out several problems (all problems of the contest if none are given) as one PDF with a cover and table of contents")
+    parser.add_argument("-e", "--emit", choices=["pdf", "json", "msgpack"], default="pdf", help="Output format: rendered PDF, or the parsed problem model as JSON/msgpack (default: pdf)")
+    parser.add_argument("--load", type=str, metavar="FILE", help="Render a problem saved with --emit json/msgpack instead of fetching it")
+    parser.add_argument("--no-api", action="store_true", help="Do not use the Codeforces API for contest problem lists, ratings and tags")
+
+    batch_group = parser.add_argument_group("batch conversion")
+    batch_group.add_argument("-i", "--input-file", type=str, metavar="FILE", help="Also convert the targets listed in FILE, e.g. one problem URL per line")
+    batch_group.add_argument("-j", "--jobs", type=int, default=1, help="Worker processes laying out PDFs while further problems are fetched (default: 1)")
+    batch_group.add_argument("--report", type=str, metavar="FILE", help="Write the per-problem outcome of the run to FILE as JSON")
+    parser.add_argument("--profile", type=str, metavar="FILE", help="Write per-stage timings and cache/HTTP counters of the run to FILE as JSON")
+
+    cache_group = parser.add_argument_group("page cache")
+    cache_group.add_argument("--cache-dir", type=str, default=CACHE_PATH, help=f"Directory of the problem page cache (default: {CACHE_PATH})")
+    cache_group.add_argument("--cache-ttl", type=float, default=CACHE_TTL, help="Seconds before a cached page is revalidated with Codeforces")
+    cache_group.add_argument("--cache-max-mb", type=float, default=CACHE_MAX_BYTES / (1024 * 1024), help="Maximum cache size in megabytes before LRU eviction")
+    cache_action = cache_group.add_mutually_exclusive_group()
+    cache_action.add_argument("--no-cache", action="store_true", help="Bypass the page and rendered PDF caches entirely")
+    cache_action.add_argument("--refresh-cache", action="store_true", help="Ignore cached pages and PDFs; re-download and re-render")
+    cache_group.add_argument("--prune-cache", action="store_true", help="Evict expired and least recently used cache entries, then exit unless a problem is given")
+
+    daemon_group = parser.add_argument_group("render daemon")
+    daemon_action = daemon_group.add_mutually_exclusive_group()
+    daemon_action.add_argument("--serve", action="store_true", help="Run the render daemon: keep the renderer warm and take jobs from later CLI runs")
+    daemon_action.add_argument("--no-daemon", action="store_true", help="Render in this process even if a render daemon is running")
+    daemon_group.add_argument("--socket", type=str, metavar="PATH", help=f"Unix socket of the render daemon (default: <cache-dir>/{DAEMON_SOCKET})")
+
+    args = parser.parse_args()
+    try:
+        targets = parse_targets(args.targets)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.booklet and (len(targets) != 1 or args.input_file):
+        parser.error("--booklet takes exactly one contest")
+    if args.emit != "pdf" and (args.input_file or not _single_problem(targets)):
+        parser.error("--emit saves exactly one problem")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.max_pages < 0:
+        parser.error("--max-pages must not be negative")
+    if args.max_pages and args.booklet:
+        parser.error("--max-pages applies to one PDF per problem, not to --booklet")
+    if not targets and not args.input_file and not args.prune_cache and not args.load and not args.serve:
+        parser.error("a contest id is required")
+    return args
+
+
+def pdf_url_fetcher(url: str, *args, **kwargs):
+    """
+    WeasyPrint url_fetcher that never goes to the network.
+
+    Images downloaded by prefetch_images are served from the image cache;
+    local files (the stylesheets and the fonts they name) and data: URIs go
+    through the default fetcher. Any other URL is refused, and WeasyPrint
+    lays the document out without it.
+    """
+    from weasyprint import default_url_fetcher
+
+    scheme = urlsplit(url).scheme
+    if scheme in ("http", "https"):
+        cache = get_image_cache()
+        image = cache.lookup(url)
+        if image is not None:
+            try:
+                return {"string": cache.read(image), "mime_type": image.mime_type, "redirected_url": url}
+            except OSError:
+                pass  # evicted since the lookup
+    elif scheme in ("file", "data"):
+        return default_url_fetcher(url, *args, **kwargs)
+    raise ValueError(f"not fetched during layout: {url}")
+
+
+_font_config: Optional["FontConfiguration"] = None
+_stylesheet_cache: Dict[Tuple[str, float], "CSS"] = {}
+_stylesheet_lock = threading.Lock()
+
 
+def get_font_config() -> "FontConfiguration":
+    """Return the process-wide FontConfiguration shared by the cached stylesheets."""
+    global _font_config
+    from weasyprint.text.fonts import FontConfiguration
+
+    with _stylesheet_lock:
+        if _font_config is None:
+            _font_config = FontConfiguration()
+        return _font_config
+
+
+def get_pdf_stylesheets(extra: Optional[List[str]] = None) -> List["CSS"]:
+    """
+    Return the parsed PDF stylesheets from STYLES_DIR.
+
+    Each file is parsed once per process and reused across renders; editing a
+    file changes its mtime, which makes the next render parse it again.
+
+    Args:
+        extra: Additional stylesheet file names applied after PDF_STYLESHEETS
+    """
+    from weasyprint import CSS
+
+    font_config = get_font_config()
+    stylesheets = []
+    with _stylesheet_lock:
+        for name in PDF_STYLESHEETS + (extra or []):
+            path = STYLES_DIR / name
+            key = (str(path), path.stat().st_mtime)
+            if key not in _stylesheet_cache:
+                for stale in [k for k in _stylesheet_cache if k[0] == key[0]]:
+                    del _stylesheet_cache[stale]
+                _stylesheet_cache[key] = CSS(filename=str(path), font_config=font_config,
+                                             url_fetcher=pdf_url_fetcher)
+            stylesheets.append(_stylesheet_cache[key])
+    return stylesheets
+
+
+_page_fit_stylesheets: Dict[int, "CSS"] = {}
+
+
+def get_page_fit_stylesheet(step: int) -> "CSS":
+    """Return PAGE_FIT_STEPS[step] parsed, shared across renders like the stylesheets from STYLES_DIR."""
+    from weasyprint import CSS
+
+    font_config = get_font_config()
+    with _stylesheet_lock:
+        if step not in _page_fit_stylesheets:
+            _page_fit_stylesheets[step] = CSS(string=PAGE_FIT_STEPS[step], font_config=font_config)
+        return _page_fit_stylesheets[step]
+
+
+def theme_stylesheets(theme: str = DEFAULT_THEME, booklet: bool = False) -> List[str]:
+    """Stylesheet file names a theme applies after PDF_STYLESHEETS, in cascade order."""
+    return (BOOKLET_STYLESHEETS if booklet else []) + list(get_theme(theme).stylesheets)
+
+
+_template_env: Optional["jinja2.Environment"] = None
+_template_lock = threading.Lock()
+
+
+def get_template_env() -> "jinja2.Environment":
+    """
+    Return the process-wide Jinja2 environment for the PDF templates.
+
+    Each template is compiled once per process and again only when its file
+    changes. The compiled code is also kept in <cache dir>/templates, so a
+    fresh process (a CLI run, a render pool worker) skips the compilation.
+    """
+    global _template_env
+    import jinja2
 
-def build_pdf_from_html(html: str, output_dir: str, file_name: str, mode: Mode, problem_rating: int = 0):
+    with _template_lock:
+        if _template_env is None:
+            bytecode_dir = Path(CACHE_PATH) / "templates"
+            bytecode_dir.mkdir(parents=True, exist_ok=True)
+            _template_env = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(str(PDF_TEMPLATES_DIR)),
+                autoescape=True,
+                trim_blocks=True,
+                lstrip_blocks=True,
+                bytecode_cache=jinja2.FileSystemBytecodeCache(str(bytecode_dir)),
+            )
+            _template_env.filters["difficulty_color"] = get_difficulty_color
+        return _template_env
+
+
+def get_pdf_template(name: str, theme: str = DEFAULT_THEME) -> "jinja2.Template":
+    """Return the theme's own version of a template if it ships one, otherwise the default."""
+    return get_template_env().select_template([f"{get_theme(theme).name}/{name}", name])
+
+
+_fingerprints: Dict[Tuple, str] = {}
+
+
+def _render_fingerprint(stylesheets: List[str]) -> str:
+    """Hash of everything besides the problem that shapes a PDF: this module, the templates and the stylesheets."""
+    paths = [Path(__file__)] + sorted(PDF_TEMPLATES_DIR.rglob("*.html")) + [STYLES_DIR / name for name in stylesheets]
+    stamp = tuple((str(path), path.stat().st_mtime) for path in paths)
+    if stamp not in _fingerprints:
+        digest = hashlib.sha256()
+        for path in paths:
+            digest.update(path.read_bytes())
+        _fingerprints[stamp] = digest.hexdigest()
+    return _fingerprints[stamp]
+
+
+def _formula_renderer(mode: Mode) -> str:
+    """Which renderer typesets non-trivial formulas in mode on this machine."""
+    if mode != Mode.FAST and have_command("latex") and have_command("dvisvgm"):
+        return f"latex:{FORMULA_RENDERER_VERSION}"
+    return "html"
+
+
+def render_cache_key(problems: List[Problem], mode: Mode, theme: str = DEFAULT_THEME, booklet: bool = False,
+                     max_pages: int = 0) -> str:
+    """
+    Content hash identifying the PDF rendered from ``problems`` in ``mode`` and ``theme``,
+    fitted to ``max_pages`` pages if that is set.
+
+    Fields that do not appear in the PDF (source URL, tags) are left out, so
+    the same statement reached through different URLs shares one entry. The
+    formula renderer is part of the key: PDFs whose formulas fell back to text
+    because latex or dvisvgm is missing are cached too, and go stale once they
+    are installed.
+    """
+    digest = hashlib.sha256()
+    digest.update(_render_fingerprint(PDF_STYLESHEETS + theme_stylesheets(theme, booklet)).encode())
+    digest.update(mode.name.encode())
+    digest.update(_formula_renderer(mode).encode())
+    digest.update(f"{theme}:{max_pages}".encode())
+    for problem in problems:
+        content = problem.to_dict()
+        content.pop("url", None)
+        content.pop("tags", None)
+        digest.update(json.dumps(content, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class PdfLayout:
+    """What laying out one PDF produced, as reported in the log, the batch summary and --report."""
+    pages: int
+    size: int  # bytes
+    seconds: float
+    fit_steps: int = 0  # PAGE_FIT_STEPS applied to meet the page-count target
+
+
+def describe_layout(layout: PdfLayout) -> str:
+    fitted = f", {layout.fit_steps} fit step{'' if layout.fit_steps == 1 else 's'}" if layout.fit_steps else ""
+    return (f"{layout.pages} page{'' if layout.pages == 1 else 's'}, {layout.size / 1024:.0f} KiB, "
+            f"laid out in {layout.seconds:.2f}s{fitted}")
+
+
+@timed("html")
+def build_problem_html(problem: Problem, theme: str = DEFAULT_THEME) -> str:
+    """
+    Assemble the statement body (header, sections, samples, notes) from a parsed problem.
+
+    Renders the theme's problem.html over the structured problem; nothing is re-parsed.
+    """
+    return get_pdf_template("problem.html", theme).render(problem=problem)
+
+
+# Layouts in one process share the FontConfiguration and the parsed stylesheets,
+# which WeasyPrint does not make thread-safe; parallel layout goes through the render pool
+_layout_lock = threading.Lock()
+
+
+def _write_pdf(html: str, path: Path, stylesheets: List["CSS"], theme: str, max_pages: int = 0) -> PdfLayout:
+    """
+    Lay out a complete document with WeasyPrint and write it to path.
+
+    With max_pages, a document over the target is laid out again with each of
+    PAGE_FIT_STEPS in turn until it fits; if none does, the tightest layout is
+    kept and a warning logged. Threads of one process lay out one document at a time.
+    """
+    from weasyprint import HTML
+
+    metrics = get_metrics()
+    started = time.perf_counter()
+    with _layout_lock, metrics.stage("write_pdf"):
+        document = HTML(string=html, base_url="", url_fetcher=pdf_url_fetcher)
+        rendered = document.render(stylesheets=stylesheets, font_config=get_font_config())
+        steps = 0
+        while max_pages and len(rendered.pages) > max_pages and steps < len(PAGE_FIT_STEPS):
+            rendered = document.render(stylesheets=stylesheets + [get_page_fit_stylesheet(steps)],
+                                       font_config=get_font_config())
+            steps += 1
+            metrics.count("page_fit_retries")
+        rendered.write_pdf(path)
+    layout = PdfLayout(len(rendered.pages), path.stat().st_size, time.perf_counter() - started, steps)
+    metrics.count("pdf_pages", layout.pages, theme=theme)
+    metrics.count("pdf_bytes", layout.size, theme=theme)
+    if max_pages and layout.pages > max_pages:
+        warning(f"{path.name} has {layout.pages} pages even in the tightest layout, over the target of {max_pages}")
+    return layout
+
+
+def build_pdf_from_html(html: str, output_dir: str, file_name: str, mode: Mode, problem_rating: int = 0,
+                        theme: str = DEFAULT_THEME, max_pages: int = 0) -> PdfLayout:
+    """Lay out a raw statement fragment; for callers that do not have a parsed Problem."""
+    _, problem = prefetch_images(parse_problem_statement(html, problem_rating=problem_rating))
+    return build_pdf(problem, output_dir, file_name, mode, theme, max_pages)
+
+
+def build_pdf(problem: Problem, output_dir: str, file_name: str, mode: Mode, theme: str = DEFAULT_THEME,
+              max_pages: int = 0) -> PdfLayout:
+    """
+    Lay out one problem as ``<output_dir>/<file_name>``.
+
+    Args:
+        theme: Name of a registered Theme
+        max_pages: Page-count target; 0 lays the problem out in the theme as is
+
+    Returns:
+        The page count, size and layout time of the written PDF
+    """
+    p = Path(output_dir)
+    p.mkdir(parents=True, exist_ok=True)
+
+    # The document shell comes from the theme's templates, styling from its cached stylesheets
+    complete_html = get_pdf_template("document.html", theme).render(
+        title="Codeforces Problem", theme=theme, statement=build_problem_html(problem, theme))
+    return _write_pdf(complete_html, p / file_name, get_pdf_stylesheets(theme_stylesheets(theme)), theme, max_pages)
+
+
+def build_booklet_pdf(problems: List[Problem], output_dir: str, file_name: str, mode: Mode,
+                      title: Optional[str] = None, theme: str = DEFAULT_THEME) -> PdfLayout:
+    """
+    Lay out several problems as one document in a single WeasyPrint pass.
+
+    The booklet has a cover page, a table of contents with page numbers and
+    one page break before each problem; stylesheets and fonts are shared by
+    the whole document.
+    """
     p = Path(output_dir)
     p.mkdir(parents=True, exist_ok=True)
 
-    # Parse the HTML to restructure it to match Codeforces format
-    bs = bs4.BeautifulSoup(html, "html.parser")
+    contest_ids = sorted({str(problem.contest_id) for problem in problems})
+    title = title or f"Codeforces Contest {', '.join(contest_ids)}"
+    complete_html = get_pdf_template("booklet.html", theme).render(
+        title=title, theme=theme, problems=[(problem, build_problem_html(problem, theme)) for problem in problems])
+    return _write_pdf(complete_html, p / file_name, get_pdf_stylesheets(theme_stylesheets(theme, booklet=True)),
+                      theme)
+
+
+@dataclass
+class ConversionResult:
+    contest_id: int
+    problem: str
+    file_name: str
+    path: Optional[str] = None
+    rating: int = 0
+    fetched: bool = False
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    cached: bool = False
+    cache_key: Optional[str] = None
+    pages: int = 0  # 0 when the PDF came from the render cache
+    size: int = 0
+    layout_seconds: float = 0.0
+    degraded: bool = False  # images are missing; such a PDF is not put in the render cache
+
+    @property
+    def ok(self) -> bool:
+        """True when a PDF of the real problem statement (not the placeholder) was written."""
+        return self.fetched and self.path is not None
+
+    def record_layout(self, output_dir: str, layout: PdfLayout):
+        """Note the PDF written for this problem and log where it went and what it cost."""
+        self.path = os.path.join(output_dir, self.file_name)
+        self.pages, self.size, self.layout_seconds = layout.pages, layout.size, round(layout.seconds, 3)
+        info(f"PDF saved to {self.path} ({describe_layout(layout)})")
+
+
+def _fetch_stage(contest_id, problem: str, mode: Mode, cache: Optional[PageCache], refresh_cache: bool,
+                 parallel_probe: bool, pdf_cache: Optional[PdfCache] = None, output_dir: str = ".",
+                 theme: str = DEFAULT_THEME, max_pages: int = 0) -> Tuple[ConversionResult, Optional[Problem]]:
+    """
+    Fetch a problem and render its formulas; returns the result record and the problem to lay out.
 
-    # Check if this is a placeholder error message or actual problem content
-    is_error = 'Unable to fetch problem' in html
+    If pdf_cache already holds the PDF for this exact content, it is copied to
+    output_dir, result.path is set and the returned problem is None.
+    """
+    debug(f"fetching problem webpage: {contest_id=} {problem=}")
+    parsed, fetched, status = _extract_problem(
+        contest_id, problem, cache, refresh_cache, parallel_probe, PROBE_FAN_OUT)
+    result = ConversionResult(contest_id, parsed.problem, parsed.file_name,
+                              rating=parsed.rating, fetched=fetched, status_code=status)
+    if parsed.rating > 0:
+        info(f"fetched (difficulty rating: {parsed.rating})")
+    else:
+        info("fetched (difficulty rating unknown)")
 
-    if not is_error:
-        # Extract problem title
-        title_div = bs.find('div', class_='title')
-        title_text = title_div.text if title_div else "Codeforces Problem"
+    if pdf_cache is not None and fetched:
+        result.cache_key = render_cache_key([parsed], mode, theme, max_pages=max_pages)
+        cached_pdf = None if refresh_cache else pdf_cache.get(result.cache_key)
+        if cached_pdf is not None:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+            result.path = os.path.join(output_dir, result.file_name)
+            shutil.copyfile(cached_pdf, result.path)
+            result.cached = True
+            result.size = os.path.getsize(result.path)
+            info(f"PDF served from render cache: {result.path}")
+            return result, None
+
+    complete, parsed = prefetch_images(parsed)
+    result.degraded = not complete  # _download_image has warned about each missing image
+    debug("rendering latex")
+    rendered, parsed = render_formulas(parsed, mode)
+    if rendered:
+        info("rendered latex")
+    else:
+        warning("some formulas may not be rendered correctly")
+    return result, parsed
 
-        # Extract time and memory limits with better pattern matching
-        time_pattern = re.compile(r'time limit[^:]*:\s*(\d+(?:\.\d+)?)\s*second', re.IGNORECASE)
-        memory_pattern = re.compile(r'memory limit[^:]*:\s*(\d+)\s*megabytes', re.IGNORECASE)
 
-        time_match = time_pattern.search(html)
-        memory_match = memory_pattern.search(html)
+def convert_problem(contest_id, problem: str, mode: Mode = Mode.DEFAULT, output_dir: str = ".",
+                    cache: Optional[PageCache] = None, refresh_cache: bool = False,
+                    parallel_probe: bool = False, pdf_cache: Optional[PdfCache] = None,
+                    theme: str = DEFAULT_THEME, max_pages: int = 0) -> ConversionResult:
+    """
+    Fetch one problem and render it to ``<output_dir>/<contest_id><problem>.pdf`` in ``theme``,
+    within ``max_pages`` pages if that is set (see build_pdf).
 
-        time_limit = f"time limit per test: {time_match.group(1) if time_match else '1'} second"
-        memory_limit = f"memory limit per test: {memory_match.group(1) if memory_match else '256'} megabytes"
-        io_specs = "input: standard input<br>output: standard output"
+    A problem that cannot be fetched still produces the placeholder PDF, and is
+    reported with fetched=False and the last HTTP status code seen. With a
+    pdf_cache, a problem whose content was rendered before is not laid out again.
+    """
+    result, parsed = _fetch_stage(contest_id, problem, mode, cache, refresh_cache, parallel_probe,
+                                  pdf_cache, output_dir, theme, max_pages)
+    if parsed is None:
+        return result
 
-        # Create difficulty badge if rating is available
-        difficulty_html = ""
-        if problem_rating > 0:
-            difficulty_html = difficulty_badge_html(problem_rating)
-            
-        # Create improved header with centered title, difficulty badge, and proper formatting
-        header = f"""
-        <div class="header" style="text-align: center; margin-bottom: 20px;">
-            <div class="title" style="font-size: 1.5em; font-weight: bold; margin-bottom: 10px;">{title_text}</div>
-            {difficulty_html}
-            <div style="margin: 10px auto; text-align: center;">
-                <div class="time-limit" style="display: inline-block; margin-right: 10px;">{time_limit}</div>
-                <div class="memory-limit" style="display: inline-block;">{memory_limit}</div>
-            </div>
-            <div style="margin: 5px auto;">
-                <div class="input-file" style="display: inline-block; margin-right: 10px;">input: standard input</div>
-                <div class="output-file" style="display: inline-block;">output: standard output</div>
-            </div>
-        </div>
-        """
+    debug("building pdf")
+    result.record_layout(output_dir, build_pdf(parsed, output_dir, result.file_name, mode, theme, max_pages))
+    if pdf_cache is not None and result.cache_key and not result.degraded:
+        pdf_cache.put(result.cache_key, result.path)
+    return result
+
+
+_render_pool: Optional["ProcessPoolExecutor"] = None
+_render_pool_workers = 0
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool(workers: int) -> "ProcessPoolExecutor":
+    """
+    Return the process-wide PDF rendering pool, resizing it if a different worker count is requested.
+
+    Workers are started through a fork server (spawned where there is none),
+    never forked from this process: the web app and the daemon fork from
+    several threads, and a child could inherit a lock another thread holds.
+    The settings configure() applied are handed to each worker.
+    """
+    global _render_pool, _render_pool_workers
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    with _render_pool_lock:
+        if _render_pool is None or _render_pool_workers != workers:
+            if _render_pool is not None:
+                _render_pool.shutdown(wait=True)
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _render_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method),
+                                               initializer=_init_render_worker,
+                                               initargs=(HTML_PARSER, CACHE_PATH, METADATA_API))
+            _render_pool_workers = workers
+        return _render_pool
+
+
+def _init_render_worker(html_parser: str, cache_path: str, metadata_api: bool):
+    global HTML_PARSER, CACHE_PATH, METADATA_API
+    HTML_PARSER, CACHE_PATH, METADATA_API = html_parser, cache_path, metadata_api
+
+
+def _build_pdf_in_worker(problem: Problem, output_dir: str, file_name: str, mode: Mode, theme: str,
+                         max_pages: int) -> Tuple[PdfLayout, dict]:
+    """build_pdf for the render pool; also returns the worker's metrics so the parent can merge them."""
+    metrics = get_metrics()
+    metrics.reset()  # a worker lays out many problems; report this one's numbers only
+    layout = build_pdf(problem, output_dir, file_name, mode, theme, max_pages)
+    return layout, metrics.export()
+
+
+def shutdown_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=True)
+            _render_pool = None
+
+
+def convert_problems(contest_id, problems: List[str], mode: Mode = Mode.DEFAULT, output_dir: str = ".",
+                     cache: Optional[PageCache] = None, refresh_cache: bool = False,
+                     parallel_probe: bool = False, workers: int = 1,
+                     pdf_cache: Optional[PdfCache] = None,
+                     progress: Optional[Callable[[ConversionResult], None]] = None,
+                     theme: str = DEFAULT_THEME, max_pages: int = 0) -> List[ConversionResult]:
+    """Convert several problems of one contest; see convert_batch."""
+    return convert_batch([(contest_id, problem) for problem in problems], mode, output_dir, cache=cache,
+                         refresh_cache=refresh_cache, parallel_probe=parallel_probe, workers=workers,
+                         pdf_cache=pdf_cache, progress=progress, theme=theme, max_pages=max_pages)
+
+
+def convert_batch(problems: List[Tuple[int, str]], mode: Mode = Mode.DEFAULT, output_dir: str = ".",
+                  cache: Optional[PageCache] = None, refresh_cache: bool = False,
+                  parallel_probe: bool = False, workers: int = 1,
+                  pdf_cache: Optional[PdfCache] = None,
+                  progress: Optional[Callable[[ConversionResult], None]] = None,
+                  theme: str = DEFAULT_THEME, max_pages: int = 0) -> List[ConversionResult]:
+    """
+    Convert (contest_id, problem) pairs, from any number of contests, inside the current process.
+
+    This is the library entry point for callers such as the web app: imports,
+    the HTTP connection pool and the URL pattern memory stay warm across
+    problems. A failure in one problem is recorded in its result and does not
+    stop the others.
+
+    With workers > 1, PDF layout runs in a pool of worker processes: problems
+    are fetched one after another here while earlier problems are still being
+    laid out, so network time of problem N+1 overlaps layout of problem N.
+
+    progress, if given, is called with each problem's result as soon as that
+    problem is finished (successfully or not), in the order of problems; with
+    workers > 1 finished layouts are reported while later problems are still
+    being fetched.
 
-        # Replace or insert header
-        if title_div:
-            title_div.replace_with(bs4.BeautifulSoup(header, "html.parser"))
+    Returns:
+        One ConversionResult per requested problem, in the same order
+    """
+    if workers <= 1:
+        results = []
+        for contest_id, problem in problems:
+            try:
+                results.append(convert_problem(contest_id, problem, mode, output_dir, cache=cache,
+                                               refresh_cache=refresh_cache, parallel_probe=parallel_probe,
+                                               pdf_cache=pdf_cache, theme=theme, max_pages=max_pages))
+            except Exception as e:
+                warning(f"Error converting problem {contest_id}{problem}: {e}")
+                problem = problem.strip().upper()
+                results.append(ConversionResult(contest_id, problem, f"{contest_id}{problem}.pdf", error=str(e)))
+            if progress is not None:
+                progress(results[-1])
+        return results
+
+    pool = get_render_pool(workers)
+    results: List[ConversionResult] = []
+    # Problems fetched but not yet reported, in submission order; at most 2 * workers
+    # layouts are in flight so fetching never runs far ahead of the pool
+    window: Deque[Tuple[ConversionResult, Optional["Future"]]] = deque()
+
+    def finish(result: ConversionResult, future: Optional["Future"]) -> None:
+        if future is not None:
+            try:
+                layout, exported = future.result()
+                get_metrics().merge(exported)
+                result.record_layout(output_dir, layout)
+                if pdf_cache is not None and result.cache_key and not result.degraded:
+                    pdf_cache.put(result.cache_key, result.path)
+            except Exception as e:
+                warning(f"Error rendering problem {result.contest_id}{result.problem}: {e}")
+                result.error = str(e)
+        if progress is not None:
+            progress(result)
+
+    for contest_id, problem in problems:
+        try:
+            result, parsed = _fetch_stage(contest_id, problem, mode, cache, refresh_cache, parallel_probe,
+                                          pdf_cache, output_dir, theme, max_pages)
+            future = None
+            if parsed is not None:
+                future = pool.submit(_build_pdf_in_worker, parsed, output_dir, result.file_name, mode, theme,
+                                     max_pages)
+        except Exception as e:
+            warning(f"Error converting problem {contest_id}{problem}: {e}")
+            problem = problem.strip().upper()
+            result, future = ConversionResult(contest_id, problem, f"{contest_id}{problem}.pdf", error=str(e)), None
+        results.append(result)
+        window.append((result, future))
+        # Report finished problems in submission order while the next ones are still being fetched
+        while window and (len(window) > 2 * workers or window[0][1] is None or window[0][1].done()):
+            finish(*window.popleft())
+
+    while window:
+        finish(*window.popleft())
+    return results
+
+
+def batch_status(result: ConversionResult) -> str:
+    """One-word outcome of a converted problem, as shown in the batch summary."""
+    if result.error is not None or (result.fetched and result.path is None):
+        return "failed"
+    if not result.fetched:
+        return "not found"  # only the placeholder PDF was written
+    return "cached" if result.cached else "rendered"
+
+
+def batch_summary(results: List[ConversionResult], elapsed: float) -> str:
+    """Human readable summary of a batch: one line per problem (with page count and size), then the totals."""
+    lines = []
+    for result in results:
+        status = batch_status(result)
+        if status == "failed":
+            detail = result.error or "no PDF written"
+        elif status == "not found":
+            detail = f"HTTP {result.status_code}" if result.status_code else "unreachable"
         else:
-            first_element = bs.find()
-            if first_element:
-                first_element.insert_before(bs4.BeautifulSoup(header, "html.parser"))
+            detail = result.path
+        rating = str(result.rating) if result.rating else "-"
+        pages = f"{result.pages}p" if result.pages else "-"
+        size = f"{result.size / 1024:.0f} KiB" if result.size else "-"
+        lines.append(f"  {f'{result.contest_id}{result.problem}':<9} {status:<9} {rating:>5} {pages:>4} {size:>8}  {detail}")
+    counts = {}
+    for result in results:
+        counts[batch_status(result)] = counts.get(batch_status(result), 0) + 1
+    totals = ", ".join(f"{count} {status}" for status, count in counts.items())
+    lines.append(f"{len(results)} problems in {elapsed:.1f}s: {totals}; "
+                 f"{sum(result.pages for result in results)} pages laid out in "
+                 f"{sum(result.layout_seconds for result in results):.1f}s, "
+                 f"{sum(result.size for result in results) / (1024 * 1024):.1f} MiB of PDFs")
+    return "\n".join(lines)
+
+
+def write_batch_report(results: List[ConversionResult], elapsed: float, path: str) -> Path:
+    """Save the outcome of a batch as JSON, for scripts that post-process a training set."""
+    report = {
+        "elapsed": round(elapsed, 3),
+        "problems": [dict(asdict(result), status=batch_status(result)) for result in results],
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return path
+
+
+def build_profile(metrics: Metrics, elapsed: float) -> dict:
+    """Stage timings (slowest first, with the mean of each stage) and counters of a run, as saved by --profile."""
+    exported = metrics.export()
+    profile = {
+        "elapsed": round(elapsed, 6),
+        "stages": {
+            name: {"count": stats["count"], "total": round(stats["total"], 6),
+                   "mean": round(stats["total"] / stats["count"], 6) if stats["count"] else 0.0,
+                   "max": round(stats["max"], 6)}
+            for name, stats in sorted(exported["stages"].items(), key=lambda item: -item[1]["total"])
+        },
+        "counters": exported["counters"],
+    }
+    if _fetcher is not None:
+        profile["http"] = _fetcher.stats.as_dict()
+    return profile
+
+
+def convert_booklet(contest_id, problems: List[str], mode: Mode = Mode.DEFAULT, output_dir: str = ".",
+                    cache: Optional[PageCache] = None, refresh_cache: bool = False,
+                    parallel_probe: bool = False, file_name: Optional[str] = None,
+                    pdf_cache: Optional[PdfCache] = None,
+                    progress: Optional[Callable[[ConversionResult], None]] = None,
+                    theme: str = DEFAULT_THEME) -> Tuple[Optional[str], List[ConversionResult]]:
+    """
+    Fetch several problems and lay them out as one contest booklet PDF.
+
+    progress, if given, is called with each problem's result once it has been
+    fetched (path still None) and again after the booklet is written.
+
+    Returns:
+        Tuple of (booklet path or None if nothing could be rendered, one ConversionResult per problem)
+    """
+    file_name = file_name or f"contest_{contest_id}.pdf"
+    results = []
+    parsed_problems = []
+    raw_problems = []
+    for problem in problems:
+        try:
+            parsed, fetched, status = _extract_problem(
+                contest_id, problem, cache, refresh_cache, parallel_probe, PROBE_FAN_OUT)
+            result = ConversionResult(contest_id, parsed.problem, file_name,
+                                      rating=parsed.rating, fetched=fetched, status_code=status)
+            raw_problems.append(parsed)
+        except Exception as e:
+            warning(f"Error converting problem {contest_id}{problem}: {e}")
+            problem = problem.strip().upper()
+            result = ConversionResult(contest_id, problem, file_name, error=str(e))
+        results.append(result)
+        if progress is not None:
+            progress(result)
+
+    if not raw_problems:
+        return None, results
+
+    path = os.path.join(output_dir, file_name)
+    cache_key = None
+    cached_pdf = None
+    if pdf_cache is not None and all(result.fetched for result in results if result.error is None):
+        cache_key = render_cache_key(raw_problems, mode, theme, booklet=True)
+        cached_pdf = None if refresh_cache else pdf_cache.get(cache_key)
+
+    if cached_pdf is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(cached_pdf, path)
+        info(f"Booklet served from render cache: {path}")
+    else:
+        degraded = False
+        for parsed in raw_problems:
+            complete, parsed = prefetch_images(parsed)
+            degraded = degraded or not complete
+            rendered, parsed = render_formulas(parsed, mode)
+            if not rendered:
+                warning(f"some formulas in {parsed.contest_id}{parsed.problem} may not be rendered correctly")
+            parsed_problems.append(parsed)
+
+        debug("building booklet pdf")
+        layout = build_booklet_pdf(parsed_problems, output_dir, file_name, mode, theme=theme)
+        info(f"booklet laid out: {describe_layout(layout)}")
+        if cache_key is not None and not degraded:
+            pdf_cache.put(cache_key, path)
+    for result in results:
+        if result.error is None:
+            result.path = path
+            result.cached = cached_pdf is not None
+            if progress is not None:
+                progress(result)
+    info(f"Booklet saved to {path}")
+    return path, results
+
+
+def _source_fingerprint() -> str:
+    """Identify this version of the module, so a client never talks to a daemon running older code."""
+    st = Path(__file__).resolve().stat()
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def _daemon_config(args) -> dict:
+    """The settings a daemon fixes at startup; a request with other settings is run locally."""
+    return {"cache_dir": str(Path(args.cache_dir).resolve()), "parser": args.parser, "no_api": args.no_api}
+
+
+def _socket_path(args) -> Path:
+    return Path(args.socket) if args.socket else Path(args.cache_dir) / DAEMON_SOCKET
+
+
+class _ClientLogHandler(logging.Handler):
+    """Forwards the log records of one daemon job, from whichever thread, to the client that submitted it."""
+
+    def __init__(self, wfile, job: int):
+        super().__init__()
+        self.wfile = wfile
+        self.job = job
+
+    def emit(self, record):
+        if getattr(record, "job", None) != self.job:
+            return
+        try:
+            self.wfile.write(json.dumps({"log": record.levelno, "message": record.getMessage()}).encode() + b"\n")
+            self.wfile.flush()
+        except OSError:
+            pass  # the client went away; the job still finishes and its files are written
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    def _reply(self, message: dict):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return  # a liveness probe from another --serve
+        try:
+            request = json.loads(line)
+            args = argparse.Namespace(**request["args"])
+            cwd = request["cwd"]
+        except (ValueError, KeyError, TypeError):
+            return self._reply({"fallback": "malformed request"})
+        if request.get("version") != DAEMON_PROTOCOL_VERSION or request.get("fingerprint") != _source_fingerprint():
+            return self._reply({"fallback": "the daemon runs a different version of codeforces_to_pdf"})
+        args.cache_dir = os.path.join(cwd, args.cache_dir)
+        if _daemon_config(args) != self.server.config:
+            return self._reply({"fallback": "the daemon was started with other --cache-dir/--parser/--no-api settings"})
+        args.cache_dir = CACHE_PATH
+        args.output_dir = os.path.join(cwd, args.output_dir)
+        for name in ("load", "input_file", "report", "profile"):
+            if getattr(args, name):
+                setattr(args, name, os.path.join(cwd, getattr(args, name)))
+
+        self._reply({"accepted": True})
+        job = id(self)
+        _log_job.set(job)  # each connection is handled in its own thread, with its own context
+        log_handler = _ClientLogHandler(self.wfile, job)
+        logger.addHandler(log_handler)
+        ok = False
+        try:
+            # Jobs share the module globals and WeasyPrint state, so they run one at a time
+            with self.server.job_lock:
+                run(args)
+            ok = True
+        except SystemExit:
+            pass  # error() already logged the reason to the client
+        except Exception as e:
+            logger.exception(f"Unexpected error: {e}")
+        finally:
+            logger.removeHandler(log_handler)
+        try:
+            self._reply({"done": True, "ok": ok})
+        except OSError:
+            pass
+
+
+def serve(args):
+    """
+    Run the render daemon: keep WeasyPrint, the parsed stylesheets, the HTTP
+    client and the in-memory caches warm, and run CLI jobs sent over a Unix socket.
+
+    Args:
+        args: Parsed command line; its cache and parser settings apply to every job
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        error("the render daemon needs Unix domain sockets, which this platform does not provide")
+    path = _socket_path(args)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(str(path))
+            except OSError:
+                path.unlink()  # left behind by a daemon that did not shut down cleanly
             else:
-                html = header + html
-
-    # Format sample test sections to match 4A style
-    sample_inputs = bs.find_all('div', class_='input')
-    sample_outputs = bs.find_all('div', class_='output')
-
-    for i, (input_div, output_div) in enumerate(zip(sample_inputs, sample_outputs)):
-        # Clean up the input/output content
-        input_content = input_div.find('pre').text if input_div.find('pre') else ""
-        output_content = output_div.find('pre').text if output_div.find('pre') else ""
-
-        # Create compact samples section like in 4A
-        formatted_sample = f"""
-        <div class="sample-test">
-            <div class="section-title">Examples</div>
-            <div class="example">
-                <div class="input">
-                    <div class="title">input</div>
-                    <pre>{input_content.strip()}</pre>
-                </div>
-                <div class="output">
-                    <div class="title">output</div>
-                    <pre>{output_content.strip()}</pre>
-                </div>
-            </div>
-        </div>
-        """
+                error(f"a render daemon is already listening on {path}")
+
+    started = time.perf_counter()
+    for theme in THEMES:
+        get_pdf_stylesheets(theme_stylesheets(theme))
+        get_pdf_stylesheets(theme_stylesheets(theme, booklet=True))
+        for template in ("problem.html", "document.html", "booklet.html"):
+            get_pdf_template(template, theme)
+    get_fetcher()
+    get_problem_index()
+    info(f"renderer warmed up in {time.perf_counter() - started:.2f}s")
+
+    server = socketserver.ThreadingUnixStreamServer(str(path), _DaemonHandler)
+    server.daemon_threads = True
+    server.config = _daemon_config(args)
+    server.job_lock = threading.Lock()
+    os.chmod(path, 0o600)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    info(f"render daemon listening on {path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
 
-        # Replace with new format
-        new_sample = bs4.BeautifulSoup(formatted_sample, "html.parser")
-        input_div.replace_with(new_sample)
-
-        # Remove the original output div
-        output_div.extract()
-
-    # Handle note sections to match 4A style
-    note_divs = bs.find_all('div', class_='note')
-    for note_div in note_divs:
-        note_content = note_div.decode_contents()
-        formatted_note = f"""
-        <div class="note-section">
-            <div class="section-title">Note</div>
-            <div class="note-content">{note_content}</div>
-        </div>
-        """
-        note_div.replace_with(bs4.BeautifulSoup(formatted_note, "html.parser"))
-
-    # Get the modified HTML
-    if len(bs.contents) > 0:
-        html = bs.decode_contents()
-
-    # Create the complete HTML with improved styling including Cuprum font and difficulty badge
-    complete_html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <title>Codeforces Problem</title>
-        <style>
-            /* Import Cuprum font for authentic Codeforces appearance */
-            @import url('https://fonts.googleapis.com/css2?family=Cuprum:wght@400;500;700&family=Roboto:wght@400;700&family=Source+Code+Pro:wght@400;500&display=swap');
-
-            /* Base styling */
-            body {{
-                font-family: 'Cuprum', 'Roboto', sans-serif;
-                font-size: 15px;
-                line-height: 1.5;
-                margin: 0;
-                padding: 20px;
-                color: #333;
-                background-color: #fff;
-            }}
-
-            /* Header elements */
-            .header {{
-                margin-bottom: 25px;
-                border-bottom: 1px solid #e1e1e1;
-                padding-bottom: 15px;
-            }}
-
-            .title {{
-                font-family: 'Cuprum', sans-serif;
-                font-size: 22px;
-                font-weight: 700;
-                margin-bottom: 10px;
-                color: #1a1a1a;
-                text-align: center;
-            }}
-
-            .time-limit, .memory-limit, .input-file, .output-file {{
-                font-size: 15px;
-                margin-bottom: 5px;
-                color: #333;
-            }}
-
-            /* Problem statement container */
-            .problem-statement {{
-                max-width: 800px;
-                margin: 0 auto;
-            }}
-
-            /* Section headings */
-            .section-title {{
-                font-family: 'Cuprum', sans-serif;
-                font-weight: 700;
-                font-size: 18px;
-                margin-top: 25px;
-                margin-bottom: 12px;
-                color: #1a1a1a;
-                border-bottom: 1px solid #f0f0f0;
-                padding-bottom: 5px;
-            }}
-
-            /* Input/output blocks */
-            .input, .output {{
-                margin-bottom: 15px;
-            }}
-
-            .input .title, .output .title {{
-                font-weight: 700;
-                margin-bottom: 6px;
-                color: #333;
-                font-size: 16px;
-            }}
-            
-            /* Codeforces specific input/output styling */
-            .input-specification, .output-specification {{
-                margin-bottom: 20px;
-            }}
-            
-            /* Ensure proper code block spacing */
-            .input-file, .output-file {{
-                font-family: 'Source Code Pro', monospace;
-                color: #444;
-            }}
-
-            /* Code/pre blocks with better styling */
-            pre {{
-                background-color: #f8f8f8;
-                border: 1px solid #e1e1e1;
-                border-radius: 4px;
-                padding: 10px;
-                white-space: pre-wrap;
-                font-family: 'Source Code Pro', 'Courier New', monospace;
-                font-size: 14px;
-                line-height: 1.4;
-                overflow-x: auto;
-            }}
-            
-            /* Fix Codeforces sample test formatting */
-            .sample-test pre {{
-                margin: 0.5em 0;
-                padding: 0.5em;
-                background-color: #f0f0f0;
-                border: 1px solid #ccc;
-            }}
-
-            /* Notes section */
-            .note-section {{
-                margin-top: 25px;
-                padding: 12px;
-                background-color: #f8f9fa;
-                border-radius: 4px;
-                border-left: 3px solid #555;
-            }}
-
-            .note-content {{
-                margin-top: 6px;
-            }}
-
-            /* Examples with better border and spacing */
-            .example {{
-                margin-bottom: 20px;
-                padding: 5px;
-                border-radius: 4px;
-            }}
-            
-            /* Sample tests container */
-            .sample-test {{
-                margin-top: 25px;
-                margin-bottom: 30px;
-            }}
-            
-            /* Improved table-like layout for examples */
-            .example {{
-                display: flex;
-                flex-wrap: wrap;
-                gap: 20px;
-                margin-bottom: 20px;
-            }}
-            
-            .example .input, .example .output {{
-                flex: 1;
-                min-width: 45%;
-            }}
-            
-            /* Difficulty badge styling */
-            .difficulty-badge {{
-                display: inline-block; 
-                padding: 4px 10px; 
-                border-radius: 4px; 
-                font-weight: bold;
-                font-size: 14px;
-                margin: 8px 0; 
-                color: white;
-                text-align: center;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-            }}
-            
-            /* Math formatting */
-            .math-inline, .math-display {{
-                font-style: italic;
-            }}
-            
-            .math-display {{
-                display: block;
-                text-align: center;
-                margin: 15px 0;
-            }}
-            
-            /* Add styling for the fraction display */
-            .fraction {{
-                display: inline-block;
-                vertical-align: middle;
-                text-align: center;
-            }}
-            
-            .numerator, .denominator {{
-                display: block;
-            }}
-            
-            .numerator {{
-                border-bottom: 1px solid #000;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="problem-statement">
-            {html}
-        </div>
-    </body>
-    </html>
-    """
-
-    # Write the PDF using clean styling similar to 4A
-    HTML(string=complete_html, base_url="").write_pdf(
-        p / file_name,
-        # Use simple inline styling instead of external CSS files for more control
-    )
-    
 
-def main():
-    args = parse_args()
+def run_in_daemon(args) -> bool:
+    """
+    Hand the job to a running render daemon and relay its log.
 
-    contest_id = args.contest_id
-    problem = args.problem
+    Returns:
+        False if no daemon is listening or it cannot take this job; the caller
+        then runs it in-process
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return False
+    path = _socket_path(args)
+    if not path.exists():
+        return False
+    request = {
+        "version": DAEMON_PROTOCOL_VERSION,
+        "fingerprint": _source_fingerprint(),
+        "cwd": os.getcwd(),
+        "args": vars(args),
+    }
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+        sock.connect(str(path))
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        stream = sock.makefile("rb")
+        reply = json.loads(stream.readline() or b"{}")
+        if not reply.get("accepted"):
+            debug(f"render daemon declined the job: {reply.get('fallback', 'no reply')}")
+            return False
+        sock.settimeout(None)  # the job itself may take minutes
+        for line in stream:
+            message = json.loads(line)
+            if "log" in message:
+                logger.log(message["log"], message["message"])
+            elif message.get("done"):
+                if not message["ok"]:
+                    sys.exit(1)
+                return True
+    except (OSError, ValueError) as e:
+        debug(f"render daemon at {path} is unavailable: {e}")
+        return False
+    finally:
+        sock.close()
+    error("render daemon closed the connection before the job finished")
+
+
+def configure(args):
+    """Apply the process-wide settings from the command line."""
+    global HTML_PARSER, CACHE_PATH, METADATA_API
+    HTML_PARSER = args.parser
+    CACHE_PATH = args.cache_dir
+    METADATA_API = not args.no_api
+
+
+def run(args):
+    """Carry out one CLI job, in this process or inside the render daemon."""
+    try:
+        targets = parse_targets(args.targets)
+        if args.input_file:
+            targets += read_targets_file(args.input_file)
+    except (OSError, ValueError) as e:
+        error(str(e))
+    run_started = time.perf_counter()
+    if args.profile:
+        get_metrics().reset()  # in the render daemon, profile this job only
     mode = Mode.DEFAULT
     if args.fast:
         mode = Mode.FAST
@@ -734,29 +3770,101 @@ def main():
         mode = Mode.GRAPHICS
     output_dir = args.output_dir
 
-    # Check for required dependencies
-    required_commands = ["tex2svg", "tex2htmlcss", "make4ht"]
-    for cmd in required_commands:
-        if subprocess.call(["which", cmd], stdout=subprocess.PIPE, stderr=subprocess.PIPE) != 0:
-            warning(f"Command {cmd} not found. Some LaTeX rendering modes may not work.")
+    cache = PageCache(args.cache_dir, ttl=args.cache_ttl, max_bytes=int(args.cache_max_mb * 1024 * 1024))
+    pdf_cache = PdfCache(args.cache_dir)
+    if args.prune_cache:
+        info(f"pruned {cache.prune()} cache entries, {pdf_cache.prune()} rendered PDFs and "
+             f"{ImageCache(args.cache_dir).prune()} images")
+        if not targets and not args.load:
+            return
+    if args.no_cache:
+        cache = None
+        pdf_cache = None
 
-    debug(f"fetching problem webpage: {contest_id=} {problem=}")
-    out_filename, html, problem_rating = extract_problem(contest_id, problem)
-    if problem_rating > 0:
-        info(f"fetched (difficulty rating: {problem_rating})")
+    # Check for required dependencies
+    if mode is not Mode.FAST:
+        for cmd in ("latex", "dvisvgm"):
+            if not have_command(cmd):
+                warning(f"Command {cmd} not found. Formulas will be typeset as text instead of graphics.")
+
+    parsed = None
+    failed = 0
+    if args.load:
+        parsed = load_problem(args.load)
+        info(f"loaded {parsed.contest_id}{parsed.problem} from {args.load}")
+    elif args.booklet:
+        contest_id, spec = targets[0]
+        try:
+            problems = expand_problems(contest_id, spec)
+        except ValueError as e:
+            error(str(e))
+        convert_booklet(contest_id, problems, mode, output_dir, cache=cache,
+                        refresh_cache=args.refresh_cache, parallel_probe=args.parallel_probe,
+                        pdf_cache=pdf_cache, theme=args.theme)
+    elif args.emit != "pdf":
+        contest_id, problem = targets[0]
+        parsed, _, _ = _extract_problem(contest_id, problem, cache, args.refresh_cache,
+                                        args.parallel_probe, PROBE_FAN_OUT)
+    elif _single_problem(targets) and not args.input_file and not args.report:
+        contest_id, problem = targets[0]
+        convert_problem(contest_id, problem, mode, output_dir, cache=cache,
+                        refresh_cache=args.refresh_cache, parallel_probe=args.parallel_probe,
+                        pdf_cache=pdf_cache, theme=args.theme, max_pages=args.max_pages)
     else:
-        info("fetched (difficulty rating unknown)")
+        started = time.perf_counter()
+        problems = []
+        for contest_id, spec in targets:
+            try:
+                problems.extend((contest_id, problem) for problem in expand_problems(contest_id, spec))
+            except ValueError as e:
+                error(str(e))
+        problems = list(dict.fromkeys(problems))
+        info(f"converting {len(problems)} problems from {len({c for c, _ in problems})} contests")
+        results = convert_batch(problems, mode, output_dir, cache=cache, refresh_cache=args.refresh_cache,
+                                parallel_probe=args.parallel_probe, workers=args.jobs, pdf_cache=pdf_cache,
+                                theme=args.theme, max_pages=args.max_pages)
+        elapsed = time.perf_counter() - started
+        for line in batch_summary(results, elapsed).splitlines():
+            info(line)
+        if args.report:
+            info(f"report saved to {write_batch_report(results, elapsed, args.report)}")
+        failed = sum(batch_status(result) in ("failed", "not found") for result in results)
+
+    if parsed is not None and args.emit != "pdf":
+        path = save_problem(parsed, Path(output_dir) / f"{parsed.contest_id}{parsed.problem}.{args.emit}")
+        info(f"problem saved to {path}")
+    elif parsed is not None:
+        _, parsed = prefetch_images(parsed)
+        rendered, parsed = render_formulas(parsed, mode)
+        if not rendered:
+            warning("some formulas may not be rendered correctly")
+        layout = build_pdf(parsed, output_dir, parsed.file_name, mode, args.theme, args.max_pages)
+        info(f"PDF saved to {os.path.join(output_dir, parsed.file_name)} ({describe_layout(layout)})")
+    if _fetcher is not None:
+        stats = _fetcher.stats
+        info(f"http: {stats.requests} requests, {stats.connections_opened} connections opened, "
+              f"{stats.connections_reused} reused")
+    if args.profile:
+        profile = build_profile(get_metrics(), time.perf_counter() - run_started)
+        path = Path(args.profile)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(profile, indent=2), encoding="utf-8")
+        info("time by stage: " + ", ".join(f"{name} {stats['total']:.2f}s" for name, stats in profile["stages"].items()))
+        info(f"profile saved to {path}")
+    if failed:
+        error(f"{failed} problems could not be converted")
 
-    debug("rendering latex")
-    rendered, html = render_formulas(html, mode)
-    if rendered:
-        info("rendered latex")
-    else:
-        warning("some formulas may not be rendered correctly")
 
-    debug("building pdf")
-    build_pdf_from_html(html, output_dir, out_filename, mode, problem_rating)
-    info(f"PDF saved to {os.path.join(output_dir, out_filename)}")
+def main():
+    args = parse_args()
+    if args.serve:
+        configure(args)
+        serve(args)
+        return
+    if not args.no_daemon and run_in_daemon(args):
+        return
+    configure(args)
+    run(args)
 
 
 if __name__ == "__main__":
@@ -767,6 +3875,9 @@ if __name__ == "__main__":
     except Exception as e:
         exception(f"Unexpected error: {e}")
     finally:
+        shutdown_render_pool()
+        if _fetcher is not None:
+            _fetcher.close()
         # Clean up temporary files
         for f in TEMP_FILES:
             try:
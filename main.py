@@ -1,20 +1,26 @@
-from flask import Flask, render_template, request, send_file, redirect, url_for, flash, jsonify
+from flask import Flask, Response, render_template, request, send_file, redirect, url_for, flash, jsonify
 import os
 import re
+import shutil
 from pathlib import Path
-import subprocess
-import tempfile
 import time
-import httpx
-from werkzeug.utils import secure_filename
 import zipfile
 import io
-import bs4
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from codeforces_to_pdf import (DEFAULT_THEME, METRICS_PREFIX, THEMES, Mode, PageCache, PdfCache, convert_booklet,
+                               convert_problems, extract_problem, get_contest_problems, get_fetcher, get_metrics)
 
 app = Flask(__name__, static_folder='static')
 app.secret_key = os.environ.get("SESSION_SECRET", "development-key")
 
-# Ensure output directory exists
+# Number of worker processes used to lay out PDFs for whole-contest downloads
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 1))
+
+# Ensure output directory exists; each job writes into its own outputs/<job id>/
 OUTPUT_DIR = "outputs"
 Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
 
@@ -42,8 +48,7 @@ def test_codeforces_access(contest_id, problem):
     
     for url in urls:
         try:
-            with httpx.Client(headers=headers, follow_redirects=True, timeout=5) as client:
-                resp = client.get(url)
+            resp = get_fetcher().get(url, headers=headers, timeout=5)
             if resp.status_code == 200:
                 # Check if the response contains problem content
                 if '<div class="problem-statement">' in resp.text:
@@ -55,101 +60,266 @@ def test_codeforces_access(contest_id, problem):
     
     return False
 
-# Function to get all problems from a contest
-def get_contest_problems(contest_id):
-    """
-    Fetches all problem IDs available in a Codeforces contest
-    
-    Args:
-        contest_id: The ID of the contest
-        
-    Returns:
-        A list of problem IDs (A, B, C, etc.)
+@app.route('/')
+def index():
+    return render_template('index.html', themes=THEMES.values(), default_theme=DEFAULT_THEME)
+
+def wants_json():
+    return request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'application/json'
+
+def convert_error(message, status=400):
+    """Report a /convert validation error as JSON for the page script, or as a flash message"""
+    if wants_json():
+        return jsonify({'success': False, 'message': message}), status
+    flash(message, 'error')
+    return redirect(url_for('index'))
+
+@dataclass
+class Job:
+    id: str
+    contest_id: int
+    problem: str
+    mode: Mode
+    all_problems: bool
+    booklet: bool
+    lane: str
+    theme: str = DEFAULT_THEME
+    max_pages: int = 0
+    status: str = 'queued'
+    message: str = ''
+    problems: dict = field(default_factory=dict)
+    artifact: str = ''
+    download_name: str = ''
+    mimetype: str = ''
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = 0.0
+    results: list = field(default_factory=list, repr=False)
+    changed: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    @property
+    def output_dir(self):
+        """Directory holding this job's PDFs, removed when the job expires"""
+        return os.path.join(OUTPUT_DIR, self.id)
+
+    @property
+    def streaming(self):
+        """Contest archives are streamed while the job runs instead of stored"""
+        return self.all_problems and not self.booklet
+
+    def update(self, result):
+        """Progress callback: record the state of one finished problem"""
+        if result.error:
+            state = 'failed'
+        elif result.path:
+            state = 'cached' if result.cached else 'done'
+        else:
+            state = 'fetched'
+        with self.changed:
+            self.problems[result.problem] = state
+            self.results.append(result)
+            self.changed.notify_all()
+
+    def finish(self):
+        with self.changed:
+            self.finished_at = time.time()
+            self.changed.notify_all()
+
+    def iter_results(self):
+        """Yield conversion results as they finish, until the job ends"""
+        index = 0
+        while True:
+            with self.changed:
+                while index >= len(self.results) and not self.finished_at:
+                    self.changed.wait(timeout=1)
+                if index >= len(self.results):
+                    return
+                result = self.results[index]
+            index += 1
+            yield result
+
+    def downloadable(self):
+        if self.streaming:
+            return self.status != 'failed'
+        return self.status == 'done'
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'message': self.message,
+            'contest_id': self.contest_id,
+            'problems': [{'problem': p, 'state': s} for p, s in self.problems.items()],
+            'completed': sum(1 for s in self.problems.values() if s in ('done', 'cached', 'failed')),
+            'total': len(self.problems),
+            'download_url': url_for('download_job', job_id=self.id) if self.downloadable() else None,
+        }
+
+# Background conversion jobs. Single problems and whole contests run on
+# separate bounded pools so a few large contests cannot starve single-problem
+# users. Job state lives in this process, so run gunicorn with one worker
+# process and several threads (e.g. --workers 1 --threads 8). Jobs fetch
+# concurrently, but layouts in this process run one at a time (WeasyPrint state
+# is shared); contest jobs lay out in the RENDER_WORKERS process pool.
+JOB_TTL = 60 * 60
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", 16))
+# Deflate level for contest archives (0 stores PDFs uncompressed)
+ZIP_COMPRESSLEVEL = int(os.environ.get("ZIP_COMPRESSLEVEL", 6))
+ZIP_CHUNK_SIZE = 64 * 1024
+JOB_WORKERS = {
+    'single': int(os.environ.get("SINGLE_JOB_WORKERS", 4)),
+    'contest': int(os.environ.get("CONTEST_JOB_WORKERS", 1)),
+}
+job_pools = {lane: ThreadPoolExecutor(max_workers=n, thread_name_prefix=f"job-{lane}") for lane, n in JOB_WORKERS.items()}
+jobs = {}
+jobs_lock = threading.Lock()
+
+def prune_jobs():
+    """Forget finished jobs older than JOB_TTL and delete their files"""
+    now = time.time()
+    with jobs_lock:
+        expired = [job for job in jobs.values() if job.finished_at and now - job.finished_at > JOB_TTL]
+        for job in expired:
+            del jobs[job.id]
+    for job in expired:
+        shutil.rmtree(job.output_dir, ignore_errors=True)
+
+class ZipSink(io.RawIOBase):
+    """Unseekable file object collecting the bytes zipfile writes, so they can be sent as they are produced"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_contest_zip(job):
+    """Generate a ZIP of the job's PDFs, adding each one as soon as it is rendered.
+
+    Only one read chunk and the compressor state are held in memory, however
+    large the contest is.
     """
-    # Try both contest and gym URLs
-    urls = [
-        f"https://codeforces.com/contest/{contest_id}",
-        f"https://codeforces.com/gym/{contest_id}"
-    ]
-    
-    headers = get_codeforces_headers()
-    
-    for url in urls:
-        try:
-            print(f"Fetching contest problems from {url}")
-            with httpx.Client(headers=headers, follow_redirects=True, timeout=10) as client:
-                resp = client.get(url)
-            
-            if resp.status_code != 200:
-                print(f"Got status code {resp.status_code} for {url}")
+    compression = zipfile.ZIP_DEFLATED if ZIP_COMPRESSLEVEL else zipfile.ZIP_STORED
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=compression, compresslevel=ZIP_COMPRESSLEVEL or None) as zf:
+        for result in job.iter_results():
+            if result.error:
+                print(f"Error processing problem {result.problem}: {result.error}")
+                # Continue with other problems even if one fails
                 continue
-                
-            # Parse the HTML to find problem links
-            soup = bs4.BeautifulSoup(resp.text, 'html.parser')
-            
-            # Different ways to find problem links
-            problem_ids = []
-            
-            # Look for problem table rows
-            problem_rows = soup.select('table.problems tr')
-            if problem_rows and len(problem_rows) > 1:  # Skip header row
-                for row in problem_rows[1:]:  # Skip header row
-                    # Find problem ID (typically first column)
-                    problem_id_cell = row.select_one('td:first-child')
-                    if problem_id_cell:
-                        problem_id = problem_id_cell.text.strip()
-                        # Usually just the letter (A, B, C, etc.)
-                        if problem_id and len(problem_id) <= 2:
-                            problem_ids.append(problem_id)
-            
-            # Alternative: look for problem links in the sidebar
-            if not problem_ids:
-                sidebar_links = soup.select('.problems a')
-                for link in sidebar_links:
-                    href = link.get('href', '')
-                    if '/problem/' in href:
-                        # Extract problem ID from URL
-                        problem_id = href.split('/')[-1].strip()
-                        if problem_id and len(problem_id) <= 2:
-                            problem_ids.append(problem_id.upper())
-            
-            # Another alternative: look for specific problem links
-            if not problem_ids:
-                all_links = soup.find_all('a')
-                for link in all_links:
-                    href = link.get('href', '')
-                    if '/problem/' in href:
-                        # Extract problem ID from URL
-                        problem_id = href.split('/')[-1].strip()
-                        if problem_id and len(problem_id) <= 2 and problem_id.upper() not in problem_ids:
-                            problem_ids.append(problem_id.upper())
-            
-            # If we found problems, return them
-            if problem_ids:
-                # Remove duplicates and sort
-                unique_problems = sorted(set(problem_ids))
-                print(f"Found problems: {unique_problems}")
-                return unique_problems
-                
-        except Exception as e:
-            print(f"Error fetching contest {contest_id}: {str(e)}")
-            continue
-    
-    # Fallback to common problem IDs if we couldn't extract them
-    print("Using fallback problem IDs (A-F)")
-    return ['A', 'B', 'C', 'D', 'E', 'F']
+            if not result.fetched or not result.path or not os.path.exists(result.path):
+                continue  # placeholder PDFs of problems that could not be fetched are left out
+            with open(result.path, 'rb') as src, zf.open(result.file_name, 'w') as dst:
+                while True:
+                    chunk = src.read(ZIP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    yield sink.drain()
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+def run_job(job):
+    job.status = 'running'
+    try:
+        Path(job.output_dir).mkdir(parents=True, exist_ok=True)
+        if job.all_problems:
+            # Fetch available problems for this contest
+            problems = get_contest_problems(job.contest_id)
+            if not problems:
+                job.status = 'failed'
+                job.message = f'Unable to find problems for contest {job.contest_id}. Please verify the contest ID.'
+                return
+            job.problems = {p.strip().upper(): 'queued' for p in problems}
+            
+            if job.booklet:
+                # Lay out the whole contest as one PDF in a single pass
+                booklet_path, results = convert_booklet(job.contest_id, problems, job.mode, job.output_dir,
+                                                        cache=PageCache(), pdf_cache=PdfCache(),
+                                                        progress=job.update, theme=job.theme)
+                if booklet_path is None or not os.path.exists(booklet_path):
+                    job.status = 'failed'
+                    job.message = 'PDF generation failed. File not found.'
+                    return
+                job.artifact = booklet_path
+                job.download_name = os.path.basename(booklet_path)
+                job.mimetype = 'application/pdf'
+                job.message = f'Booklet for contest {job.contest_id} generated successfully!'
+            else:
+                # Convert every problem; the download streams each PDF into the ZIP as it finishes
+                results = convert_problems(job.contest_id, problems, job.mode, job.output_dir, cache=PageCache(),
+                                           workers=RENDER_WORKERS, pdf_cache=PdfCache(), progress=job.update,
+                                           theme=job.theme, max_pages=job.max_pages)
+                job.mimetype = 'application/zip'
+                # Only fetched problems with a PDF go into the ZIP; placeholders are left out
+                skipped = [r.problem for r in results
+                           if r.error or not r.fetched or not r.path or not os.path.exists(r.path)]
+                if len(skipped) == len(results):
+                    job.status = 'failed'
+                    job.message = f'No problem of contest {job.contest_id} could be converted. Please verify the contest ID or try again later.'
+                    return
+                if skipped:
+                    job.message = (f'{len(results) - len(skipped)} of {len(results)} problems from contest '
+                                   f'{job.contest_id} generated; skipped {", ".join(skipped)}.')
+                else:
+                    job.message = f'All problems from contest {job.contest_id} generated successfully!'
+        else:
+            job.problems = {job.problem: 'queued'}
+            result = convert_problems(job.contest_id, [job.problem], job.mode, job.output_dir, cache=PageCache(),
+                                      pdf_cache=PdfCache(), progress=job.update, theme=job.theme,
+                                      max_pages=job.max_pages)[0]
+            if result.error:
+                job.status = 'failed'
+                job.message = f'Error during conversion: {result.error}'
+                return
+            if not result.path or not os.path.exists(result.path):
+                job.status = 'failed'
+                job.message = 'PDF generation failed. File not found.'
+                return
+            # Check for 403 errors specifically 
+            if not result.fetched and result.status_code == 403:
+                job.status = 'failed'
+                job.message = 'Unable to access Codeforces (403 Forbidden). Codeforces might be blocking our requests. Try a different contest or problem, or try again later.'
+                return
+            # Other placeholder PDF checks
+            elif not result.fetched:
+                job.status = 'failed'
+                job.message = f'Unable to fetch problem {job.contest_id}{job.problem} from Codeforces. Please verify the Contest ID and Problem ID are correct.'
+                return
+            job.artifact = result.path
+            job.download_name = result.file_name
+            job.mimetype = 'application/pdf'
+            job.message = f'PDF for problem {job.contest_id}{job.problem} generated successfully!'
+        job.status = 'done'
+    except Exception as e:
+        print(f"Job {job.id} failed: {str(e)}")
+        job.status = 'failed'
+        job.message = f'Unexpected error: {str(e)}'
+    finally:
+        job.finish()
 
 @app.route('/convert', methods=['POST'])
 def convert():
+    """Validate a conversion request and queue it as a background job"""
     contest_id = request.form.get('contest_id')
     problem = request.form.get('problem')
     problem_url = request.form.get('problem_url')
     mode = request.form.get('mode', 'default')
+    theme = request.form.get('theme', DEFAULT_THEME)
+    max_pages = request.form.get('max_pages') or '0'
     all_problems = request.form.get('all_problems') == 'true'
+    booklet = request.form.get('booklet') == 'true'
     
     # Process URL if provided
     if problem_url:
@@ -169,131 +339,84 @@ def convert():
                 break
     
     if not contest_id:
-        flash('Contest ID is required', 'error')
-        return redirect(url_for('index'))
+        return convert_error('Contest ID is required')
     
     try:
         contest_id = int(contest_id)
     except ValueError:
-        flash('Contest ID must be a number', 'error')
-        return redirect(url_for('index'))
+        return convert_error('Contest ID must be a number')
     
     # Check if we are downloading a single problem or all problems
     if not all_problems and not problem:
-        flash('Problem ID is required for single problem download', 'error')
-        return redirect(url_for('index'))
+        return convert_error('Problem ID is required for single problem download')
     
-    # Map mode string to command-line args
-    mode_arg = ""
-    if mode == "fast":
-        mode_arg = "-f"
-    elif mode == "graphics":
-        mode_arg = "-g"
-    
-    if all_problems:
-        # Fetch available problems for this contest
-        problems = get_contest_problems(contest_id)
-        
-        if not problems:
-            flash(f'Unable to find problems for contest {contest_id}. Please verify the contest ID.', 'error')
-            return redirect(url_for('index'))
-        
-        # Create a zip file to store all PDFs
-        import zipfile
-        import io
-        
-        memory_file = io.BytesIO()
-        with zipfile.ZipFile(memory_file, 'w') as zf:
-            for problem_id in problems:
-                # Call the codeforces_to_pdf.py script for each problem
-                cmd = ['python', 'codeforces_to_pdf.py', str(contest_id), problem_id]
-                if mode_arg:
-                    cmd.append(mode_arg)
-                cmd.extend(['-d', OUTPUT_DIR])
-                
-                try:
-                    # Run the conversion process
-                    process = subprocess.run(cmd, capture_output=True, text=True, check=True)
-                    output_file = f"{contest_id}{problem_id}.pdf"
-                    output_path = os.path.join(OUTPUT_DIR, output_file)
-                    
-                    if os.path.exists(output_path):
-                        # Add the PDF to the zip file
-                        zf.write(output_path, output_file)
-                except Exception as e:
-                    print(f"Error processing problem {problem_id}: {str(e)}")
-                    # Continue with other problems even if one fails
-                    continue
-        
-        # Reset the file pointer
-        memory_file.seek(0)
-        
-        # Add a "success" flash message  
-        flash(f'All problems from contest {contest_id} generated successfully!', 'success')
-        
-        # Send the zip file
-        return send_file(
-            memory_file,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"contest_{contest_id}_problems.zip"
-        )
-    else:
-        # Single problem case
+    if not all_problems:
         # Ensure problem ID is alphanumeric and properly formatted
         problem = problem.strip().upper()
         if not re.match(r'^[A-Z0-9]{1,2}$', problem):
-            flash('Problem ID must be a letter or alphanumeric code (e.g., A, B, C)', 'error')
-            return redirect(url_for('index'))
-            
-        # Call the codeforces_to_pdf.py script
-        cmd = ['python', 'codeforces_to_pdf.py', str(contest_id), problem]
-        if mode_arg:
-            cmd.append(mode_arg)
-        cmd.extend(['-d', OUTPUT_DIR])
-        
-        try:
-            # Run the conversion process with output capture
-            process = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            output_file = f"{contest_id}{problem}.pdf"
-            output_path = os.path.join(OUTPUT_DIR, output_file)
-            
-            if os.path.exists(output_path):
-                # Check if this is a placeholder PDF (indicating failure)
-                file_size = os.path.getsize(output_path)
-                output = process.stdout
-                
-                # Check for 403 errors specifically 
-                if "returned status code 403" in output and "All URLs failed" in output:
-                    flash(f'Unable to access Codeforces (403 Forbidden). Codeforces might be blocking our requests. Try a different contest or problem, or try again later.', 'error')
-                    return redirect(url_for('index'))
-                # Other placeholder PDF checks
-                elif "Generating placeholder PDF" in output and file_size < 10000:
-                    flash(f'Unable to fetch problem {contest_id}{problem} from Codeforces. Please verify the Contest ID and Problem ID are correct.', 'error')
-                    return redirect(url_for('index'))
-                
-                # Add a "success" flash message  
-                flash(f'PDF for problem {contest_id}{problem} generated successfully! Returning to home page after download starts.', 'success')
-                
-                # Set a response header to redirect after download
-                response = send_file(output_path, 
-                                mimetype='application/pdf',
-                                as_attachment=True,
-                                download_name=output_file)
-                
-                # This JavaScript will redirect back to the index page after download starts
-                response.headers["Content-Disposition"] = f"attachment; filename={output_file}; redirect-url={url_for('index')}"
-                
-                return response
-            else:
-                flash('PDF generation failed. File not found.', 'error')
-                return redirect(url_for('index'))
-        except subprocess.CalledProcessError as e:
-            flash(f'Error during conversion: {e.stderr}', 'error')
-            return redirect(url_for('index'))
-        except Exception as e:
-            flash(f'Unexpected error: {str(e)}', 'error')
-            return redirect(url_for('index'))
+            return convert_error('Problem ID must be a letter or alphanumeric code (e.g., A, B, C)')
+    
+    if theme not in THEMES:
+        return convert_error(f'Unknown layout: {theme}')
+    try:
+        max_pages = int(max_pages)
+    except ValueError:
+        return convert_error('Page limit must be a number')
+    if max_pages < 0:
+        return convert_error('Page limit must not be negative')
+    
+    # Map mode string to rendering mode
+    mode = {'fast': Mode.FAST, 'graphics': Mode.GRAPHICS}.get(mode, Mode.DEFAULT)
+    
+    prune_jobs()
+    lane = 'contest' if all_problems else 'single'
+    job = Job(id=uuid.uuid4().hex, contest_id=contest_id, problem=problem or '', mode=mode,
+              all_problems=all_problems, booklet=booklet, lane=lane, theme=theme, max_pages=max_pages)
+    if job.streaming:
+        job.download_name = f"contest_{contest_id}_problems.zip"
+        job.mimetype = 'application/zip'
+    with jobs_lock:
+        # Backpressure: refuse new work while this lane's queue is full
+        pending = sum(1 for j in jobs.values() if j.lane == lane and j.status in ('queued', 'running'))
+        if pending >= MAX_QUEUED_JOBS:
+            response = jsonify({'success': False, 'message': 'The converter is busy. Please try again in a minute.'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '30'
+            return response
+        jobs[job.id] = job
+    job_pools[lane].submit(run_job, job)
+    
+    response = jsonify({'success': True, **job.to_dict(), 'status_url': url_for('job_status', job_id=job.id)})
+    response.status_code = 202
+    response.headers['Location'] = url_for('job_status', job_id=job.id)
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Progress of a conversion job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown job'}), 404
+    return jsonify({'success': job.status != 'failed', **job.to_dict()})
+
+@app.route('/jobs/<job_id>/download')
+def download_job(job_id):
+    """Serve the PDF produced by a finished job, or stream a contest ZIP while it is produced"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown job'}), 404
+    if not job.downloadable():
+        return jsonify({'success': False, **job.to_dict()}), 409
+    if job.streaming:
+        # No Content-Length: the archive goes out chunked as problems finish
+        return Response(stream_contest_zip(job),
+                        mimetype=job.mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={job.download_name}',
+                                 'X-Accel-Buffering': 'no'})
+    return send_file(job.artifact,
+                     mimetype=job.mimetype,
+                     as_attachment=True,
+                     download_name=job.download_name)
 
 @app.route('/check-availability', methods=['POST'])
 def check_availability():
@@ -321,162 +444,66 @@ def check_availability():
     # Standardize problem ID
     problem = problem.strip().upper()
     
-    # List of URLs to try
-    urls = [
-        f"https://codeforces.com/contest/{contest_id}/problem/{problem}",
-        f"https://codeforces.com/problemset/problem/{contest_id}/{problem}",
-        f"https://codeforces.com/gym/{contest_id}/problem/{problem}"
-    ]
+    # Extract title, time limit, and memory limit
+    def extract_problem_details(parsed):
+        time_match = re.search(r'(\d+(?:\.\d+)?)', parsed.time_limit)
+        memory_match = re.search(r'(\d+)', parsed.memory_limit)
+        return {
+            'title': parsed.title or f"Problem {contest_id}{problem}",
+            'time_limit': f"{time_match.group(1)} second(s)" if time_match else "1 second",
+            'memory_limit': f"{memory_match.group(1)} MB" if memory_match else "256 MB"
+        }
     
-    headers = get_codeforces_headers()
+    # Fetch through the shared problem store, so the conversion that usually
+    # follows reuses this page instead of downloading it again
+    try:
+        parsed = extract_problem(contest_id, problem, cache=PageCache())
+    except Exception as e:
+        print(f"Error accessing problem {contest_id}{problem}: {str(e)}")
+        parsed = None
     
-    import bs4
-    import re
+    if parsed is None or parsed.placeholder:
+        return jsonify({'success': False, 'message': f'Problem {contest_id}{problem} could not be accessed'})
     
-    # Function to extract rating if available
-    def extract_rating(html):
-        try:
-            soup = bs4.BeautifulSoup(html, 'html.parser')
-            
-            # Method 1: Look for spans with "Difficulty:" text
-            for span in soup.find_all('span'):
-                if span.text and "Difficulty:" in span.text:
-                    sibling = span.find_next_sibling("span")
-                    if sibling and sibling.text.strip().isdigit():
-                        return int(sibling.text.strip())
-            
-            # Method 2: Check for color classes (common in older problems)
-            for color_class in ['red', 'orange', 'violet', 'blue', 'cyan', 'green']:
-                if soup.select_one(f".{color_class}"):
-                    # Approximate ratings based on color class
-                    ratings = {'red': 2100, 'orange': 1900, 'violet': 1700, 
-                              'blue': 1500, 'cyan': 1300, 'green': 1100}
-                    return ratings.get(color_class, 0)
-            
-            # Method 3: Try problem ID based rating estimation
-            # Many standard problems have consistent ratings 
-            # (especially div2 contest problems)
-            if problem in ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']:
-                # Estimate based on common contest problem ratings
-                estimates = {
-                    'A': 800, 
-                    'B': 1200,
-                    'C': 1500,
-                    'D': 1800,
-                    'E': 2000,
-                    'F': 2200,
-                    'G': 2400,
-                    'H': 2700
-                }
-                return estimates.get(problem, 0)
-                
-            # Method 4: Try to find rating in page text
-            rating_patterns = [
-                r'difficulty[:\s]*(\d{3,4})',
-                r'rated[:\s]*(\d{3,4})',
-                r'level[:\s]*(\d{3,4})'
-            ]
-            
-            for pattern in rating_patterns:
-                match = re.search(pattern, html, re.IGNORECASE)
-                if match:
-                    rating = int(match.group(1))
-                    if 800 <= rating <= 3500:  # Valid Codeforces rating range
-                        return rating
-            
-            # Common and famous problems by problem number
-            if contest_id == 4 and problem == 'A':  # Watermelon
-                return 800
-            elif contest_id == 1 and problem == 'A':  # Theatre Square
-                return 1000
-            elif contest_id == 158 and problem == 'A':  # Next Round
-                return 800
-            elif contest_id == 231 and problem == 'A':  # Team
-                return 800
-            elif contest_id == 71 and problem == 'A':  # Way Too Long Words
-                return 800
-                
-            print("No rating found for this problem")
-            return 0
-        except Exception as e:
-            print(f"Error extracting rating: {str(e)}")
-            return 0
+    # Extract problem details
+    details = extract_problem_details(parsed)
+    # Exact rating from the Codeforces API index, or from the page when the API does not know the problem
+    rating = parsed.rating
     
-    # Extract title, time limit, and memory limit
-    def extract_problem_details(html):
-        try:
-            soup = bs4.BeautifulSoup(html, 'html.parser')
-            
-            # Extract title
-            title_div = soup.find('div', class_='title')
-            title = title_div.text.strip() if title_div else f"Problem {contest_id}{problem}"
-            
-            # Extract time and memory limits
-            time_pattern = re.compile(r'time limit[^:]*:\s*(\d+(?:\.\d+)?)\s*(?:second|s)', re.IGNORECASE)
-            memory_pattern = re.compile(r'memory limit[^:]*:\s*(\d+)\s*(?:megabytes|MB)', re.IGNORECASE)
-            
-            time_match = time_pattern.search(html)
-            memory_match = memory_pattern.search(html)
-            
-            time_limit = f"{time_match.group(1)} second(s)" if time_match else "1 second"
-            memory_limit = f"{memory_match.group(1)} MB" if memory_match else "256 MB"
-            
-            return {
-                'title': title,
-                'time_limit': time_limit,
-                'memory_limit': memory_limit
-            }
-        except Exception as e:
-            print(f"Error extracting problem details: {str(e)}")
-            return {
-                'title': f"Problem {contest_id}{problem}",
-                'time_limit': "1 second",
-                'memory_limit': "256 MB"
-            }
-    
-    # Try each URL
-    print(f"Trying URLs: {urls}")
-    for url in urls:
-        try:
-            print(f"Trying URL: {url}")
-            with httpx.Client(headers=headers, follow_redirects=True, timeout=10) as client:
-                resp = client.get(url)
-            
-            print(f"Response status: {resp.status_code}")
-            
-            if resp.status_code == 200:
-                # Check if the response contains problem content
-                has_problem_statement = '<div class="problem-statement">' in resp.text
-                has_problem_index = '.problemindexholder' in resp.text
-                print(f"Has problem statement: {has_problem_statement}, Has problem index: {has_problem_index}")
-                
-                if has_problem_statement or has_problem_index:
-                    # Extract problem details
-                    details = extract_problem_details(resp.text)
-                    rating = extract_rating(resp.text)
-                    
-                    print(f"Problem details: {details}")
-                    print(f"Rating: {rating}")
-                    
-                    result = {
-                        'success': True, 
-                        'message': 'Problem is available',
-                        'title': details['title'],
-                        'time_limit': details['time_limit'],
-                        'memory_limit': details['memory_limit'],
-                        'rating': rating
-                    }
-                    print(f"Returning result: {result}")
-                    return jsonify(result)
-                else:
-                    print("Response doesn't contain problem content")
-            else:
-                print(f"Invalid response status: {resp.status_code}")
-        except Exception as e:
-            print(f"Error accessing {url}: {str(e)}")
-            continue
+    print(f"Problem details: {details}")
+    print(f"Rating: {rating}")
     
-    return jsonify({'success': False, 'message': f'Problem {contest_id}{problem} could not be accessed'})
+    result = {
+        'success': True, 
+        'message': 'Problem is available',
+        'title': details['title'],
+        'time_limit': details['time_limit'],
+        'memory_limit': details['memory_limit'],
+        'rating': rating
+    }
+    print(f"Returning result: {result}")
+    return jsonify(result)
+
+@app.route('/http-stats')
+def http_stats():
+    """Connection reuse statistics of the shared Codeforces HTTP client"""
+    fetcher = get_fetcher()
+    return jsonify({'http2': fetcher.http2, **fetcher.stats.as_dict()})
+
+@app.route('/metrics')
+def metrics():
+    """Stage timings, cache and HTTP counters and job counts in the Prometheus text format"""
+    with jobs_lock:
+        counts = {}
+        for job in jobs.values():
+            counts[(job.lane, job.status)] = counts.get((job.lane, job.status), 0) + 1
+    name = f'{METRICS_PREFIX}_jobs'
+    lines = [f'# HELP {name} Conversion jobs currently tracked, by lane and status', f'# TYPE {name} gauge']
+    for lane in JOB_WORKERS:
+        for status in ('queued', 'running', 'done', 'failed'):
+            lines.append(f'{name}{{lane="{lane}",status="{status}"}} {counts.get((lane, status), 0)}')
+    body = get_metrics().prometheus() + '\n'.join(lines) + '\n'
+    return Response(body, mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,128 @@
+"""
+ProblemIndex against recorded Codeforces API responses.
+
+The fetcher is replaced by RecordedApi, which answers API calls from the JSON
+files in tests/fixtures and counts them, so no test touches the network.
+"""
+import json
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import pytest
+
+import codeforces_to_pdf
+from codeforces_to_pdf import METADATA_FORMAT_VERSION, ProblemIndex, get_contest_problems
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+class RecordedApi:
+    """Stand-in for the shared Fetcher: answers API requests from recorded responses, or fails them all."""
+
+    def __init__(self, down: bool = False):
+        self.down = down
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append(url)
+        if self.down:
+            raise httpx.ConnectError("Name or service not known", request=httpx.Request("GET", url))
+        parts = urlsplit(url)
+        method = parts.path.rsplit("/", 1)[-1]
+        if method == "problemset.problems":
+            return self._response(200, "problemset.problems.json", url)
+        if method == "contest.standings" and parse_qs(parts.query)["contestId"] == ["102021"]:
+            return self._response(200, "contest.standings.json", url)
+        if method == "contest.standings":
+            return self._response(400, "contest.standings.not_found.json", url)
+        return httpx.Response(404, request=httpx.Request("GET", url))
+
+    @staticmethod
+    def _response(status: int, fixture: str, url: str) -> httpx.Response:
+        body = (FIXTURES / fixture).read_bytes()
+        return httpx.Response(status, content=body, headers={"content-type": "application/json"},
+                              request=httpx.Request("GET", url))
+
+    def api_calls(self, method: str) -> int:
+        return sum(f"/api/{method}" in url for url in self.calls)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    recorded = RecordedApi()
+    monkeypatch.setattr(codeforces_to_pdf, "get_fetcher", lambda: recorded)
+    return recorded
+
+
+def write_snapshot(path: Path, fetched_at: float):
+    problems = [[1512, "A", "Spy Detected!", 800, ["brute force", "implementation"]],
+                [1512, "B", "Almost Rectangle", 800, ["implementation"]]]
+    (path / "problemset.json").write_text(json.dumps({
+        "format": METADATA_FORMAT_VERSION,
+        "fetched_at": fetched_at,
+        "problems": problems,
+    }), encoding="utf-8")
+
+
+def test_problemset_is_indexed_by_contest(api, tmp_path):
+    index = ProblemIndex(str(tmp_path))
+
+    assert index.contest_problems(1512) == ["A", "B", "C", "D", "E", "F", "G"]
+    assert index.contest_problems("1810") == ["A", "B", "C", "D", "E1", "E2", "G", "H"]
+    spy = index.lookup(1512, "a")
+    assert (spy.name, spy.rating, spy.tags) == ("Spy Detected!", 800, ["brute force", "implementation"])
+    assert index.lookup(1810, "H").rating == 0  # unrated problems have no rating field
+    assert api.api_calls("problemset.problems") == 1
+    assert api.api_calls("contest.standings") == 0
+
+
+def test_snapshot_is_reused_within_ttl(api, tmp_path):
+    ProblemIndex(str(tmp_path)).contest_problems(1512)
+    assert (tmp_path / "problemset.json").exists()
+
+    index = ProblemIndex(str(tmp_path))
+    assert index.lookup(1810, "E2").name == "Monsters (hard version)"
+    assert api.api_calls("problemset.problems") == 1
+
+
+def test_gym_contest_is_looked_up_once(api, tmp_path):
+    index = ProblemIndex(str(tmp_path))
+
+    assert index.contest_problems(102021) == ["A", "B", "C"]
+    assert index.lookup(102021, "C").name == "Caterpillar"
+    assert index.contest_problems(102021) == ["A", "B", "C"]
+    assert api.api_calls("contest.standings") == 1
+    # The gym is saved with the snapshot, so a new process does not ask again
+    assert ProblemIndex(str(tmp_path)).contest_problems(102021) == ["A", "B", "C"]
+    assert api.api_calls("contest.standings") == 1
+
+
+def test_unknown_contest_is_remembered_as_missing(api, tmp_path):
+    index = ProblemIndex(str(tmp_path))
+
+    assert index.contest_problems(999999) == []
+    assert index.lookup(999999, "A") is None
+    assert api.api_calls("contest.standings") == 1
+
+
+def test_stale_snapshot_is_used_when_api_is_down(api, tmp_path):
+    write_snapshot(tmp_path, time.time() - 2 * codeforces_to_pdf.METADATA_TTL)
+    api.down = True
+
+    index = ProblemIndex(str(tmp_path))
+    assert index.contest_problems(1512) == ["A", "B"]
+    assert index.lookup(1512, "B").name == "Almost Rectangle"
+    assert api.api_calls("problemset.problems") == 1
+
+
+def test_contest_problems_fall_back_when_api_is_down(api, tmp_path, monkeypatch):
+    api.down = True
+    index = ProblemIndex(str(tmp_path))
+    monkeypatch.setattr(codeforces_to_pdf, "get_problem_index", lambda: index)
+
+    assert index.contest_problems(1512) == []
+    # Scraping the contest pages fails as well, so the common A-F is guessed
+    assert get_contest_problems(1512) == ["A", "B", "C", "D", "E", "F"]
+    assert get_contest_problems(1512, fallback=False) == []
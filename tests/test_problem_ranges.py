@@ -0,0 +1,56 @@
+"""Command line targets: parse_targets, _letter_range and expand_problems."""
+import pytest
+
+import codeforces_to_pdf
+from codeforces_to_pdf import _letter_range, expand_problems, parse_targets
+
+CONTEST_PROBLEMS = {1810: ["A", "B", "C", "D", "E1", "E2", "F"]}
+
+
+@pytest.fixture
+def contest_problems(monkeypatch):
+    """Problem lists as the API reports them; other contests are unknown."""
+    def lookup(contest_id, fallback=True):
+        return list(CONTEST_PROBLEMS.get(contest_id, ["A", "B", "C", "D", "E", "F"] if fallback else []))
+
+    monkeypatch.setattr(codeforces_to_pdf, "get_contest_problems", lookup)
+
+
+def test_parse_targets_groups_problems_by_contest():
+    assert parse_targets(["4", "A", "1850", "B-D", "c"]) == [(4, "A"), (1850, "B-D,C")]
+    assert parse_targets(["1850"]) == [(1850, None)]
+    assert parse_targets(["https://codeforces.com/contest/1850/problem/b",
+                          "https://codeforces.com/problemset/problem/4/A",
+                          "https://codeforces.com/gym/102021"]) == [(1850, "B"), (4, "A"), (102021, None)]
+
+
+@pytest.mark.parametrize("tokens", [["4A"], ["A"], ["4", "A--C"]])
+def test_parse_targets_rejects_malformed_tokens(tokens):
+    with pytest.raises(ValueError):
+        parse_targets(tokens)
+
+
+def test_letter_range():
+    assert _letter_range("A", "D") == ["A", "B", "C", "D"]
+    assert _letter_range("F1", "F3") == ["F1", "F2", "F3"]
+    for first, last in (("D", "A"), ("E1", "F2"), ("A", "B1")):
+        with pytest.raises(ValueError):
+            _letter_range(first, last)
+
+
+def test_range_covers_subproblems_by_letter_prefix(contest_problems):
+    assert expand_problems(1810, "A-E") == ["A", "B", "C", "D", "E1", "E2"]
+    assert expand_problems(1810, "E-F") == ["E1", "E2", "F"]
+    assert expand_problems(1810, "E1-E2") == ["E1", "E2"]
+    assert expand_problems(1810, "B,E2-F,B") == ["B", "E2", "F"]
+
+
+def test_range_matching_no_problem_is_an_error(contest_problems):
+    with pytest.raises(ValueError):
+        expand_problems(1810, "G-H")
+
+
+def test_letter_fallback_only_without_a_problem_list(contest_problems):
+    assert expand_problems(4, "A-C") == ["A", "B", "C"]
+    assert expand_problems(4, None) == ["A", "B", "C", "D", "E", "F"]
+    assert expand_problems(1810, None) == CONTEST_PROBLEMS[1810]
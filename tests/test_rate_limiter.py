@@ -0,0 +1,105 @@
+"""RateLimiter token bucket, Retry-After backoff and circuit breaker, on a fake clock."""
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+import codeforces_to_pdf
+from codeforces_to_pdf import (BACKOFF_MAX, CIRCUIT_COOLDOWN, CIRCUIT_THRESHOLD, CircuitOpenError, RateLimiter,
+                               _retry_delay)
+
+HOST = "codeforces.com"
+
+
+class FakeClock:
+    """Stands in for the time module inside codeforces_to_pdf: sleeping advances the clock instantly."""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(codeforces_to_pdf, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def limiter(tmp_path, clock):
+    return RateLimiter(str(tmp_path), rate=2.0, burst=3)
+
+
+def throttled_response(retry_after=None):
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    return httpx.Response(429, headers=headers, request=httpx.Request("GET", f"https://{HOST}/"))
+
+
+def test_burst_then_paced(limiter, clock):
+    for _ in range(3):
+        limiter.acquire(HOST)
+    assert clock.slept == []
+    limiter.acquire(HOST)
+    assert clock.slept == [pytest.approx(0.5)]
+
+
+def test_retry_after_holds_back_every_caller(limiter, clock, tmp_path):
+    assert limiter.throttled(HOST, 10.0) is False
+    # A second limiter on the same directory, as in another process, sees the same backoff
+    RateLimiter(str(tmp_path), rate=2.0, burst=3).acquire(HOST)
+    assert sum(clock.slept) == pytest.approx(10.0)
+
+
+def test_circuit_opens_after_repeated_throttling(limiter, clock):
+    for _ in range(CIRCUIT_THRESHOLD - 1):
+        assert limiter.throttled(HOST, 0.0) is False
+    assert limiter.throttled(HOST, 0.0) is True
+    with pytest.raises(CircuitOpenError):
+        limiter.acquire(HOST)
+    clock.advance(CIRCUIT_COOLDOWN + 1)
+    limiter.acquire(HOST)
+
+
+def test_long_retry_after_opens_the_circuit(limiter, clock):
+    assert limiter.throttled(HOST, BACKOFF_MAX + 1) is True
+    with pytest.raises(CircuitOpenError):
+        limiter.acquire(HOST)
+    assert clock.slept == []  # fails fast instead of sleeping
+
+
+def test_success_resets_the_failure_count(limiter, clock):
+    for _ in range(CIRCUIT_THRESHOLD - 1):
+        limiter.throttled(HOST, 0.0)
+    limiter.succeeded(HOST)
+    assert limiter.throttled(HOST, 0.0) is False
+
+
+def test_hosts_are_independent(limiter, clock):
+    limiter.throttled(HOST, BACKOFF_MAX + 1)
+    limiter.acquire("example.com")
+
+
+def test_retry_delay_from_seconds_and_http_date(clock):
+    assert _retry_delay(throttled_response("7"), attempt=0) == 7.0
+    assert _retry_delay(throttled_response("-3"), attempt=0) == 0.0
+    when = datetime.fromtimestamp(clock.now, timezone.utc) + timedelta(seconds=30)
+    assert _retry_delay(throttled_response(format_datetime(when, usegmt=True)), attempt=0) == pytest.approx(30.0)
+
+
+def test_retry_delay_without_header_is_jittered_backoff(clock):
+    for attempt in range(4):
+        delay = _retry_delay(throttled_response(), attempt)
+        assert 0.0 <= delay <= codeforces_to_pdf.BACKOFF_BASE * 2 ** attempt
+    assert 0.0 <= _retry_delay(throttled_response("soon"), attempt=1) <= codeforces_to_pdf.BACKOFF_BASE * 2
@@ -0,0 +1,60 @@
+"""tex_to_html and handle_simple_math_notation: the HTML typesetting used in fast mode and as the LaTeX fallback."""
+import pytest
+
+from codeforces_to_pdf import handle_simple_math_notation, tex_to_html
+
+
+def fraction(numerator: str, denominator: str, kind: str = "fraction") -> str:
+    return (f'<span class="{kind}"><span class="numerator">{numerator}</span>'
+            f'<span class="denominator">{denominator}</span></span>')
+
+
+@pytest.mark.parametrize("tex, html", [
+    ("n", "n"),
+    ("a < b", "a &lt; b"),
+    (r"1 \le n \le 10^5", "1 ≤ n ≤ 10<sup>5</sup>"),
+    (r"a_{i+1}", "a<sub>i+1</sub>"),
+    (r"x^\prime", "x<sup>′</sup>"),
+    (r"\frac12", fraction("1", "2")),
+    (r"\frac{a}{\frac{b}{c}}", fraction("a", fraction("b", "c"))),
+    (r"2^{2^{n}}", "2<sup>2<sup>n</sup></sup>"),
+])
+def test_symbols_scripts_and_nesting(tex, html):
+    assert tex_to_html(tex) == html
+
+
+def test_roots():
+    assert tex_to_html(r"\sqrt{x}") == '<span class="math-sqrt">√<span class="math-radicand">x</span></span>'
+    assert tex_to_html(r"\sqrt[3]{x+1}") == ('<span class="math-sqrt"><sup>3</sup>√'
+                                              '<span class="math-radicand">x+1</span></span>')
+
+
+def test_binomial():
+    assert tex_to_html(r"\binom{n}{k}") == f'({fraction("n", "k", "fraction binom")})'
+    assert tex_to_html(r"\binom nk") == tex_to_html(r"\binom{n}{k}")
+
+
+@pytest.mark.parametrize("tex, html", [
+    (r"a \bmod m", 'a <span class="math-op">mod</span> m'),
+    (r"a \mod m", 'a <span class="math-op">mod</span> m'),
+    (r"a \equiv b \pmod{m}", 'a ≡ b  (<span class="math-op">mod</span> m)'),
+    (r"\max(a, b)", '<span class="math-op">max</span>(a, b)'),
+])
+def test_operators(tex, html):
+    assert tex_to_html(tex) == html
+
+
+def test_unknown_commands_keep_their_arguments():
+    assert tex_to_html(r"\foo{a}{b}") == r"\foo{a}{b}"
+    assert tex_to_html(r"\foo x") == r"\foo x"
+
+
+def test_formulas_in_attributes_are_left_alone():
+    html = '<p title="$$$x$$$">a $$$x_1$$$ <!-- $$$y$$$ --> $$$$$$z$$$$$$</p>'
+    assert handle_simple_math_notation(html) == (
+        '<p title="$$$x$$$">a <span class="math-inline">x<sub>1</sub></span> <!-- $$$y$$$ --> '
+        '<span class="math-display">z</span></p>')
+
+
+def test_entities_are_decoded_before_typesetting():
+    assert handle_simple_math_notation("<p>$$$a &lt; b$$$</p>") == '<p><span class="math-inline">a &lt; b</span></p>'